@@ -0,0 +1,278 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from sqlalchemy import select
+from cache import cache
+from models import db, Counter, Mark, Student
+
+MARKS_VERSION = 'marks_version'  # Counter bumped in every transaction that changes marks
+TEST_TYPES = ('Assignment', 'CAT', 'End Term')
+PERCENTILES = (25, 50, 75, 90)
+ALL_CLASSES = 'All classes'
+FRAMES_KEPT = 4  # Loaded (version, term) column sets kept per process
+
+
+def bump_marks_version():
+    """Invalidate every cached analytics result once the current transaction commits."""
+    Counter.allocate(MARKS_VERSION)
+
+
+def marks_version():
+    return db.session.scalar(select(Counter.value).where(Counter.name == MARKS_VERSION)) or 0
+
+
+class MarksFrame:
+    """The marks of one term (or all time) as parallel NumPy columns.
+
+    Strings are stored once in ``classes``/``subjects``/``test_types`` and the
+    columns hold their integer codes, so grouping is integer arithmetic.
+    """
+
+    def __init__(self, student_ids, class_codes, subject_codes, test_codes, scores, classes, subjects, test_types):
+        self.student_ids = student_ids
+        self.class_codes = class_codes
+        self.subject_codes = subject_codes
+        self.test_codes = test_codes
+        self.scores = scores
+        self.classes = classes
+        self.subjects = subjects
+        self.test_types = test_types
+
+    @classmethod
+    def load(cls, term=None):
+        students = db.session.execute(select(Student.id, Student.class_name)).all()
+        classes = sorted({class_name for _, class_name in students})
+        class_index = {name: i for i, name in enumerate(classes)}
+        class_of = np.full(max((id_ for id_, _ in students), default=0) + 1, -1, dtype=np.int32)
+        for id_, class_name in students:
+            class_of[id_] = class_index[class_name]
+
+        stmt = select(Mark.student_id, Mark.subject, Mark.test_type, Mark.score)
+        if term:
+            stmt = stmt.where(Mark.term == term)
+        rows = db.session.connection().execute(stmt).fetchall()  # Plain rows; no ORM overhead per mark
+        if not rows:
+            empty = np.empty(0, dtype=np.int32)
+            return cls(empty, empty, empty, empty, np.empty(0), classes, [], list(TEST_TYPES))
+        student_ids, subjects, test_types, scores = zip(*rows)
+        del rows
+
+        student_ids = np.array(student_ids, dtype=np.int32)
+        subject_codes, subject_names = _encode(subjects)
+        test_codes, test_names = _encode(test_types, TEST_TYPES)
+        keep = student_ids < len(class_of)  # Marks of students deleted since are dropped
+        class_codes = np.where(keep, class_of[np.minimum(student_ids, len(class_of) - 1)], -1)
+        keep &= class_codes >= 0
+        return cls(student_ids[keep], class_codes[keep], subject_codes[keep], test_codes[keep],
+                   np.array(scores, dtype=np.float64)[keep], classes, subject_names, test_names)
+
+    def __len__(self):
+        return len(self.scores)
+
+    def select(self, class_name=None):
+        """Row mask for one class, or every row."""
+        if class_name is None:
+            return np.ones(len(self), dtype=bool)
+        if class_name not in self.classes:
+            return np.zeros(len(self), dtype=bool)
+        return self.class_codes == self.classes.index(class_name)
+
+
+def _encode(values, known=()):
+    """Integer codes for a column of strings, with ``known`` values first in their given order."""
+    codes = {value: i for i, value in enumerate(known)}
+    column = np.fromiter((codes.setdefault(value, len(codes)) for value in values), dtype=np.int16, count=len(values))
+    names = sorted(codes, key=codes.get)
+    if not known:
+        # Alphabetical codes, so groups come out sorted by name
+        order = np.argsort(names)
+        column = np.argsort(order).astype(np.int16)[column]
+        names = [names[i] for i in order]
+    return column, names
+
+
+def _groups(keys):
+    """Start offsets and sizes of each run of equal ``keys`` (which must be sorted)."""
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.empty(0, dtype=np.int64)
+    return starts, np.diff(np.r_[starts, len(keys)])
+
+
+def group_statistics(keys, values):
+    """Count, mean, standard deviation, min, max and percentiles of ``values`` per distinct key.
+
+    Everything is computed with one sort and a few reductions over the sorted
+    array, never a Python loop over rows.
+    """
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    starts, counts = _groups(keys)
+    means = np.add.reduceat(values, starts) / counts if len(values) else np.empty(0)
+    deviations = values - np.repeat(means, counts)
+    stats = {
+        'key': keys[starts],
+        'count': counts,
+        'mean': means,
+        'std': np.sqrt(np.add.reduceat(deviations * deviations, starts) / counts) if len(values) else np.empty(0),
+        'min': values[starts],
+        'max': values[starts + counts - 1],
+    }
+    for q in PERCENTILES:
+        # Linear interpolation between the two nearest ranks, as numpy.percentile does
+        position = starts + (counts - 1) * (q / 100)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        stats[f'p{q}'] = values[lower] + (values[upper] - values[lower]) * (position - lower)
+    return stats
+
+
+def competition_ranks(groups, values):
+    """Rank ``values`` highest first within each group; ties share the better rank (1, 2, 2, 4)."""
+    order = np.lexsort((-values, groups))
+    sorted_groups, sorted_values = groups[order], values[order]
+    starts, counts = _groups(sorted_groups)
+    position = np.arange(len(order)) - np.repeat(starts, counts)
+    new_rank = np.r_[True, (sorted_groups[1:] != sorted_groups[:-1]) | (sorted_values[1:] != sorted_values[:-1])]
+    first_of_tie = np.maximum.accumulate(np.where(new_rank, np.arange(len(order)), 0))
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = position[first_of_tie] + 1
+    sizes = np.empty(len(order), dtype=np.int64)
+    sizes[order] = np.repeat(counts, counts)
+    return ranks, sizes
+
+
+def _student_means(frame, mask):
+    """Mean score per (class, subject, test type, student) for the masked rows."""
+    n_students = int(frame.student_ids.max()) + 1 if len(frame) else 1
+    group = ((frame.class_codes[mask].astype(np.int64) * len(frame.subjects) + frame.subject_codes[mask])
+             * len(frame.test_types) + frame.test_codes[mask])
+    keys = group * n_students + frame.student_ids[mask]
+    unique, inverse = np.unique(keys, return_inverse=True)
+    means = np.bincount(inverse, weights=frame.scores[mask]) / np.bincount(inverse)
+    return unique // n_students, unique % n_students, means
+
+
+def _split_group(frame, group):
+    test = group % len(frame.test_types)
+    subject = (group // len(frame.test_types)) % len(frame.subjects)
+    class_code = group // (len(frame.test_types) * len(frame.subjects))
+    return class_code, subject, test
+
+
+class MarksAnalytics:
+    """Grouped statistics and rankings over a MarksFrame."""
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    def statistics(self, class_name=None):
+        """Score distribution per class (or the whole school), subject and test type."""
+        frame = self.frame
+        mask = frame.select(class_name)
+        class_codes = frame.class_codes[mask].astype(np.int64) if class_name else np.zeros(mask.sum(), dtype=np.int64)
+        keys = (class_codes * len(frame.subjects) + frame.subject_codes[mask]) * len(frame.test_types) + frame.test_codes[mask]
+        stats = group_statistics(keys, frame.scores[mask])
+        _, subjects, tests = _split_group(frame, stats['key'])
+        return [
+            {'class_name': class_name or ALL_CLASSES, 'subject': frame.subjects[subjects[i]],
+             'test_type': frame.test_types[tests[i]], 'count': int(stats['count'][i]),
+             'mean': float(stats['mean'][i]), 'median': float(stats['p50'][i]), 'std': float(stats['std'][i]),
+             'p25': float(stats['p25'][i]), 'p75': float(stats['p75'][i]), 'p90': float(stats['p90'][i]),
+             'min': float(stats['min'][i]), 'max': float(stats['max'][i])}
+            for i in range(len(stats['key']))
+        ]
+
+    def ranks(self, class_name, subject, test_type):
+        """Students of ``class_name`` ranked by their mean score in ``subject`` and ``test_type``."""
+        frame = self.frame
+        if subject not in frame.subjects or test_type not in frame.test_types:
+            return []
+        mask = (frame.select(class_name) & (frame.subject_codes == frame.subjects.index(subject))
+                & (frame.test_codes == frame.test_types.index(test_type)))
+        groups, student_ids, means = _student_means(frame, mask)
+        if class_name is None:
+            groups = np.zeros(len(groups), dtype=np.int64)  # One school-wide ranking
+        ranks, sizes = competition_ranks(groups, means)
+        order = np.lexsort((student_ids, ranks))
+        return [
+            {'student_id': int(student_ids[i]), 'mean': float(means[i]), 'rank': int(ranks[i]),
+             'percentile': float(100 * (sizes[i] - ranks[i]) / sizes[i])}
+            for i in order
+        ]
+
+    def spread(self, class_name=None):
+        """CAT versus End Term per subject: each student's End Term mean minus their CAT mean."""
+        frame = self.frame
+        if 'CAT' not in frame.test_types or 'End Term' not in frame.test_types:
+            return []
+        cat, end_term = frame.test_types.index('CAT'), frame.test_types.index('End Term')
+        mask = frame.select(class_name) & np.isin(frame.test_codes, (cat, end_term))
+        groups, student_ids, means = _student_means(frame, mask)
+        _, subjects, tests = _split_group(frame, groups)
+
+        # Pair each student's CAT and End Term means in the same subject
+        pair_keys = subjects * (int(student_ids.max(initial=0)) + 1) + student_ids
+        is_cat = tests == cat
+        cat_values, end_values = means[is_cat], means[~is_cat]
+        _, cat_at, end_at = np.intersect1d(pair_keys[is_cat], pair_keys[~is_cat], assume_unique=True, return_indices=True)
+        differences = end_values[end_at] - cat_values[cat_at]
+
+        cat_stats = group_statistics(subjects[is_cat], cat_values)
+        end_stats = group_statistics(subjects[~is_cat], end_values)
+        diff_stats = group_statistics(subjects[~is_cat][end_at], differences)
+        by_subject = {}
+        for stats, prefix in ((cat_stats, 'cat'), (end_stats, 'end_term')):
+            for i, code in enumerate(stats['key']):
+                by_subject.setdefault(int(code), {})[f'{prefix}_mean'] = float(stats['mean'][i])
+        for i, code in enumerate(diff_stats['key']):
+            by_subject.setdefault(int(code), {}).update(
+                spread_mean=float(diff_stats['mean'][i]), spread_std=float(diff_stats['std'][i]),
+                paired_students=int(diff_stats['count'][i]))
+        return [
+            {'class_name': class_name or ALL_CLASSES, 'subject': frame.subjects[code], 'cat_mean': None,
+             'end_term_mean': None, 'spread_mean': None, 'spread_std': None, 'paired_students': 0, **values}
+            for code, values in sorted(by_subject.items())
+        ]
+
+
+# Per-process cache of loaded frames; the small results go through the shared cache
+
+_frames = OrderedDict()
+_frames_lock = threading.Lock()
+
+
+def _frame(version, term):
+    key = (version, term)
+    with _frames_lock:
+        if key in _frames:
+            _frames.move_to_end(key)
+            return _frames[key]
+    frame = MarksFrame.load(term)
+    with _frames_lock:
+        _frames[key] = frame
+        while len(_frames) > FRAMES_KEPT:
+            _frames.popitem(last=False)
+    return frame
+
+
+def marks_analytics(term=None, class_name=None, subject=None, test_type=None):
+    """Statistics, CAT/End Term spread and (given a subject and test type) rankings.
+
+    Results are cached under the current marks version, so they are recomputed
+    only after marks change, and every worker sees the change immediately.
+    """
+    version = marks_version()
+    key = f'{version}:{term}:{class_name}:{subject}:{test_type}'
+
+    def load():
+        analytics = MarksAnalytics(_frame(version, term))
+        result = {
+            'version': version,
+            'term': term,
+            'class_name': class_name,
+            'statistics': analytics.statistics(class_name),
+            'spread': analytics.spread(class_name),
+        }
+        if subject and test_type:
+            result['ranks'] = analytics.ranks(class_name, subject, test_type)
+        return result
+    return cache.get_or_load('analytics', key, load)
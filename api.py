@@ -0,0 +1,301 @@
+import gzip
+import json
+from collections import namedtuple
+from datetime import date, datetime
+from functools import wraps
+from urllib.parse import parse_qs, urlsplit
+from flask import Blueprint, current_app, request
+from flask_login import current_user, login_user, logout_user
+from sqlalchemy import select
+from database import read_only, use_read_only_engine
+from models import db, Student, Parent, Mark, Fee, Payment, Attendance, Assignment, Remark
+from pagination import decode_cursor, encode_cursor
+from passwords import PasswordPoolBusy, authenticate
+
+try:
+    import orjson
+except ImportError:  # Falls back to the standard library encoder
+    orjson = None
+
+api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+DEFAULT_LIMIT = 100
+
+STAFF = ('Admin', 'Teacher', 'Finance')
+
+# ``fields`` maps each public field to its column; ``default`` is what a request
+# without ``fields=`` gets; ``filters`` are the query arguments each list accepts.
+# Parents may read every resource but only for their own children.
+Resource = namedtuple('Resource', 'model fields default filters roles')
+
+RESOURCES = {
+    'students': Resource(
+        Student,
+        {'id': Student.id, 'admission_number': Student.admission_number, 'name': Student.name,
+         'class_name': Student.class_name, 'parent_id': Student.parent_id, 'created_at': Student.created_at},
+        ('id', 'admission_number', 'name', 'class_name'),
+        {'class_name': Student.class_name, 'parent_id': Student.parent_id},
+        STAFF,
+    ),
+    'marks': Resource(
+        Mark,
+        {'id': Mark.id, 'student_id': Mark.student_id, 'teacher_id': Mark.teacher_id, 'subject': Mark.subject,
+         'test_type': Mark.test_type, 'term': Mark.term, 'score': Mark.score, 'created_at': Mark.created_at},
+        ('id', 'student_id', 'subject', 'test_type', 'term', 'score'),
+        {'student_id': Mark.student_id, 'subject': Mark.subject, 'test_type': Mark.test_type, 'term': Mark.term},
+        ('Admin', 'Teacher'),
+    ),
+    'fees': Resource(
+        Fee,
+        {'id': Fee.id, 'student_id': Fee.student_id, 'amount_due': Fee.amount_due, 'amount_paid': Fee.amount_paid,
+         'due_date': Fee.due_date, 'status': Fee.status, 'version': Fee.version},
+        ('id', 'student_id', 'amount_due', 'amount_paid', 'due_date', 'status'),
+        {'student_id': Fee.student_id, 'status': Fee.status},
+        ('Admin', 'Finance'),
+    ),
+    'payments': Resource(
+        Payment,
+        {'id': Payment.id, 'fee_id': Payment.fee_id, 'student_id': Payment.student_id, 'amount': Payment.amount,
+         'method': Payment.method, 'reference': Payment.reference, 'created_at': Payment.created_at},
+        ('id', 'fee_id', 'student_id', 'amount', 'method', 'created_at'),
+        {'fee_id': Payment.fee_id, 'student_id': Payment.student_id},
+        ('Admin', 'Finance'),
+    ),
+    'attendance': Resource(
+        Attendance,
+        {'id': Attendance.id, 'student_id': Attendance.student_id, 'date': Attendance.date,
+         'status': Attendance.status},
+        ('id', 'student_id', 'date', 'status'),
+        {'student_id': Attendance.student_id, 'date': Attendance.date, 'status': Attendance.status},
+        ('Admin', 'Teacher'),
+    ),
+    'assignments': Resource(
+        Assignment,
+        {'id': Assignment.id, 'title': Assignment.title, 'description': Assignment.description,
+         'due_date': Assignment.due_date, 'teacher_id': Assignment.teacher_id, 'student_id': Assignment.student_id},
+        ('id', 'title', 'due_date', 'student_id'),
+        {'student_id': Assignment.student_id, 'teacher_id': Assignment.teacher_id},
+        ('Admin', 'Teacher'),
+    ),
+    'remarks': Resource(
+        Remark,
+        {'id': Remark.id, 'student_id': Remark.student_id, 'teacher_id': Remark.teacher_id, 'text': Remark.text,
+         'created_at': Remark.created_at},
+        ('id', 'student_id', 'text', 'created_at'),
+        {'student_id': Remark.student_id},
+        ('Admin', 'Teacher'),
+    ),
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+# Serialization
+
+def _default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(data):
+    """Compact JSON bytes; orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), default=_default).encode()
+
+
+def json_response(data, status=200, headers=None):
+    body = dumps(data)
+    response = current_app.response_class(body, status=status, mimetype='application/json')
+    response.headers.update(headers or {})
+    response.vary.add('Accept-Encoding')
+    if len(body) >= current_app.config['API_GZIP_MIN_BYTES'] and 'gzip' in request.accept_encodings:
+        response.set_data(gzip.compress(body, compresslevel=current_app.config['API_GZIP_LEVEL']))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+@api.errorhandler(ApiError)
+def api_error(e):
+    return json_response({'error': e.message}, e.status, e.headers)
+
+
+def api_login_required(view):
+    """Like login_required, but answers 401 JSON instead of redirecting to the login page."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_user.is_authenticated:
+            raise ApiError(401, 'Sign in first: POST /api/v1/login.')
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# Queries
+
+def _resource(name):
+    resource = RESOURCES.get(name)
+    if resource is None:
+        raise ApiError(404, f'Unknown resource "{name}".')
+    if current_user.role != 'Parent' and current_user.role not in resource.roles:
+        raise ApiError(403, 'Unauthorized access.')
+    return resource
+
+
+def _scoped(resource, stmt):
+    """Restrict a parent to their own children's rows."""
+    if current_user.role != 'Parent':
+        return stmt
+    children = select(Student.id).join(Parent, Student.parent_id == Parent.id).where(Parent.user_id == current_user.id)
+    column = resource.model.id if resource.model is Student else resource.model.student_id
+    return stmt.where(column.in_(children))
+
+
+def _fields(resource, args):
+    requested = args.get('fields')
+    if not requested:
+        return list(resource.default)
+    names = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in names if name not in resource.fields]
+    if unknown:
+        raise ApiError(400, f'Unknown field(s): {", ".join(unknown)}. Available: {", ".join(resource.fields)}.')
+    return ['id'] + [name for name in names if name != 'id']  # The id is always returned; cursors use it
+
+
+def _filter_value(column, value):
+    python_type = column.type.python_type
+    try:
+        if python_type is date:
+            return date.fromisoformat(value)
+        return python_type(value)
+    except ValueError:
+        raise ApiError(400, f'Invalid value for {column.key}: "{value}".')
+
+
+def _shape(names, rows, args):
+    # compact=1 sends the field names once instead of in every object
+    if args.get('compact') in ('1', 'true'):
+        return {'fields': names, 'rows': [list(row) for row in rows]}
+    return {'data': [dict(zip(names, row)) for row in rows]}
+
+
+def list_resource(name, args):
+    """One page of a resource as a JSON-ready dict, ordered by id."""
+    resource = _resource(name)
+    names = _fields(resource, args)
+    try:
+        limit = max(1, min(int(args.get('limit', DEFAULT_LIMIT)), current_app.config['API_MAX_PAGE']))
+    except ValueError:
+        raise ApiError(400, 'limit must be a number.')
+
+    stmt = select(*[resource.fields[field] for field in names])
+    for arg, column in resource.filters.items():
+        if args.get(arg):
+            stmt = stmt.where(column == _filter_value(column, args[arg]))
+    if args.get('cursor'):
+        after = decode_cursor(args['cursor'], [resource.model.id])
+        if after is None:
+            raise ApiError(400, 'Invalid cursor.')
+        stmt = stmt.where(resource.model.id > after[0])
+    stmt = _scoped(resource, stmt).order_by(resource.model.id).limit(limit + 1)
+
+    rows = db.session.execute(stmt).all()
+    result = _shape(names, rows[:limit], args)
+    result['next_cursor'] = encode_cursor([rows[limit - 1][0]]) if len(rows) > limit else None
+    return result
+
+
+def get_resource(name, item_id, args):
+    resource = _resource(name)
+    names = _fields(resource, args)
+    stmt = _scoped(resource, select(*[resource.fields[field] for field in names]).where(resource.model.id == item_id))
+    row = db.session.execute(stmt).first()
+    if row is None:
+        raise ApiError(404, f'No {name} with id {item_id}.')
+    return {'data': dict(zip(names, row))}
+
+
+def _dispatch(path):
+    """Answer one batch sub-request, given as a path relative to /api/v1."""
+    parts = urlsplit(path)
+    args = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+    segments = [segment for segment in parts.path.split('/') if segment]
+    if segments[:2] == ['api', 'v1']:
+        segments = segments[2:]
+    if len(segments) == 1:
+        return list_resource(segments[0], args)
+    if len(segments) == 2 and segments[1].isdigit():
+        return get_resource(segments[0], int(segments[1]), args)
+    raise ApiError(404, f'No such endpoint: {path}')
+
+
+# Views
+
+@api.route('/login', methods=['POST'])
+def login():
+    data = request.get_json(silent=True) or {}
+    try:
+        user = authenticate(data.get('username', ''), data.get('password', ''))
+    except PasswordPoolBusy:
+        raise ApiError(503, 'Too many sign-ins right now; try again shortly.',
+                       {'Retry-After': str(max(1, int(current_app.config['PASSWORD_POOL_TIMEOUT'])))})
+    if user is None:
+        raise ApiError(401, 'Invalid username or password.')
+    login_user(user, remember=bool(data.get('remember')))
+    return json_response({'data': {'id': user.id, 'username': user.username, 'role': user.role}})
+
+
+@api.route('/logout', methods=['POST'])
+@api_login_required
+def logout():
+    logout_user()
+    return json_response({'data': None})
+
+
+@api.route('/<resource>')
+@api_login_required
+@read_only
+def list_view(resource):
+    return json_response(list_resource(resource, request.args))
+
+
+@api.route('/<resource>/<int:item_id>')
+@api_login_required
+@read_only
+def get_view(resource, item_id):
+    return json_response(get_resource(resource, item_id, request.args))
+
+
+@api.route('/batch', methods=['POST'])
+@api_login_required
+def batch():
+    """Several GETs in one round trip.
+
+    Body: ``{"requests": [{"id": "a", "path": "/students?class_name=Grade 1A&fields=name"}, ...]}``.
+    Each answer carries the sub-request's id, its status and its body; one
+    failing sub-request does not fail the others.
+    """
+    data = request.get_json(silent=True) or {}
+    requests = data.get('requests')
+    if not isinstance(requests, list) or not requests:
+        raise ApiError(400, 'Send {"requests": [{"id": ..., "path": ...}, ...]}.')
+    if len(requests) > current_app.config['API_BATCH_MAX']:
+        raise ApiError(400, f'At most {current_app.config["API_BATCH_MAX"]} requests per batch.')
+
+    use_read_only_engine()  # Every sub-request is a read
+    responses = []
+    for sub in requests:
+        sub = sub if isinstance(sub, dict) else {}
+        try:
+            if not isinstance(sub.get('path'), str):
+                raise ApiError(400, 'Each request needs a "path".')
+            responses.append({'id': sub.get('id'), 'status': 200, 'body': _dispatch(sub['path'])})
+        except ApiError as e:
+            responses.append({'id': sub.get('id'), 'status': e.status, 'body': {'error': e.message}})
+    return json_response({'responses': responses})
@@ -1,29 +1,72 @@
 # Existing imports
+import json
 from datetime import datetime
-from flask import Flask, render_template, redirect, url_for, flash, request, session
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import Flask, render_template, redirect, url_for, flash, request, session, Response, send_file, stream_with_context, make_response, jsonify, abort, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_migrate import Migrate
+from sqlalchemy.orm import contains_eager, joinedload
+from sqlalchemy.orm.exc import StaleDataError
 from forms import LoginForm, CreateStudentForm, CreateTeacherForm, CreateParentForm, CreateFinanceForm
-from models import db, User, Student, Teacher, Parent, Finance, Assignment, Remark, Attendance, Fee, Mark, PasswordResetRequest
+from models import db, User, Student, Teacher, Parent, Finance, Assignment, Remark, Attendance, Fee, Mark, PasswordResetRequest, Counter, FeeSweep, ReportJob, Job, Payment, StudentBalance
+from performance import rebuild_performance, student_ranking
+from marks import MarkEntryError, class_grid, parse_score, read_grid, save_marks
+from query_plans import check_query_plans
+from pagination import keyset_paginate, per_page_arg, url_with
+from attendance import (ATTENDANCE_STATUSES, CHRONIC_ABSENCE, class_rates, class_register, class_week_heatmap,
+                        rebuild_attendance_rollups, save_attendance, student_months, student_rates)
+from importer import StudentImportError, import_students
+from exports import EXPORTS, ExportError, iter_csv, term_range, write_xlsx
+from fees import (PAYMENT_METHODS, FeeConflict, add_fee, balances, change_fee, rebuild_balances, record_payment,
+                  sweep_fee_statuses)
+from family import FamilyRecords
+from cache import cache, cached_class_names, cached_subject_names, cached_user, students_version
+from search import include_name, search_students
+from passwords import PasswordPoolBusy, authenticate, hasher
+from config import Config
+import database
+from database import read_only
+from instrumentation import instrumentation
+from profiling import profiler
+from fragments import template_caching
+from assets import assets, build_assets
+from compression import compressor
+from jobs import TASKS, Worker, enqueue, manual_tasks, queue_summary, retry_job, start_with_first_request
+from analytics import marks_analytics, marks_version
+from api import api
+from reports import (TEST_TYPES, ReportError, create_report_job, current_term, job_archives, job_directory,
+                     report_dir, run_report_job)
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///school_system.db'  # Update if necessary
-app.config['SECRET_KEY'] = 'your_secret_key_here'
+app.config.from_object(Config)  # Environment driven; see config.py
 
 # Initialize extensions
-db.init_app(app)
-migrate = Migrate(app, db)
+database.init_app(app, db)  # Engine profile for the configured database, plus the read-only engine
+migrate = Migrate(app, db, include_name=include_name)  # Leave the hand-written text search index alone
+cache.init_app(app)
+hasher.init_app(app)
+instrumentation.init_app(app, db)
+profiler.init_app(app)
+template_caching.init_app(app)
+assets.init_app(app)  # Fingerprinted static URLs once `flask build-assets` has run
+compressor.init_app(app)
+app.register_blueprint(api)  # JSON API for mobile clients under /api/v1
 
 # Setup Flask-Login
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+app.add_template_global(url_with)
+
+# Job threads in each web process, so queued report cards run even without `flask jobs-worker`
+start_with_first_request(app)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return cached_user(int(user_id))  # Served from the cache; invalidated when users change
 
 # Routes
 @app.route('/')
@@ -34,23 +77,24 @@ def home():
 def login():
     form = LoginForm()
     if form.validate_on_submit():
-        # Check for Admin credentials
-        if form.username.data == "Admin" and form.password.data == "Admin@123":
-            admin_user = User.query.filter_by(username="Admin").first()
-            if not admin_user:
-                # Create Admin user if it does not exist. Admin username and password are already set.
-                admin_user = User(username="Admin", password=generate_password_hash("Admin@123"), role='Admin')
-                db.session.add(admin_user)
+        try:
+            # Create the Admin user on first sign-in. Admin username and password are already set.
+            if (form.username.data == "Admin" and form.password.data == "Admin@123"
+                    and not User.query.filter_by(username="Admin").first()):
+                db.session.add(User(username="Admin", password=hasher.hash("Admin@123"), role='Admin'))
                 db.session.commit()
-            
-            login_user(admin_user)
-            flash('Admin login successful!', 'success')
-            return redirect(url_for('admin_dashboard'))
-
-        # Normal user login
-        user = User.query.filter_by(username=form.username.data).first()
-        if user and check_password_hash(user.password, form.password.data):
+
+            # Every login, Admin included, is verified on the password pool
+            user = authenticate(form.username.data, form.password.data)
+        except PasswordPoolBusy:
+            flash('Too many people are signing in right now. Please try again in a few seconds.', 'warning')
+            return busy_response(render_template('login.html', form=form))
+
+        if user:
             login_user(user)
+            if user.role == 'Admin':
+                flash('Admin login successful!', 'success')
+                return redirect(url_for('admin_dashboard'))
             flash('Login successful!', 'success')
             return redirect(url_for('dashboard'))  # Redirect to user dashboard
 
@@ -58,6 +102,16 @@ def login():
     
     return render_template('login.html', form=form)
 
+# Password pool saturated: ask the client to come back shortly instead of queueing
+def busy_response(body):
+    response = make_response(body, 503)
+    response.headers['Retry-After'] = str(max(1, int(app.config['PASSWORD_POOL_TIMEOUT'])))
+    return response
+
+@app.errorhandler(PasswordPoolBusy)
+def password_pool_busy(e):
+    return busy_response('The server is busy. Please try again in a few seconds.')
+
 @app.route('/logout')
 @login_required
 def logout():
@@ -82,13 +136,19 @@ def dashboard():
 # Admin Routes
 @app.route('/admin/dashboard')
 @login_required
+@read_only
 def admin_dashboard():
     if current_user.role != 'Admin':
         flash("Unauthorized access.", 'danger')
         return redirect(url_for('dashboard'))
 
-    users = User.query.all()  # Fetch all users to display
-    reset_requests = PasswordResetRequest.query.all()  # Fetch password reset requests
+    per_page = per_page_arg()
+    # Users by username and reset requests newest first, one page of each
+    users = keyset_paginate(User.query, (User.username,), request.args.get('users_after'), per_page)
+    reset_requests = keyset_paginate(
+        PasswordResetRequest.query.options(joinedload(PasswordResetRequest.user)),
+        (PasswordResetRequest.id,), request.args.get('requests_after'), per_page, descending=True
+    )
     return render_template('admin_dashboard.html', users=users, reset_requests=reset_requests)
 
 @app.route('/create_student', methods=['GET', 'POST'])
@@ -113,6 +173,30 @@ def create_student():
 
     return render_template('create_student.html', form=form)
 
+# Bulk student import from a CSV or XLSX file
+@app.route('/import_students', methods=['GET', 'POST'])
+@login_required
+def import_students_view():
+    if current_user.role != 'Admin':
+        flash("Unauthorized access.", 'danger')
+        return redirect(url_for('dashboard'))
+
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a file to import.', 'danger')
+            return redirect(url_for('import_students_view'))
+        try:
+            result = import_students(upload)
+        except StudentImportError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('import_students_view'))
+        flash(f'Imported {result.imported} students; {result.failed} rows had errors.',
+              'success' if not result.failed else 'warning')
+
+    return render_template('import_students.html', result=result)
+
 @app.route('/create_teacher', methods=['GET', 'POST'])
 @login_required
 def create_teacher():
@@ -121,7 +205,7 @@ def create_teacher():
         return redirect(url_for('dashboard'))
     form = CreateTeacherForm()
     if form.validate_on_submit():
-        user = User(username=form.username.data, password=generate_password_hash(form.password.data), role='Teacher')
+        user = User(username=form.username.data, password=hasher.hash(form.password.data), role='Teacher')
         db.session.add(user)
         db.session.commit()
         teacher = Teacher(user_id=user.id, subject=form.subject.data)
@@ -139,13 +223,13 @@ def create_parent():
         return redirect(url_for('dashboard'))
 
     form = CreateParentForm()
-    form.child_id.choices = [(s.id, s.name) for s in Student.query.all()]  # Assuming this is for selecting a child
+    child = Student.query.get(form.child_id.data) if form.child_id.data else None
 
-    if form.validate_on_submit():
+    if form.validate_on_submit() and child:
         # Create the new User first
         user = User(
             username=form.username.data,
-            password=generate_password_hash(form.password.data),
+            password=hasher.hash(form.password.data),
             role='Parent'
         )
         db.session.add(user)
@@ -158,16 +242,16 @@ def create_parent():
         db.session.add(parent)
 
         # Associate the selected child with the parent
-        child = Student.query.get(form.child_id.data)
-        if child:
-            child.parent = parent  # Set the relationship
-            db.session.add(child)  # Optional: You can add the child if needed
+        child.parent = parent  # Set the relationship
+        db.session.add(child)  # Optional: You can add the child if needed
 
         db.session.commit()  # Commit all changes
         flash('Parent created successfully!', 'success')
         return redirect(url_for('admin_dashboard'))
 
-    return render_template('create_parent.html', form=form)
+    if form.is_submitted() and form.child_id.data and not child:
+        form.child_id.errors.append('That student no longer exists.')
+    return render_template('create_parent.html', form=form, child=child)
 
 
 @app.route('/create_finance', methods=['GET', 'POST'])
@@ -178,7 +262,7 @@ def create_finance():
         return redirect(url_for('dashboard'))
     form = CreateFinanceForm()
     if form.validate_on_submit():
-        user = User(username=form.username.data, password=generate_password_hash(form.password.data), role='Finance')
+        user = User(username=form.username.data, password=hasher.hash(form.password.data), role='Finance')
         db.session.add(user)
         db.session.commit()
         finance = Finance(user_id=user.id)
@@ -192,6 +276,7 @@ def create_finance():
 # Teacher Dashboard Route
 @app.route('/teacher/dashboard')
 @login_required
+@read_only
 def teacher_dashboard():
     if current_user.role != 'Teacher':
         flash("Unauthorized access.", 'danger')
@@ -200,27 +285,12 @@ def teacher_dashboard():
     # Fetch assignments for the logged-in teacher
     assignments = Assignment.query.filter_by(teacher_id=current_user.id).all()
 
-    # Fetch all students and their associated marks
-    students = Student.query.all()
-    student_performance = []
-
-    for student in students:
-        # Calculate average score for each student
-        marks = Mark.query.filter_by(student_id=student.id).all()
-        if marks:
-            average_score = sum(mark.score for mark in marks) / len(marks)
-        else:
-            average_score = 0
-
-        student_performance.append({
-            'student': student,
-            'average_score': average_score
-        })
-
-    # Sort students by average score in descending order (highest first)
-    student_performance.sort(key=lambda x: x['average_score'], reverse=True)
-
-    return render_template('teacher_dashboard.html', assignments=assignments, student_performance=student_performance)
+    # Students ranked by average score (highest first), read from the maintained aggregates.
+    # The table is a cached fragment keyed by the marks and student versions, so the
+    # ranking is only queried and rendered after one of them changes. Both are Counter
+    # rows, so a change committed by any worker shows on the next request.
+    return render_template('teacher_dashboard.html', assignments=assignments, student_ranking=student_ranking,
+                           marks_version=marks_version(), students_version=students_version())
 
 
 
@@ -260,9 +330,8 @@ def create_assignment():
             flash(f'An error occurred: {e}', 'danger')
             return redirect(url_for('create_assignment'))
 
-    # Fetching the list of students to display in the form
-    students = Student.query.all()
-    return render_template('create_assignment.html', students=students)
+    # Students are looked up incrementally via /api/students/search
+    return render_template('create_assignment.html')
 
 # Create fee
 @app.route('/create_fee', methods=['POST'])
@@ -272,12 +341,12 @@ def create_fee():
         flash("Unauthorized access.", 'danger')
         return redirect(url_for('dashboard'))
 
-    # Retrieve form data
+    # Retrieve form data; the status follows from the amounts and the due date
     student_id = request.form.get('student_id', type=int)
     amount_due = request.form.get('amount_due', type=float)
-    amount_paid = request.form.get('amount_paid', type=float)
+    amount_paid = request.form.get('amount_paid', type=float) or 0.0
+    method = request.form.get('method', 'Cash')
     due_date_str = request.form.get('due_date')
-    status = request.form.get('status')
 
     # Convert due_date_str to a date object
     try:
@@ -286,17 +355,8 @@ def create_fee():
         flash("Invalid date format. Please use YYYY-MM-DD.", 'danger')
         return redirect(url_for('finance_dashboard'))
 
-    # Create a new Fee instance
-    new_fee = Fee(
-        student_id=student_id,
-        amount_due=amount_due,
-        amount_paid=amount_paid,
-        due_date=due_date,
-        status=status
-    )
-
     try:
-        db.session.add(new_fee)
+        add_fee(student_id, amount_due, due_date, paid=amount_paid, method=method, user_id=current_user.id)
         db.session.commit()
         flash('New fee record created successfully!', 'success')
     except Exception as e:
@@ -329,8 +389,7 @@ def add_remark():
         flash('Remark added successfully!', 'success')
         return redirect(url_for('teacher_dashboard'))
 
-    students = Student.query.all()  # Load students for the form
-    return render_template('add_remark.html', students=students)
+    return render_template('add_remark.html')
 
 
 # Mark Attendance Endpoint
@@ -342,55 +401,96 @@ def mark_attendance():
         return redirect(url_for('dashboard'))
 
     if request.method == 'POST':
-        student_id = request.form.get('student_id')  # Get student ID from the form
+        student_id = request.form.get('student_id', type=int)  # Get student ID from the form
         status = request.form.get('status')  # Get attendance status (Present/Absent)
 
-        new_attendance = Attendance(student_id=student_id, status=status)
-        db.session.add(new_attendance)
+        if status not in ATTENDANCE_STATUSES:
+            flash('Please choose Present or Absent.', 'danger')
+            return redirect(url_for('mark_attendance'))
+        if student_id is None or db.session.get(Student, student_id) is None:
+            flash('Please choose a student.', 'danger')
+            return redirect(url_for('mark_attendance'))
+
+        save_attendance(datetime.utcnow().date(), {student_id: status})  # Replaces any earlier mark for today
         db.session.commit()
         flash('Attendance marked successfully!', 'success')
         return redirect(url_for('teacher_dashboard'))
 
-    students = Student.query.all()  # Load students for the form
-    return render_template('mark_attendance.html', students=students)
+    return render_template('mark_attendance.html')
+
+# Whole-class attendance register for one day
+@app.route('/attendance/register', methods=['GET', 'POST'])
+@login_required
+def attendance_register():
+    if current_user.role != 'Teacher':
+        flash("Unauthorized access.", 'danger')
+        return redirect(url_for('dashboard'))
+
+    values = request.form if request.method == 'POST' else request.args
+    class_name = values.get('class_name')
+    try:
+        day = datetime.strptime(values.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        day = datetime.utcnow().date()
+
+    if request.method == 'POST':
+        # Only accept statuses for pupils who are actually in this class
+        roster = {student.id for student, _ in class_register(class_name, day)}
+        statuses = {}
+        for student_id in roster:
+            status = request.form.get(f'status-{student_id}')
+            if status in ATTENDANCE_STATUSES:
+                statuses[student_id] = status
+
+        saved = save_attendance(day, statuses)
+        db.session.commit()
+        flash(f'Attendance saved for {saved} students in {class_name}.', 'success')
+        return redirect(url_for('attendance_register', class_name=class_name, date=day.isoformat()))
+
+    register = class_register(class_name, day) if class_name else []
+    return render_template('attendance_register.html', classes=cached_class_names(), class_name=class_name,
+                           day=day, register=register, statuses=ATTENDANCE_STATUSES)
 
 # Parent Dashboard Route
 # Parent Dashboard Route
 @app.route('/parent_dashboard')
 @login_required
+@read_only
 def parent_dashboard():
     if current_user.role != 'Parent':
         flash("Unauthorized access.", 'danger')
         return redirect(url_for('dashboard'))
 
-    # Get the parent associated with the current user
+    # The family's data version doubles as the page's validator: it is read from the
+    # parent's row (one indexed lookup), so a change committed by any worker is seen,
+    # and an unchanged reload is answered with 304 without loading anything else
     parent = Parent.query.filter_by(user_id=current_user.id).first()
     if not parent:
         flash('No parent found for this user.', 'info')
-        return render_template('parent_dashboard.html', students=[], assignments=[], remarks=[], fees=[], marks=[])
+        return render_template('parent_dashboard.html', family=FamilyRecords(None))
 
-    # Get all students associated with the parent
-    students = parent.students  # This will now return all students linked to the parent
+    family = FamilyRecords(parent)
+    etag = f'parent-{family.version}'
+    if request.if_none_match.contains_weak(etag) and '_flashes' not in session:
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
 
-    if not students:
-        flash('No students found for this parent.', 'info')
-        return render_template('parent_dashboard.html', students=[], assignments=[], remarks=[], fees=[], marks=[])
-
-    # Fetch assignments, remarks, and fees for the associated students
-    assignments = Assignment.query.filter(Assignment.student_id.in_([student.id for student in students])).all()
-    remarks = Remark.query.filter(Remark.student_id.in_([student.id for student in students])).all()
-    fees = Fee.query.filter(Fee.student_id.in_([student.id for student in students])).all()
-
-    # Fetch marks for the associated students
-    marks = Mark.query.filter(Mark.student_id.in_([student.id for student in students])).all()
-
-    return render_template('parent_dashboard.html', students=students, assignments=assignments, remarks=remarks, fees=fees, marks=marks)
+    # The records load only if the page is not already in the fragment cache
+    response = make_response(render_template('parent_dashboard.html', family=family))
+    response.set_etag(etag)
+    if parent.data_updated_at:
+        response.last_modified = parent.data_updated_at
+    response.cache_control.private = True
+    response.cache_control.no_cache = True  # Always revalidate
+    return response
 
 
 
 # View Assingment
 @app.route('/view_assignments', methods=['GET'])
 @login_required
+@read_only
 def view_assignments():
     if current_user.role != 'Parent':
         flash("Unauthorized access.", 'danger')
@@ -405,14 +505,43 @@ def view_assignments():
 # View Attendance for Parent
 @app.route('/view_attendance')
 @login_required
+@read_only
 def view_attendance():
     if current_user.role != 'Parent':
         flash("Unauthorized access.", 'danger')
         return redirect(url_for('dashboard'))
 
-    # Fetch attendance records for the child
-    attendance_records = Attendance.query.filter_by(student_id=current_user.child_id).all()
-    return render_template('view_attendance.html', attendance_records=attendance_records)
+    # Monthly totals come from the rollup; only the latest days are read row by row
+    student = db.session.get(Student, current_user.child_id) if current_user.child_id else None
+    months = student_months(student.id) if student else []
+    recent_records = (Attendance.query.filter_by(student_id=student.id).order_by(Attendance.date.desc())
+                      .limit(RECENT_ATTENDANCE_DAYS).all() if student else [])
+    present = sum(month['present'] for month in months)
+    absent = sum(month['absent'] for month in months)
+    return render_template('view_attendance.html', student=student, months=months, recent_records=recent_records,
+                           present=present, absent=absent, rate=present / (present + absent) if present + absent else None)
+
+# Attendance rates, chronic absentees and a class-by-week heatmap for one term
+@app.route('/attendance/reports')
+@login_required
+@read_only
+def attendance_reports():
+    if current_user.role not in ('Teacher', 'Admin'):
+        flash("Unauthorized access.", 'danger')
+        return redirect(url_for('dashboard'))
+
+    term = request.args.get('term') or current_term()
+    bounds = term_range(term)
+    if bounds is None:
+        flash('Unknown term; use year-term, e.g. 2024-2.', 'danger')
+        return redirect(url_for('attendance_reports'))
+    class_name = request.args.get('class_name') or None
+    threshold = request.args.get('threshold', CHRONIC_ABSENCE * 100, type=float) / 100
+
+    weeks, heatmap = class_week_heatmap(bounds, class_name)
+    return render_template('attendance_reports.html', term=term, class_name=class_name, threshold=threshold,
+                           classes=cached_class_names(), class_rates=class_rates(bounds), weeks=weeks, heatmap=heatmap,
+                           absentees=student_rates(bounds, class_name, threshold=threshold))
 
 # Add Marks
 from flask import request, redirect, url_for, flash
@@ -422,76 +551,248 @@ from models import db, Mark  # Make sure you have the Mark model imported
 @login_required
 def add_mark():
     if request.method == 'POST':
-        student_id = request.form['student_id']
-        subject = request.form['subject']
-        score = request.form['score']
-        test_type = request.form['test_type']
-
-        new_mark = Mark(student_id=student_id, teacher_id=current_user.id, subject=subject, score=score, test_type=test_type)
-        db.session.add(new_mark)
-        db.session.commit()
-        flash('Marks added successfully!', 'success')
+        student_id = request.form.get('student_id', type=int)
+        subject = request.form.get('subject', '').strip()
+        test_type = request.form.get('test_type')
+        try:
+            score = parse_score(request.form.get('score'))
+            if not student_id or not subject:
+                raise ValueError('Choose a student and a subject')
+            added, corrected = save_marks({(student_id, subject): score}, test_type, current_user.id)
+            db.session.commit()
+        except (ValueError, MarkEntryError) as e:
+            db.session.rollback()
+            flash(f'Marks not saved: {e}.', 'danger')
+            return redirect(url_for('add_mark'))
+        flash('Mark corrected successfully!' if corrected else 'Marks added successfully!', 'success')
         return redirect(url_for('teacher_dashboard'))  # Redirect back to the teacher dashboard
 
-    students = Student.query.all()  # Fetch all students for the dropdown
-    return render_template('add_marks.html', students=students)
+    return render_template('add_marks.html')
+
+# A class's marks for one test in one page: students down, subjects across, one submit
+@app.route('/marks/grid', methods=['GET', 'POST'])
+@login_required
+@read_only
+def marks_grid():
+    if current_user.role != 'Teacher':
+        flash("Unauthorized access.", 'danger')
+        return redirect(url_for('dashboard'))
+
+    classes, subjects = cached_class_names(), cached_subject_names()
+    class_name = request.values.get('class_name')
+    test_type = request.values.get('test_type') if request.values.get('test_type') in TEST_TYPES else 'End Term'
+    term = current_term()
+    if class_name not in classes:
+        return render_template('marks_grid.html', classes=classes, class_name=None, test_type=test_type,
+                               test_types=TEST_TYPES, term=term)
+
+    students, saved = class_grid(class_name, subjects, test_type, term)
+    errors = {}
+    if request.method == 'POST':
+        scores, errors = read_grid(request.form, students, subjects)
+        if errors:
+            flash(f'{len(errors)} score(s) need correcting; nothing was saved.', 'danger')
+        else:
+            try:
+                added, corrected = save_marks(scores, test_type, current_user.id, term)
+                db.session.commit()
+            except MarkEntryError as e:
+                db.session.rollback()
+                flash(str(e), 'danger')
+            else:
+                flash(f'{added} mark(s) added and {corrected} corrected for {class_name}.', 'success')
+                return redirect(url_for('marks_grid', class_name=class_name, test_type=test_type))
+
+    return render_template('marks_grid.html', classes=classes, class_name=class_name, test_type=test_type,
+                           test_types=TEST_TYPES, term=term, students=students, subjects=subjects, saved=saved,
+                           posted=request.form if errors else None, errors=errors)
+
+
+
+RECENT_ATTENDANCE_DAYS = 20  # Individual days listed under the parent's monthly attendance summary
+ANALYTICS_RANK_ROWS = 100  # Ranking rows shown on the analytics page; the JSON endpoint returns them all
 
+# Sort keys for fee listings; each ends with the primary key so the order is total
+FEE_SORTS = {
+    'due_date': (Fee.due_date, Fee.id),
+    'id': (Fee.id,),
+}
 
+def parse_date_arg(name):
+    try:
+        return datetime.strptime(request.args.get(name, ''), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+def fee_page():
+    """One keyset page of fees filtered by status, class and due-date range."""
+    filters = {
+        'status': request.args.get('status') or None,
+        'class_name': request.args.get('class_name') or None,
+        'due_from': parse_date_arg('due_from'),
+        'due_to': parse_date_arg('due_to'),
+        'sort': request.args.get('sort') if request.args.get('sort') in FEE_SORTS else 'due_date',
+        'order': 'desc' if request.args.get('order') == 'desc' else 'asc',
+    }
+
+    # Join the student once so names render without a query per row
+    query = Fee.query.join(Fee.student).options(contains_eager(Fee.student))
+    if filters['status']:
+        query = query.filter(Fee.status == filters['status'])
+    if filters['class_name']:
+        query = query.filter(Student.class_name == filters['class_name'])
+    if filters['due_from']:
+        query = query.filter(Fee.due_date >= filters['due_from'])
+    if filters['due_to']:
+        query = query.filter(Fee.due_date <= filters['due_to'])
+
+    fees = keyset_paginate(query, FEE_SORTS[filters['sort']], request.args.get('after'),
+                           per_page_arg(), descending=filters['order'] == 'desc')
+    return fees, filters
 
 # Finance Dashboard Route
 @app.route('/finance_dashboard')
 @login_required
+@read_only
 def finance_dashboard():
     if current_user.role != 'Finance':
         flash("Unauthorized access.", 'danger')
         return redirect(url_for('dashboard'))
 
-    # Fetch all fee records and student list
-    fees = Fee.query.all()
-    students = Student.query.all()  # List of students for the creation form
+    # Fetch one page of fee records; the creation form looks students up as you type
+    fees, filters = fee_page()
+    last_sweep = FeeSweep.query.order_by(FeeSweep.id.desc()).first()
+    student_balances = balances({fee.student_id for fee in fees})
 
-    return render_template('finance_dashboard.html', fees=fees, students=students)
+    return render_template('finance_dashboard.html', fees=fees, filters=filters, last_sweep=last_sweep,
+                           balances=student_balances, payment_methods=PAYMENT_METHODS)
 
 
 # View Fees Endpoint (For Finance)
 @app.route('/view_fees')
 @login_required
+@read_only
 def view_fees():
     if current_user.role != 'Finance':
         flash("Unauthorized access.", 'danger')
         return redirect(url_for('dashboard'))
 
-    fees = Fee.query.all()  # Get all fees
-    return render_template('view_fees.html', fees=fees)
+    fees, filters = fee_page()
+    return render_template('view_fees.html', fees=fees, filters=filters)
 
-@app.route('/update_fee/<int:fee_id>', methods=['POST'])
+# Streaming CSV/XLSX exports of fees, marks and attendance
+@app.route('/export/<kind>')
 @login_required
-def update_fee(fee_id):
-    fee = Fee.query.get_or_404(fee_id)  # Fetch the fee record by ID
+@read_only
+def export_data(kind):
+    if kind not in EXPORTS:
+        flash('Unknown export.', 'danger')
+        return redirect(url_for('dashboard'))
+    if current_user.role not in EXPORTS[kind][2]:
+        flash("Unauthorized access.", 'danger')
+        return redirect(url_for('dashboard'))
+
+    filters = {
+        'class_name': request.args.get('class_name') or None,
+        'status': request.args.get('status') or None,
+        'test_type': request.args.get('test_type') or None,
+        'subject': request.args.get('subject') or None,
+        'term': request.args.get('term') or None,
+    }
+    if filters['term'] and term_range(filters['term']) is None:
+        # A silently dropped filter would export the whole school's history
+        flash('Unknown term; use year-term, e.g. 2024-2.', 'danger')
+        return redirect(url_for('dashboard'))
+    stamp = datetime.utcnow().strftime('%Y%m%d')
+
+    if request.args.get('format') == 'xlsx':
+        try:
+            output = write_xlsx(kind, filters)
+        except ExportError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('dashboard'))
+        return send_file(output, as_attachment=True, download_name=f'{kind}-{stamp}.xlsx',
+                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+    # Rows are written out as they are fetched, so the download starts immediately
+    return Response(stream_with_context(iter_csv(kind, filters)), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={kind}-{stamp}.csv'})
+
+def fee_conflict(fee_id):
+    """The fee page again, current values and all, after a stale form was posted."""
+    db.session.rollback()
+    flash('Someone else changed this fee while you were looking at it. '
+          'Check the current figures below and try again.', 'warning')
+    return fee_detail(fee_id), 409
+
+# One fee with its payment history; payments are recorded and the fee changed from here
+@app.route('/fees/<int:fee_id>')
+@login_required
+@read_only
+def fee_detail(fee_id):
     if current_user.role != 'Finance':
         flash("Unauthorized access.", 'danger')
         return redirect(url_for('dashboard'))
 
+    fee = Fee.query.options(joinedload(Fee.student)).filter_by(id=fee_id).first_or_404()
+    payments = Payment.query.filter_by(fee_id=fee.id).order_by(Payment.id).all()
+    balance = db.session.get(StudentBalance, fee.student_id)
+    return render_template('fee_detail.html', fee=fee, payments=payments, balance=balance,
+                           payment_methods=PAYMENT_METHODS)
+
+# Payments are appended to the fee's ledger; the posted version guards against stale forms
+@app.route('/fees/<int:fee_id>/payments', methods=['POST'])
+@login_required
+def record_fee_payment(fee_id):
+    if current_user.role != 'Finance':
+        flash("Unauthorized access.", 'danger')
+        return redirect(url_for('dashboard'))
+
+    fee = Fee.query.get_or_404(fee_id)
+    amount = request.form.get('amount', type=float)
+    method = request.form.get('method')
+    if not amount or method not in PAYMENT_METHODS:
+        flash('Enter a non-zero amount and a payment method.', 'danger')
+        return redirect(request.referrer or url_for('fee_detail', fee_id=fee_id))
+
     try:
-        amount_paid = request.form.get('amount_paid', type=float)
-        due_date_str = request.form.get('due_date')
-        status = request.form.get('status')
+        record_payment(fee, amount, method, request.form.get('reference', '').strip(),
+                       user_id=current_user.id, version=request.form.get('version', type=int))
+        db.session.commit()
+    except (FeeConflict, StaleDataError):
+        return fee_conflict(fee_id)
+    except Exception as e:
+        db.session.rollback()
+        flash(f'An error occurred while recording the payment: {e}', 'danger')
+        return redirect(request.referrer or url_for('fee_detail', fee_id=fee_id))
 
-        # Convert due_date_str to a date object
-        due_date = datetime.strptime(due_date_str, '%Y-%m-%d').date()  # Convert to date object
+    flash(f'Payment of {amount:.2f} recorded.', 'success')
+    return redirect(request.referrer or url_for('fee_detail', fee_id=fee_id))
 
-        # Update the fee details
-        fee.amount_paid = amount_paid
-        fee.due_date = due_date
-        fee.status = status
+@app.route('/update_fee/<int:fee_id>', methods=['POST'])
+@login_required
+def update_fee(fee_id):
+    fee = Fee.query.get_or_404(fee_id)  # Fetch the fee record by ID
+    if current_user.role != 'Finance':
+        flash("Unauthorized access.", 'danger')
+        return redirect(url_for('dashboard'))
 
+    # Only what is owed and when; amounts paid change through the payment ledger
+    try:
+        amount_due = request.form.get('amount_due', type=float)
+        due_date = datetime.strptime(request.form.get('due_date', ''), '%Y-%m-%d').date()
+        if amount_due is None:
+            raise ValueError('Amount due is required.')
+        change_fee(fee, amount_due, due_date, version=request.form.get('version', type=int))
         db.session.commit()
         flash('Fee updated successfully!', 'success')
+    except (FeeConflict, StaleDataError):
+        return fee_conflict(fee_id)
     except Exception as e:
         db.session.rollback()
         flash(f'An error occurred while updating fee: {e}', 'danger')
 
-    return redirect(url_for('finance_dashboard'))
+    return redirect(url_for('fee_detail', fee_id=fee_id))
 
 
 @app.route('/edit_user/<int:user_id>', methods=['GET', 'POST'])
@@ -510,7 +811,7 @@ def edit_user(user_id):
         user.role = request.form.get('role')  # Ensure to handle role correctly
         new_password = request.form.get('password')
         if new_password:
-            user.password = generate_password_hash(new_password)
+            user.password = hasher.hash(new_password)
         db.session.commit()
         flash('User updated successfully!', 'success')
         return redirect(url_for('admin_dashboard'))
@@ -553,5 +854,326 @@ def request_password_reset():
     return redirect(url_for('admin_dashboard'))
 
 
+def analytics_args():
+    # term=all covers every mark; the default is the current term
+    term = request.args.get('term') or current_term()
+    return {
+        'term': None if term == 'all' else term,
+        'class_name': request.args.get('class_name') or None,
+        'subject': request.args.get('subject') or None,
+        'test_type': request.args.get('test_type') or None,
+    }
+
+
+def with_student_names(ranks, limit=None):
+    ranks = ranks[:limit] if limit else ranks
+    students = {student.id: student for student in
+                Student.query.filter(Student.id.in_([row['student_id'] for row in ranks])).all()}
+    return [dict(row, name=students[row['student_id']].name,
+                 admission_number=students[row['student_id']].admission_number)
+            for row in ranks if row['student_id'] in students]
+
+
+# Class and subject score statistics, CAT vs End Term spread and rankings
+@app.route('/teacher/analytics')
+@login_required
+@read_only
+def marks_analytics_view():
+    if current_user.role not in ('Teacher', 'Admin'):
+        flash("Unauthorized access.", 'danger')
+        return redirect(url_for('dashboard'))
+    args = analytics_args()
+    if args['term'] and term_range(args['term']) is None:
+        flash('Unknown term; use year-term, e.g. 2024-2.', 'danger')
+        return redirect(url_for('marks_analytics_view'))
+    result = marks_analytics(**args)
+    ranks = with_student_names(result.get('ranks', []), limit=ANALYTICS_RANK_ROWS)
+    return render_template('marks_analytics.html', result=result, ranks=ranks, args=args,
+                           term=args['term'] or 'all', class_names=cached_class_names())
+
+
+@app.route('/api/analytics')
+@login_required
+@read_only
+def marks_analytics_api():
+    if current_user.role not in ('Teacher', 'Admin'):
+        return jsonify({'error': 'Unauthorized access.'}), 403
+    args = analytics_args()
+    if args['term'] and term_range(args['term']) is None:
+        return jsonify({'error': 'Unknown term; use year-term, e.g. 2024-2.'}), 400
+    result = marks_analytics(**args)
+    if 'ranks' in result:
+        result = dict(result, ranks=with_student_names(result['ranks']))
+    return jsonify(result)
+
+
+# Typeahead lookup used by the student pickers in the forms
+@app.route('/api/students/search')
+@login_required
+def search_students_api():
+    if current_user.role not in ('Admin', 'Teacher', 'Finance'):
+        return jsonify({'error': 'Unauthorized access.'}), 403
+    return jsonify(search_students(request.args.get('q', ''), request.args.get('limit', 10, type=int)))
+
+
+# Cache hit/miss counters per namespace (this worker)
+@app.route('/admin/cache_stats')
+@login_required
+def cache_stats():
+    if current_user.role != 'Admin':
+        flash("Unauthorized access.", 'danger')
+        return redirect(url_for('dashboard'))
+    return jsonify(cache.stats())
+
+
+# Request, SQL and template timings per endpoint, in Prometheus text format (this worker)
+@app.route('/admin/metrics')
+@login_required
+def metrics():
+    if current_user.role != 'Admin':
+        flash("Unauthorized access.", 'danger')
+        return redirect(url_for('dashboard'))
+    return Response(instrumentation.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+# Sampling profiler: switch it on for a fraction of requests, download flame graph input per endpoint
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+@login_required
+def profiling():
+    if current_user.role != 'Admin':
+        flash("Unauthorized access.", 'danger')
+        return redirect(url_for('dashboard'))
+
+    if request.method == 'POST':
+        if request.form.get('action') == 'clear':
+            profiler.clear()
+            flash('Stored profiles deleted.', 'success')
+        else:
+            try:
+                rate = float(request.form.get('sample_rate', ''))
+            except ValueError:
+                rate = -1
+            if not 0 < rate <= 1:
+                flash('Sample rate must be between 0 and 1.', 'danger')
+                return redirect(url_for('profiling'))
+            enabled = request.form.get('action') == 'enable'
+            profiler.configure(enabled, rate)
+            flash(f'Profiling {"on for " + format(rate, ".1%") + " of requests" if enabled else "off"}.', 'success')
+        return redirect(url_for('profiling'))
+
+    enabled, rate = profiler.settings()
+    return render_template('profiling.html', enabled=enabled, sample_rate=rate, endpoints=profiler.endpoints(),
+                           token=profiler.trigger_token(), token_max_age=profiler.token_max_age)
+
+
+# Background jobs: queue depth and latency, recent and failed jobs, manual runs and retries
+@app.route('/admin/jobs', methods=['GET', 'POST'])
+@login_required
+def admin_jobs():
+    if current_user.role != 'Admin':
+        flash("Unauthorized access.", 'danger')
+        return redirect(url_for('dashboard'))
+
+    if request.method == 'POST':
+        if request.form.get('action') == 'retry':
+            if retry_job(request.form.get('job_id', type=int)):
+                flash('Job queued again.', 'success')
+            else:
+                flash('Only failed jobs can be retried.', 'danger')
+        elif request.form.get('name') in manual_tasks():
+            enqueue(request.form['name'])
+            db.session.commit()
+            flash(f"{request.form['name']} queued.", 'success')
+        else:
+            flash('Unknown task.', 'danger')
+        return redirect(url_for('admin_jobs'))
+
+    recent = Job.query.order_by(Job.id.desc()).limit(50).all()
+    failed = Job.query.filter_by(status='Failed').order_by(Job.finished_at.desc()).limit(20).all()
+    return render_template('jobs.html', summary=queue_summary(), recent=recent, failed=failed,
+                           manual_tasks=manual_tasks())
+
+
+@app.route('/admin/profiles/<name>.folded')
+@login_required
+def download_profile(name):
+    if current_user.role != 'Admin':
+        flash("Unauthorized access.", 'danger')
+        return redirect(url_for('dashboard'))
+    collapsed = profiler.collapsed(name)
+    if collapsed is None:
+        abort(404)
+    return Response(collapsed, mimetype='text/plain',
+                    headers={'Content-Disposition': f'attachment; filename={name}.folded'})
+
+
+# End-of-term report cards, generated in the background for one class or the whole school
+@app.route('/admin/report_cards', methods=['GET', 'POST'])
+@login_required
+def report_cards():
+    if current_user.role != 'Admin':
+        flash("Unauthorized access.", 'danger')
+        return redirect(url_for('dashboard'))
+
+    if request.method == 'POST':
+        try:
+            job = create_report_job(request.form.get('term', '').strip(), request.form.get('class_name') or None)
+        except ReportError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('report_cards'))
+        enqueue('reports.generate', {'report_job_id': job.id})
+        db.session.commit()
+        flash('Report card generation queued.', 'success')
+        return redirect(url_for('report_cards'))
+
+    jobs = ReportJob.query.order_by(ReportJob.id.desc()).limit(20).all()
+    archives = {job.id: job_archives(report_dir(app), job) for job in jobs}
+    return render_template('report_cards.html', jobs=jobs, archives=archives,
+                           class_names=cached_class_names(), term=current_term())
+
+
+@app.route('/admin/report_cards/<int:job_id>/<filename>')
+@login_required
+def download_report_cards(job_id, filename):
+    if current_user.role != 'Admin':
+        flash("Unauthorized access.", 'danger')
+        return redirect(url_for('dashboard'))
+    job = ReportJob.query.get_or_404(job_id)
+    return send_from_directory(job_directory(report_dir(app), job), filename, as_attachment=True)
+
+
+# Generate report cards from the command line, e.g. at the end of term from cron
+@app.cli.command('report-cards')
+@click.option('--term', default=None, help='Year and term, e.g. 2024-2 (default: the current term).')
+@click.option('--class', 'class_name', default=None, help='One class only (default: the whole school).')
+@click.option('--workers', default=None, type=int, help='Rendering processes (default: REPORT_WORKERS).')
+@click.option('--format', 'fmt', default=None, type=click.Choice(['html', 'pdf']), help='Default: REPORT_FORMAT.')
+def report_cards_command(term, class_name, workers, fmt):
+    try:
+        job = create_report_job(term or current_term(), class_name)
+        start = datetime.utcnow()
+        run_report_job(job, report_dir(app), workers or app.config['REPORT_WORKERS'],
+                       fmt or app.config['REPORT_FORMAT'], log=print)
+    except ReportError as e:
+        raise click.ClickException(str(e))
+    elapsed = (datetime.utcnow() - start).total_seconds()
+    print(f'{job.students_done} report cards in {job.classes_done} archives in {elapsed:.1f}s: '
+          f'{job_directory(report_dir(app), job)}')
+
+
+# Recompute the performance aggregates from the Mark table (backfills and repairs)
+@app.cli.command('rebuild-performance')
+def rebuild_performance_command():
+    rebuild_performance()
+    print('Performance aggregates rebuilt.')
+
+
+# Recompute the attendance rollups from the Attendance table (backfills and repairs)
+@app.cli.command('rebuild-attendance-rollups')
+def rebuild_attendance_rollups_command():
+    rebuild_attendance_rollups()
+    print('Attendance rollups rebuilt.')
+
+
+# Run background jobs until SIGTERM; start one or more of these next to the web workers
+@app.cli.command('jobs-worker')
+@click.option('--threads', default=None, type=int, help='Jobs run at once (default: JOB_WORKERS).')
+@click.option('--once', is_flag=True, help='Exit when no job is due instead of waiting for more.')
+def jobs_worker_command(threads, once):
+    Worker(app, threads).run(once=once)
+
+
+# Queue a job from the command line or cron, e.g. `flask enqueue-job fees.remind`
+@app.cli.command('enqueue-job')
+@click.argument('name', type=click.Choice(sorted(TASKS)))
+@click.option('--payload', default='{}', help='Keyword arguments for the task, as JSON.')
+def enqueue_job_command(name, payload):
+    try:
+        job = enqueue(name, json.loads(payload))
+    except ValueError as e:
+        raise click.ClickException(f'Invalid payload: {e}')
+    db.session.commit()
+    print(f'Queued job {job.id} ({name}).')
+
+
+# Fingerprint and precompress static files; restart the workers afterwards to pick up the manifest
+@app.cli.command('build-assets')
+def build_assets_command():
+    manifest = build_assets(app.static_folder)
+    for path, fingerprinted in sorted(manifest.items()):
+        print(f'{path} -> {fingerprinted}')
+
+
+# Fill the template bytecode cache, e.g. at deploy, so new workers start warm
+@app.cli.command('compile-templates')
+def compile_templates_command():
+    names = template_caching.compile_all(app)
+    print(f'Compiled {len(names)} templates.')
+
+
+# Run a request against every route and fail when any statement it sends is planned
+# as a full table scan, or when a route has no request in query_plans.REQUESTS (SQLite only)
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    if db.engine.dialect.name != 'sqlite':
+        print('Query plan checks only run against SQLite.')
+        return
+    failures, uncovered = check_query_plans(app)
+    for failure in failures:
+        print(f'[{failure.endpoint}] {failure.path}: ' + (f'table scan in: {failure.sql}' if failure.sql else 'request failed'))
+        for detail in failure.plan:
+            print(f'    {detail}')
+    for endpoint in uncovered:
+        print(f'[{endpoint}] no request in query_plans.REQUESTS covers this route')
+    if failures or uncovered:
+        raise SystemExit(1)
+    print('All route queries use indexes.')
+
+
+# Recompute Fee.status (Paid / Overdue / Pending) for every fee in bulk
+@app.cli.command('sweep-fees')
+def sweep_fees_command():
+    sweep = sweep_fee_statuses()
+    print(f'{sweep.changed} fees updated ({sweep.marked_paid} paid, {sweep.marked_overdue} overdue, '
+          f'{sweep.marked_pending} pending) in {sweep.duration_ms:.1f} ms.')
+
+# Recompute every StudentBalance from the fees, e.g. after loading fees outside the app
+@app.cli.command('rebuild-balances')
+def rebuild_balances_command():
+    print(f'Balances rebuilt for {rebuild_balances()} students.')
+
+
+# Hammer the counter allocator from many threads and check for duplicates or gaps
+@app.cli.command('stress-allocator')
+@click.option('--workers', default=16, help='Concurrent threads, each with its own connection.')
+@click.option('--allocations', default=50, help='Allocations per thread.')
+@click.option('--batch', default=1, help='Numbers reserved per allocation.')
+def stress_allocator_command(workers, allocations, batch):
+    name = 'stress-test'
+
+    def worker():
+        numbers = []
+        with app.app_context():
+            for _ in range(allocations):
+                start = Counter.allocate(name, batch)
+                db.session.commit()
+                numbers.extend(range(start, start + batch))
+        return numbers
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = [n for numbers in pool.map(lambda _: worker(), range(workers)) for n in numbers]
+
+    db.session.execute(Counter.__table__.delete().where(Counter.name == name))
+    db.session.commit()
+
+    expected = list(range(1, workers * allocations * batch + 1))
+    if sorted(results) != expected:
+        duplicates = len(results) - len(set(results))
+        missing = len(set(expected) - set(results))
+        print(f'FAILED: {duplicates} duplicate and {missing} missing numbers.')
+        raise SystemExit(1)
+    print(f'OK: {len(results)} numbers handed out with no duplicates or gaps.')
+
+
 if __name__ == '__main__':
     app.run(debug=True)
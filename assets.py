@@ -0,0 +1,112 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # .br files are skipped without it
+    brotli = None
+
+BUILD_DIR = 'dist'  # Under the static folder, so the static route serves it
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 12
+COMPRESSIBLE = {'.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.ico'}
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))  # Preferred first
+ONE_YEAR = 365 * 24 * 3600
+
+
+def _fingerprinted(path, data):
+    stem, ext = os.path.splitext(path)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}'
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.part', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.part', path)
+
+
+def build_assets(static_folder):
+    """Copy every static file into static/dist under a content-hashed name.
+
+    Text assets also get .gz and .br siblings (when smaller) for the static
+    view to serve as they are. Files from earlier builds are left in place,
+    so pages rendered before a deploy keep working. Returns the manifest,
+    ``{original path: fingerprinted path}``, which is also written to
+    static/dist/manifest.json.
+    """
+    build_dir = os.path.join(static_folder, BUILD_DIR)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        if os.path.abspath(root) == os.path.abspath(static_folder) and BUILD_DIR in dirs:
+            dirs.remove(BUILD_DIR)
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            path = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            manifest[path] = _fingerprinted(path, data)
+            target = os.path.join(build_dir, manifest[path])
+            if not os.path.exists(target):
+                _write(target, data)
+            if os.path.splitext(name)[1] in COMPRESSIBLE:
+                variants = [('.gz', gzip.compress(data, 9, mtime=0))]
+                if brotli is not None:
+                    variants.append(('.br', brotli.compress(data, quality=11)))
+                for suffix, compressed in variants:
+                    if len(compressed) < len(data) and not os.path.exists(target + suffix):
+                        _write(target + suffix, compressed)
+    _write(os.path.join(build_dir, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+class Assets:
+    """Serves the output of ``flask build-assets``.
+
+    ``url_for('static', filename='css/styles.css')`` becomes the fingerprinted
+    dist/ URL; those responses are cacheable for a year (their name changes
+    with their content) and come precompressed when the client accepts it.
+    Without a manifest (development) static URLs are left alone.
+    """
+
+    def __init__(self):
+        self.manifest = {}
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        try:
+            with open(os.path.join(app.static_folder, BUILD_DIR, MANIFEST)) as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {}
+        app.url_defaults(self._fingerprint_url)
+        app.view_functions['static'] = self._send_static
+
+    def _fingerprint_url(self, endpoint, values):
+        if endpoint == 'static' and values.get('filename') in self.manifest:
+            values['filename'] = f"{BUILD_DIR}/{self.manifest[values['filename']]}"
+
+    def _send_static(self, filename):
+        if not filename.startswith(f'{BUILD_DIR}/') or filename.endswith(MANIFEST):
+            return current_app.send_static_file(filename)
+
+        response = None
+        for encoding, suffix in ENCODINGS:
+            if encoding in request.accept_encodings and os.path.isfile(os.path.join(self.static_folder, filename + suffix)):
+                response = send_from_directory(self.static_folder, filename + suffix, max_age=ONE_YEAR,
+                                               mimetype=mimetypes.guess_type(filename)[0])
+                response.headers['Content-Encoding'] = encoding
+                break
+        if response is None:
+            response = send_from_directory(self.static_folder, filename, max_age=ONE_YEAR)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+assets = Assets()
@@ -0,0 +1,203 @@
+from collections import defaultdict
+from datetime import timedelta
+from sqlalchemy import Date, Float, case, cast, func, insert, select
+from bulk import upsert
+from jobs import task
+from models import db, Student, Attendance, AttendanceStudentMonth, AttendanceClassDay
+
+ATTENDANCE_STATUSES = ('Present', 'Absent')
+CHRONIC_ABSENCE = 0.10  # Missing this share of school days or more counts as chronic absence
+
+
+def class_register(class_name, day):
+    """Students in ``class_name`` paired with their status on ``day`` (``None`` if not yet marked)."""
+    return (
+        db.session.query(Student, Attendance.status)
+        .outerjoin(Attendance, (Attendance.student_id == Student.id) & (Attendance.date == day))
+        .filter(Student.class_name == class_name)
+        .order_by(Student.name, Student.id)
+        .all()
+    )
+
+
+def save_attendance(day, statuses):
+    """Write ``{student_id: status}`` for ``day`` as one batched upsert.
+
+    Re-submitting a day overwrites the earlier status instead of adding rows.
+    The rollups are adjusted by the difference from any earlier status in the
+    same transaction. The caller commits.
+
+    The students' rows are locked before the earlier statuses are read, so two
+    submits of the same register take turns and the second one adjusts the
+    rollups by the first one's statuses instead of counting the day twice.
+    """
+    if not statuses:
+        return 0
+    # Lock in its own statement: under READ COMMITTED the read below then sees
+    # whatever the submit we waited for committed (SQLite ignores FOR UPDATE
+    # and already serializes writers).
+    db.session.execute(
+        select(Student.id).where(Student.id.in_(statuses)).order_by(Student.id).with_for_update()
+    )
+    previous = db.session.execute(
+        select(Student.id, Student.class_name, Attendance.status)
+        .outerjoin(Attendance, (Attendance.student_id == Student.id) & (Attendance.date == day))
+        .where(Student.id.in_(statuses))
+    ).all()
+
+    rows = [{'student_id': student_id, 'date': day, 'status': status} for student_id, status in statuses.items()]
+    upsert(Attendance, rows, index_elements=['student_id', 'date'],
+           set_=lambda excluded: {'status': excluded.status})
+    _update_rollups(day, [(student_id, class_name, old, statuses[student_id])
+                          for student_id, class_name, old in previous])
+    return len(rows)
+
+
+def _counts(status, sign=1):
+    return {'present': sign if status == 'Present' else 0, 'absent': sign if status == 'Absent' else 0}
+
+
+def _add_counts(table):
+    def set_(excluded):
+        return {'present': table.c.present + excluded.present, 'absent': table.c.absent + excluded.absent}
+    return set_
+
+
+def _update_rollups(day, changes):
+    """Apply (student_id, class_name, old status, new status) changes for ``day`` to both rollups."""
+    month = day.replace(day=1)
+    student_rows, class_totals = [], defaultdict(lambda: {'present': 0, 'absent': 0})
+    for student_id, class_name, old, new in changes:
+        if old == new:
+            continue
+        delta = _counts(new)
+        for key, value in _counts(old, -1).items():
+            delta[key] += value
+        student_rows.append({'student_id': student_id, 'month': month, **delta})
+        for key, value in delta.items():
+            class_totals[class_name][key] += value
+
+    upsert(AttendanceStudentMonth, student_rows, index_elements=['student_id', 'month'],
+           set_=_add_counts(AttendanceStudentMonth.__table__))
+    upsert(AttendanceClassDay, [{'class_name': class_name, 'date': day, **totals}
+                                for class_name, totals in class_totals.items()],
+           index_elements=['class_name', 'date'], set_=_add_counts(AttendanceClassDay.__table__))
+
+
+def _month_start(column):
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return func.date(column, 'start of month')
+    return cast(func.date_trunc('month', column), Date)
+
+
+def _count_status(status):
+    return func.sum(case((Attendance.status == status, 1), else_=0))
+
+
+@task('attendance.rebuild_rollups', timeout=3600)
+def rebuild_attendance_rollups():
+    """Recompute both rollups from the Attendance table."""
+    db.session.execute(AttendanceStudentMonth.__table__.delete())
+    db.session.execute(AttendanceClassDay.__table__.delete())
+
+    month = _month_start(Attendance.date)
+    db.session.execute(insert(AttendanceStudentMonth).from_select(
+        ['student_id', 'month', 'present', 'absent'],
+        select(Attendance.student_id, month, _count_status('Present'), _count_status('Absent'))
+        .group_by(Attendance.student_id, month),
+    ))
+    db.session.execute(insert(AttendanceClassDay).from_select(
+        ['class_name', 'date', 'present', 'absent'],
+        select(Student.class_name, Attendance.date, _count_status('Present'), _count_status('Absent'))
+        .join(Student, Attendance.student_id == Student.id)
+        .group_by(Student.class_name, Attendance.date),
+    ))
+    db.session.commit()
+
+
+# Reports: these read only the rollups. ``bounds`` is a (first day, first day after)
+# pair such as exports.term_range returns; terms start and end on month boundaries.
+
+def _rate(present, absent):
+    days = (present or 0) + (absent or 0)
+    return (present or 0) / days if days else None
+
+
+def student_rates(bounds, class_name=None, threshold=None):
+    """Present/absent days and attendance rate per student over ``bounds``.
+
+    With ``threshold``, only students absent for at least that share of their
+    days, worst first (chronic absentees).
+    """
+    start, end = bounds
+    present = func.sum(AttendanceStudentMonth.present)
+    absent = func.sum(AttendanceStudentMonth.absent)
+    absence_rate = cast(absent, Float) / func.nullif(present + absent, 0)
+    stmt = (
+        select(Student.id, Student.name, Student.admission_number, Student.class_name, present, absent)
+        .join(AttendanceStudentMonth, AttendanceStudentMonth.student_id == Student.id)
+        .where(AttendanceStudentMonth.month >= start, AttendanceStudentMonth.month < end)
+        .group_by(Student.id, Student.name, Student.admission_number, Student.class_name)
+    )
+    if class_name:
+        stmt = stmt.where(Student.class_name == class_name)
+    if threshold is not None:
+        stmt = stmt.having(absence_rate >= threshold).order_by(absence_rate.desc(), Student.name)
+    else:
+        stmt = stmt.order_by(Student.class_name, Student.name)
+    return [
+        {'student_id': id_, 'name': name, 'admission_number': number, 'class_name': class_,
+         'present': p, 'absent': a, 'rate': _rate(p, a)}
+        for id_, name, number, class_, p, a in db.session.execute(stmt)
+    ]
+
+
+def student_months(student_id, bounds=None):
+    """The student's monthly present/absent counts, oldest first."""
+    stmt = (
+        select(AttendanceStudentMonth.month, AttendanceStudentMonth.present, AttendanceStudentMonth.absent)
+        .where(AttendanceStudentMonth.student_id == student_id)
+        .order_by(AttendanceStudentMonth.month)
+    )
+    if bounds:
+        stmt = stmt.where(AttendanceStudentMonth.month >= bounds[0], AttendanceStudentMonth.month < bounds[1])
+    return [{'month': month, 'present': p, 'absent': a, 'rate': _rate(p, a)} for month, p, a in db.session.execute(stmt)]
+
+
+def class_rates(bounds):
+    """Attendance rate per class over ``bounds``."""
+    start, end = bounds
+    stmt = (
+        select(AttendanceClassDay.class_name, func.sum(AttendanceClassDay.present), func.sum(AttendanceClassDay.absent))
+        .where(AttendanceClassDay.date >= start, AttendanceClassDay.date < end)
+        .group_by(AttendanceClassDay.class_name)
+        .order_by(AttendanceClassDay.class_name)
+    )
+    return [{'class_name': name, 'present': p, 'absent': a, 'rate': _rate(p, a)} for name, p, a in db.session.execute(stmt)]
+
+
+def class_week_heatmap(bounds, class_name=None):
+    """Attendance rate per class and week (weeks start on Monday).
+
+    Returns ``(weeks, {class_name: {week: rate}})`` with ``weeks`` sorted.
+    """
+    start, end = bounds
+    stmt = (
+        select(AttendanceClassDay.class_name, AttendanceClassDay.date,
+               AttendanceClassDay.present, AttendanceClassDay.absent)
+        .where(AttendanceClassDay.date >= start, AttendanceClassDay.date < end)
+    )
+    if class_name:
+        stmt = stmt.where(AttendanceClassDay.class_name == class_name)
+
+    totals = defaultdict(lambda: [0, 0])
+    for name, day, present, absent in db.session.execute(stmt):
+        week = day - timedelta(days=day.weekday())
+        totals[name, week][0] += present
+        totals[name, week][1] += absent
+
+    weeks = sorted({week for _, week in totals})
+    grid = defaultdict(dict)
+    for (name, week), (present, absent) in totals.items():
+        grid[name][week] = _rate(present, absent)
+    return weeks, dict(sorted(grid.items()))
@@ -0,0 +1,362 @@
+"""Per-route latency, query count and memory benchmark with regression thresholds.
+
+    python benchmarks/seed.py --scale 0.1          # once, into a scratch DATABASE_URL
+    python benchmarks/bench_routes.py              # compare against benchmarks/thresholds.json
+    python benchmarks/bench_routes.py --concurrency 8 --only dashboard
+    python benchmarks/bench_routes.py --update-thresholds
+
+Every route in app.py and the /api/v1 blueprint is driven through the Flask
+test client as the role that can use it. For each one we record p50/p95
+latency over --iterations sequential requests, the number of SQL statements per
+request, and the peak Python memory allocated while serving one request
+(tracemalloc, in a separate pass so it does not slow the timed requests). With
+--concurrency N the same requests are also spread over N threads, each with its
+own signed-in client.
+
+Exits with status 1 if any route exceeds its threshold: query counts must not
+grow at all, latency and memory may exceed theirs by the configured tolerance.
+A route with no thresholds recorded fails too, as does an endpoint in the URL
+map that neither ROUTES nor UNBENCHED lists.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from itertools import count
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import event, select  # noqa: E402
+from app import app  # noqa: E402
+from models import db, Fee, Student, User  # noqa: E402
+from seed import BENCH_PASSWORD  # noqa: E402
+
+THRESHOLDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thresholds.json')
+
+ACCOUNTS = {
+    'Admin': ('Admin', 'Admin@123'),
+    'Teacher': ('teacher1', BENCH_PASSWORD),
+    'Parent': ('parent1', BENCH_PASSWORD),
+    'Finance': ('finance1', BENCH_PASSWORD),
+}
+
+# ``path`` and ``data`` are formatted with the sample ids and a per-request counter
+# (JSON bodies for /api/v1); ``runs`` caps the timed requests for full-table exports,
+# which take seconds each. ``fresh_client`` routes sign in or out, so each request gets
+# a newly signed-in client; ``prepare`` returns more format values, made untimed.
+Route = namedtuple('Route', 'name role method path data runs fresh_client prepare',
+                   defaults=('GET', None, None, None, False, None))
+EXPORT_RUNS = 3
+
+
+def throwaway_user():
+    """A user for the delete route to remove."""
+    with app.app_context():
+        user = User(username=f'bench-delete-{uuid.uuid4().hex[:12]}', password='!', role='Teacher')
+        db.session.add(user)
+        db.session.commit()
+        return {'throwaway_user_id': user.id}
+
+
+ROUTES = [
+    Route('home', None, 'GET', '/'),
+    Route('login form', None, 'GET', '/login'),
+    Route('dashboard redirect', 'Teacher', 'GET', '/dashboard'),
+    Route('admin dashboard', 'Admin', 'GET', '/admin/dashboard'),
+    Route('admin cache stats', 'Admin', 'GET', '/admin/cache_stats'),
+    Route('create student form', 'Admin', 'GET', '/create_student'),
+    Route('create student', 'Admin', 'POST', '/create_student', {'name': 'Bench Student {n}', 'class_name': '{class_name}'}),
+    Route('import students form', 'Admin', 'GET', '/import_students'),
+    Route('create teacher form', 'Admin', 'GET', '/create_teacher'),
+    Route('create parent form', 'Admin', 'GET', '/create_parent'),
+    Route('create finance form', 'Admin', 'GET', '/create_finance'),
+    Route('edit user form', 'Admin', 'GET', '/edit_user/{user_id}'),
+    Route('delete user', 'Admin', 'POST', '/delete_user/{throwaway_user_id}', {}, prepare=throwaway_user),
+    Route('admin metrics', 'Admin', 'GET', '/admin/metrics'),
+    Route('admin profiling', 'Admin', 'GET', '/admin/profiling'),
+    Route('admin jobs', 'Admin', 'GET', '/admin/jobs'),
+    Route('report cards', 'Admin', 'GET', '/admin/report_cards'),
+    Route('teacher dashboard', 'Teacher', 'GET', '/teacher/dashboard'),
+    Route('create assignment form', 'Teacher', 'GET', '/create_assignment'),
+    Route('create assignment', 'Teacher', 'POST', '/create_assignment',
+          {'title': 'Bench {n}', 'description': 'Benchmark', 'due_date': '{today}', 'student_id': '{student_id}'}),
+    Route('add remark form', 'Teacher', 'GET', '/add_remark'),
+    Route('add remark', 'Teacher', 'POST', '/add_remark', {'student_id': '{student_id}', 'text': 'Benchmark remark {n}'}),
+    Route('mark attendance form', 'Teacher', 'GET', '/mark_attendance'),
+    Route('mark attendance', 'Teacher', 'POST', '/mark_attendance', {'student_id': '{student_id}', 'status': 'Present'}),
+    Route('attendance register', 'Teacher', 'GET', '/attendance/register?class_name={class_name}&date={today}'),
+    Route('save attendance register', 'Teacher', 'POST', '/attendance/register',
+          {'class_name': '{class_name}', 'date': '{today}', 'status-{student_id}': 'Present'}),
+    Route('attendance reports', 'Teacher', 'GET', '/attendance/reports?term={term}'),
+    Route('add mark form', 'Teacher', 'GET', '/add_mark'),
+    Route('add mark', 'Teacher', 'POST', '/add_mark',
+          {'student_id': '{student_id}', 'subject': 'Mathematics', 'score': '71', 'test_type': 'CAT'}),
+    Route('marks grid', 'Teacher', 'GET', '/marks/grid?class_name={class_name}&test_type=End+Term'),
+    Route('save marks grid', 'Teacher', 'POST', '/marks/grid',
+          {'class_name': '{class_name}', 'test_type': 'End Term', 'score-{student_id}-0': '64'}),
+    Route('marks analytics', 'Teacher', 'GET', '/teacher/analytics?term={term}'),
+    Route('marks analytics api', 'Teacher', 'GET',
+          '/api/analytics?term={term}&subject=Mathematics&test_type=CAT&class_name={class_name}'),
+    Route('student search', 'Teacher', 'GET', '/api/students/search?q=kip'),
+    Route('export marks csv', 'Teacher', 'GET', '/export/marks?format=csv', runs=EXPORT_RUNS),
+    Route('export attendance csv', 'Teacher', 'GET', '/export/attendance?format=csv&term={term}', runs=EXPORT_RUNS),
+    Route('parent dashboard', 'Parent', 'GET', '/parent_dashboard'),
+    Route('view assignments', 'Parent', 'GET', '/view_assignments'),
+    Route('view attendance', 'Parent', 'GET', '/view_attendance'),
+    Route('finance dashboard', 'Finance', 'GET', '/finance_dashboard'),
+    Route('view fees', 'Finance', 'GET', '/view_fees?status=Overdue'),
+    Route('create fee', 'Finance', 'POST', '/create_fee',
+          {'student_id': '{student_id}', 'amount_due': '1000', 'amount_paid': '0', 'due_date': '{next_month}'}),
+    Route('update fee', 'Finance', 'POST', '/update_fee/{fee_id}',
+          {'amount_due': '1000', 'due_date': '{next_month}'}),
+    Route('fee detail', 'Finance', 'GET', '/fees/{fee_id}'),
+    Route('record payment', 'Finance', 'POST', '/fees/{fee_id}/payments',
+          {'amount': '100', 'method': 'Cash', 'reference': 'Benchmark'}),
+    Route('export fees csv', 'Finance', 'GET', '/export/fees?format=csv', runs=EXPORT_RUNS),
+    Route('export fees xlsx', 'Finance', 'GET', '/export/fees?format=xlsx&status=Overdue', runs=EXPORT_RUNS),
+    Route('profile', 'Finance', 'GET', '/profile'),
+    Route('request password reset', 'Finance', 'POST', '/request_password_reset', {'reason': 'Benchmark'}),
+    Route('logout', 'Teacher', 'GET', '/logout', fresh_client=True),
+    Route('api login', None, 'POST', '/api/v1/login', {'username': 'parent1', 'password': BENCH_PASSWORD},
+          fresh_client=True),
+    Route('api logout', 'Parent', 'POST', '/api/v1/logout', fresh_client=True),
+    Route('api students', 'Admin', 'GET', '/api/v1/students?class_name={class_name}'),
+    Route('api marks', 'Teacher', 'GET', '/api/v1/marks?student_id={student_id}&term={term}'),
+    Route('api fees', 'Finance', 'GET', '/api/v1/fees?status=Overdue'),
+    Route('api payments', 'Finance', 'GET', '/api/v1/payments?fee_id={fee_id}'),
+    Route('api attendance', 'Teacher', 'GET', '/api/v1/attendance?student_id={student_id}'),
+    Route('api parent assignments', 'Parent', 'GET', '/api/v1/assignments'),
+    Route('api student', 'Admin', 'GET', '/api/v1/students/{student_id}'),
+    Route('api batch', 'Admin', 'POST', '/api/v1/batch',
+          {'requests': [{'path': '/remarks?student_id={student_id}'}, {'path': '/fees/{fee_id}'}]}),
+]
+
+# Endpoints left out of ROUTES on purpose -> why
+UNBENCHED = {
+    'static': 'files served by the web server in production',
+    'download_profile': 'streams a file written by the sampling profiler; a scratch database has none',
+    'download_report_cards': 'streams an archive written by a report card run; a scratch database has none',
+}
+
+_queries = threading.local()
+
+
+def _count_query(*args):
+    _queries.count = getattr(_queries, 'count', 0) + 1
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def _format(value, values):
+    if isinstance(value, str):
+        return value.format(**values)
+    if isinstance(value, dict):
+        return {_format(k, values): _format(v, values) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_format(v, values) for v in value]
+    return value
+
+
+def sample_values():
+    with app.app_context():
+        student = db.session.execute(select(Student.id, Student.class_name).order_by(Student.id).limit(1)).first()
+        if student is None:
+            sys.exit('No students found; run benchmarks/seed.py first.')
+        today = date.today()
+        return {
+            'student_id': student.id,
+            'class_name': student.class_name,
+            'fee_id': db.session.scalar(select(Fee.id).order_by(Fee.id).limit(1)),
+            'user_id': db.session.scalar(select(User.id).where(User.username == 'parent1')),
+            'today': today.isoformat(),
+            'next_month': (today + timedelta(days=30)).isoformat(),
+            'term': f'{today.year}-{(today.month - 1) // 4 + 1}',
+        }
+
+
+def signed_in_client(role):
+    client = app.test_client()
+    if role:
+        username, password = ACCOUNTS[role]
+        response = client.post('/login', data={'username': username, 'password': password})
+        if response.status_code != 302:
+            sys.exit(f'Could not sign in as {username}; was the database seeded with benchmarks/seed.py?')
+    return client
+
+
+class Runner:
+    def __init__(self, samples):
+        self.samples = samples
+        self.counter = count(1)
+        self.clients = {}
+
+    def client(self, role):
+        key = (role, threading.get_ident())
+        if key not in self.clients:
+            self.clients[key] = signed_in_client(role)
+        return self.clients[key]
+
+    def request(self, route):
+        """Serve ``route`` once; returns (seconds, queries, status)."""
+        values = dict(self.samples, n=next(self.counter), **(route.prepare() if route.prepare else {}))
+        path, data = _format(route.path, values), _format(route.data, values)
+        body = {'json': data} if path.startswith('/api/v1/') else {'data': data}
+        client = signed_in_client(route.role) if route.fresh_client else self.client(route.role)
+        _queries.count = 0
+        start = time.perf_counter()
+        response = client.open(path, method=route.method, **body)
+        for _ in response.iter_encoded():
+            pass  # Drain streamed responses without holding the body
+        elapsed = time.perf_counter() - start
+        response.close()
+        return elapsed, _queries.count, response.status_code
+
+
+def measure(runner, route, iterations, concurrency):
+    iterations = min(iterations, route.runs or iterations)
+    runner.request(route)  # Warm up caches and the client's session
+    timings, queries, statuses = [], [], set()
+    for _ in range(iterations):
+        elapsed, n, status = runner.request(route)
+        timings.append(elapsed)
+        queries.append(n)
+        statuses.add(status)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    runner.request(route)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result = {
+        'p50_ms': percentile(timings, 0.5) * 1000,
+        'p95_ms': percentile(timings, 0.95) * 1000,
+        'queries': max(queries),
+        'peak_kib': peak / 1024,
+        'status': sorted(statuses),
+    }
+    if concurrency > 1:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            loaded = list(pool.map(lambda _: runner.request(route)[0], range(iterations * concurrency)))
+        result['load_p95_ms'] = percentile(loaded, 0.95) * 1000
+        result['load_rps'] = len(loaded) / (time.perf_counter() - start)
+    return result
+
+
+def uncovered_endpoints():
+    """Endpoints in the URL map that no route in ROUTES reaches and UNBENCHED does not excuse."""
+    adapter = app.url_map.bind('localhost')
+    # Any value that fits the URL converters will do to find the endpoint
+    placeholders = {'student_id': 1, 'fee_id': 1, 'user_id': 1, 'throwaway_user_id': 1, 'n': 1,
+                    'class_name': 'x', 'today': 'x', 'next_month': 'x', 'term': 'x'}
+    reached = {adapter.match(_format(route.path.split('?')[0], placeholders), method=route.method)[0]
+               for route in ROUTES}
+    return sorted({rule.endpoint for rule in app.url_map.iter_rules()} - reached - set(UNBENCHED))
+
+
+def check(results, thresholds):
+    """Failures as ``(route, metric, value, limit)``; a route with no limits fails on ``thresholds``."""
+    tolerance = thresholds.get('tolerance', 0.25)
+    failures = []
+    for name, result in results.items():
+        limits = thresholds.get('routes', {}).get(name)
+        if not limits:
+            failures.append((name, 'thresholds', None, None))
+            continue
+        if 'queries' in limits and result['queries'] > limits['queries']:
+            failures.append((name, 'queries', result['queries'], limits['queries']))
+        for metric in ('p95_ms', 'peak_kib', 'load_p95_ms'):
+            if metric in limits and metric in result and result[metric] > limits[metric] * (1 + tolerance):
+                failures.append((name, metric, result[metric], limits[metric]))
+        if any(status >= 400 for status in result['status']):
+            failures.append((name, 'status', result['status'], '< 400'))
+    return failures
+
+
+def updated_thresholds(results, thresholds):
+    # Room for noise on timings and memory; query counts are exact
+    routes = thresholds.setdefault('routes', {})
+    for name, result in results.items():
+        limits = {'queries': result['queries'],
+                  'p95_ms': round(result['p95_ms'] * 1.5 + 1, 1),
+                  'peak_kib': round(result['peak_kib'] * 1.2 + 16)}
+        if 'load_p95_ms' in result:
+            limits['load_p95_ms'] = round(result['load_p95_ms'] * 1.5 + 1, 1)
+        routes[name] = limits
+    thresholds.setdefault('tolerance', 0.25)
+    return thresholds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20, help='timed requests per route')
+    parser.add_argument('--concurrency', type=int, default=1, help='threads for the load pass; 1 skips it')
+    parser.add_argument('--only', help='only routes whose name contains this text')
+    parser.add_argument('--thresholds', default=THRESHOLDS_FILE, help='JSON file of per-route limits')
+    parser.add_argument('--update-thresholds', action='store_true', help='write the results as the new limits')
+    parser.add_argument('--json', help='also write the raw results here')
+    args = parser.parse_args()
+
+    app.config.update(WTF_CSRF_ENABLED=False, JOB_IN_PROCESS_WORKERS=0)  # No job threads competing with the timings
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _count_query)
+
+    uncovered = [] if args.only else uncovered_endpoints()
+    for endpoint in uncovered:
+        print(f'NOT BENCHMARKED {endpoint}: add a route to ROUTES (or the reason to UNBENCHED)')
+
+    runner = Runner(sample_values())
+    routes = [route for route in ROUTES if not args.only or args.only in route.name]
+    results = {}
+    header = f"{'route':<28} {'p50 ms':>8} {'p95 ms':>8} {'queries':>7} {'peak KiB':>9}"
+    if args.concurrency > 1:
+        header += f" {'load p95':>9} {'req/s':>7}"
+    print(header)
+    for route in routes:
+        result = results[route.name] = measure(runner, route, args.iterations, args.concurrency)
+        line = f"{route.name:<28} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['queries']:>7} {result['peak_kib']:>9.0f}"
+        if args.concurrency > 1:
+            line += f" {result['load_p95_ms']:>9.1f} {result['load_rps']:>7.0f}"
+        print(line)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    thresholds = {}
+    if os.path.exists(args.thresholds):
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+    if args.update_thresholds:
+        with open(args.thresholds, 'w') as f:
+            json.dump(updated_thresholds(results, thresholds), f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Thresholds written to {args.thresholds}.')
+        return
+
+    failures = check(results, thresholds)
+    for name, metric, value, limit in failures:
+        if metric == 'thresholds':
+            # Not with --only: limits recorded on a lone route are tighter than a full run meets
+            print(f'NO THRESHOLDS {name}: record them with a full --update-thresholds run')
+        else:
+            print(f'REGRESSION {name}: {metric} {value if not isinstance(value, float) else round(value, 1)} > {limit}')
+    if failures or uncovered:
+        sys.exit(1)
+    print('All routes within thresholds.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Login throughput with the password pool at various sizes.
+
+Simulates a burst of ``--clients`` request threads each verifying passwords,
+while a probe thread stands in for an ordinary page request and records how
+long a small piece of Python work takes. Pool size 0 is the old behaviour:
+the hash runs inline on the request thread with no limit.
+
+    python benchmarks/login_throughput.py --method scrypt --pool-sizes 0,1,2,4,8
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from werkzeug.security import check_password_hash, generate_password_hash  # noqa: E402
+from passwords import PasswordHasher, PasswordPoolBusy  # noqa: E402
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(pool_size, args, stored_hash):
+    hasher = PasswordHasher(args.method, pool_size or 1, args.queue, args.timeout)
+    verify = (lambda: check_password_hash(stored_hash, 'secret123')) if pool_size == 0 \
+        else (lambda: hasher.verify(stored_hash, 'secret123'))
+    latencies, probe = [], []
+    busy = [0]
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def client():
+        for _ in range(args.logins):
+            start = time.perf_counter()
+            try:
+                verify()
+            except PasswordPoolBusy:
+                with lock:
+                    busy[0] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    def page_request():
+        while not done.is_set():
+            start = time.perf_counter()
+            sum(range(20000))
+            probe.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=client) for _ in range(args.clients)]
+    prober = threading.Thread(target=page_request)
+    prober.start()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    prober.join()
+    hasher.configure(args.method)  # Shuts the pool down
+
+    return {
+        'pool': pool_size or 'inline',
+        'logins/s': len(latencies) / elapsed,
+        'p50 ms': percentile(latencies, 0.5) * 1000,
+        'p95 ms': percentile(latencies, 0.95) * 1000,
+        'busy': busy[0],
+        'page p95 ms': percentile(probe, 0.95) * 1000,
+        'page median ms': statistics.median(probe) * 1000 if probe else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--method', default='scrypt', help='werkzeug hash method, e.g. pbkdf2:sha256:600000')
+    parser.add_argument('--pool-sizes', default='0,1,2,4,8', help='comma separated; 0 = inline, no pool')
+    parser.add_argument('--clients', type=int, default=32, help='concurrent login threads')
+    parser.add_argument('--logins', type=int, default=8, help='logins per client')
+    parser.add_argument('--queue', type=int, default=32, help='logins allowed to wait for the pool')
+    parser.add_argument('--timeout', type=float, default=5.0, help='seconds to wait for a slot')
+    args = parser.parse_args()
+
+    stored_hash = generate_password_hash('secret123', args.method)
+    print(f'method={args.method} clients={args.clients} logins/client={args.logins} cpus={os.cpu_count()}')
+    rows = [run(int(size), args, stored_hash) for size in args.pool_sizes.split(',')]
+    columns = list(rows[0])
+    print(' '.join(f'{c:>14}' for c in columns))
+    for row in rows:
+        print(' '.join(f'{v:>14.1f}' if isinstance(v, float) else f'{v:>14}' for v in row.values()))
+
+
+if __name__ == '__main__':
+    main()
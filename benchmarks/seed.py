@@ -0,0 +1,257 @@
+"""Fill an empty database with realistic synthetic data for benchmarking.
+
+    flask db upgrade
+    python benchmarks/seed.py                # 10k students, 500 teachers, 1M marks, 3M attendance rows
+    python benchmarks/seed.py --scale 0.01   # 1% of that, for a quick local run
+
+Point DATABASE_URL at a scratch database first. Every seeded account uses
+BENCH_PASSWORD; the route benchmark signs in as teacher1, parent1 and
+finance1, and as the bootstrap Admin.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import bindparam, insert, literal, select, update  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+from app import app  # noqa: E402
+from attendance import rebuild_attendance_rollups  # noqa: E402
+from fees import rebuild_balances, sweep_fee_statuses  # noqa: E402
+from models import (db, User, Student, Teacher, Parent, Finance, Assignment, Remark,  # noqa: E402
+                    Attendance, Fee, Mark, PasswordResetRequest, Payment)
+from performance import rebuild_performance  # noqa: E402
+from reports import current_term  # noqa: E402
+
+BENCH_PASSWORD = 'bench-password'
+BATCH = 10000
+
+# Full-volume counts; --scale multiplies them
+VOLUMES = {
+    'students': 10000,
+    'teachers': 500,
+    'finance': 10,
+    'marks': 1000000,
+    'attendance': 3000000,
+    'assignments': 20000,
+    'remarks': 50000,
+    'reset_requests': 50,
+}
+FEES_PER_STUDENT = 6  # Three terms a year for two years
+
+FIRST_NAMES = ['Amina', 'Brian', 'Chebet', 'David', 'Esther', 'Faith', 'George', 'Halima', 'Ian', 'Joy',
+               'Kipkoech', 'Lydia', 'Moses', 'Njeri', 'Otieno', 'Purity', 'Rotich', 'Sharon', 'Tom', 'Wanjiru']
+LAST_NAMES = ['Achieng', 'Barasa', 'Cheruiyot', 'Kamau', 'Kiprono', 'Mutua', 'Mwangi', 'Njoroge', 'Ochieng',
+              'Odhiambo', 'Omondi', 'Onyango', 'Rotich', 'Wambui', 'Wanjala']
+SUBJECTS = ['Mathematics', 'English', 'Kiswahili', 'Science', 'Social Studies', 'CRE', 'Agriculture', 'Computer Studies']
+TEST_TYPES = ['Assignment', 'CAT', 'End Term']
+CLASSES = [f'Grade {grade}{stream}' for grade in range(1, 9) for stream in 'ABC']
+REMARKS = ['Shows steady improvement.', 'Needs to revise more at home.', 'Excellent participation in class.',
+           'Often late with homework.', 'A pleasure to teach.', 'Should ask for help earlier.']
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), BATCH):
+        db.session.execute(insert(model), rows[start:start + BATCH])
+        db.session.commit()
+
+
+def _stream(model, rows):
+    """Insert rows from a generator a batch at a time, so the full set is never in memory."""
+    batch, count = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            _insert(model, batch)
+            count += len(batch)
+            batch = []
+    _insert(model, batch)
+    return count + len(batch)
+
+
+def _user_ids(prefix, count):
+    names = [f'{prefix}{i}' for i in range(1, count + 1)]
+    rows = db.session.execute(select(User.username, User.id).where(User.username.like(f'{prefix}%')))
+    ids = dict(rows.all())
+    return [ids[name] for name in names]
+
+
+def _person(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+
+def _school_days(count, today):
+    days, day = [], today
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day)
+        day -= timedelta(days=1)
+    return days[::-1]
+
+
+def seed(scale=1.0, rng_seed=42, log=print):
+    rng = random.Random(rng_seed)
+    volume = {name: max(1, int(count * scale)) for name, count in VOLUMES.items()}
+    today = date.today()
+    password = generate_password_hash(BENCH_PASSWORD, app.config['PASSWORD_HASH_METHOD'])  # One hash for every account
+
+    def step(message, fn):
+        start = time.perf_counter()
+        result = fn()
+        rows = f' {result} rows' if result is not None else ''
+        log(f'{message}:{rows} in {time.perf_counter() - start:.1f}s')
+
+    # Families: one parent account per one to three children
+    n_students = volume['students']
+    family_sizes = []
+    while sum(family_sizes) < n_students:
+        family_sizes.append(rng.choice([1, 1, 2, 2, 3]))
+    family_sizes[-1] -= sum(family_sizes) - n_students
+    n_parents = len(family_sizes)
+
+    def users():
+        rows = []
+        for prefix, role, count in (('teacher', 'Teacher', volume['teachers']),
+                                    ('parent', 'Parent', n_parents),
+                                    ('finance', 'Finance', volume['finance'])):
+            rows += [{'username': f'{prefix}{i}', 'password': password, 'role': role} for i in range(1, count + 1)]
+        _insert(User, rows)
+        return len(rows)
+    step('users', users)
+
+    teacher_users = _user_ids('teacher', volume['teachers'])
+    parent_users = _user_ids('parent', n_parents)
+    finance_users = _user_ids('finance', volume['finance'])
+
+    def staff():
+        _insert(Teacher, [{'user_id': user_id, 'subject': rng.choice(SUBJECTS)} for user_id in teacher_users])
+        _insert(Finance, [{'user_id': user_id} for user_id in finance_users])
+        _insert(Parent, [{'user_id': user_id} for user_id in parent_users])
+        return len(teacher_users) + len(finance_users) + len(parent_users)
+    step('teachers, finance and parents', staff)
+
+    teacher_ids = db.session.scalars(select(Teacher.id).order_by(Teacher.id)).all()
+    parent_ids = dict(db.session.execute(select(Parent.user_id, Parent.id)).all())
+
+    def students():
+        numbers = Student.reserve_admission_numbers(n_students)
+        db.session.commit()
+        rows, family_of = [], []
+        for user_id, size in zip(parent_users, family_sizes):
+            family_of += [user_id] * size
+        for number, user_id in zip(numbers, family_of):
+            rows.append({'admission_number': number, 'name': _person(rng), 'class_name': rng.choice(CLASSES),
+                         'parent_id': parent_ids[user_id],
+                         'created_at': datetime.combine(today - timedelta(days=rng.randint(0, 730)), datetime.min.time())})
+        _insert(Student, rows)
+        return len(rows)
+    step('students', students)
+
+    student_ids = db.session.scalars(select(Student.id).order_by(Student.id)).all()
+
+    def parent_children():
+        # Parent accounts also carry child_id, used by the attendance view
+        first_child = dict(db.session.execute(
+            select(Parent.user_id, Student.id).join(Student, Student.parent_id == Parent.id).order_by(Student.id.desc())
+        ).all())
+        for start in range(0, len(parent_users), BATCH):
+            chunk = parent_users[start:start + BATCH]
+            db.session.execute(
+                update(User.__table__).where(User.id == bindparam('uid')).values(child_id=bindparam('cid')),
+                [{'uid': user_id, 'cid': first_child[user_id]} for user_id in chunk],
+            )
+            db.session.commit()
+        return len(parent_users)
+    step('parent child links', parent_children)
+
+    start_of_history = datetime.combine(today - timedelta(days=730), datetime.min.time())
+
+    def marks():
+        # At most one score per student, subject and test in a term, as the unique index requires
+        seen = set()
+        while len(seen) < volume['marks']:
+            created_at = start_of_history + timedelta(minutes=rng.randint(0, 730 * 24 * 60))
+            row = {'student_id': rng.choice(student_ids), 'teacher_id': rng.choice(teacher_ids),
+                   'subject': rng.choice(SUBJECTS), 'test_type': rng.choice(TEST_TYPES),
+                   'term': current_term(created_at), 'score': round(min(100.0, max(0.0, rng.gauss(62, 15))), 1),
+                   'created_at': created_at}
+            key = (row['student_id'], row['subject'], row['test_type'], row['term'])
+            if key not in seen:
+                seen.add(key)
+                yield row
+    step('marks', lambda: _stream(Mark, marks()))
+
+    def attendance():
+        # Every student has a status for each of the most recent school days
+        days = _school_days(max(1, volume['attendance'] // len(student_ids)), today)
+        for day in days:
+            for student_id in student_ids:
+                yield {'student_id': student_id, 'date': day, 'status': 'Absent' if rng.random() < 0.06 else 'Present'}
+    step('attendance', lambda: _stream(Attendance, attendance()))
+
+    def fees():
+        for student_id in student_ids:
+            for term in range(FEES_PER_STUDENT):
+                due = today - timedelta(days=120 * (FEES_PER_STUDENT - 1 - term) - 30)
+                amount = rng.choice([15000.0, 18000.0, 22500.0])
+                paid = amount if rng.random() < 0.7 else round(amount * rng.random(), -2)
+                yield {'student_id': student_id, 'amount_due': amount, 'amount_paid': paid,
+                       'due_date': due, 'status': 'Pending'}
+    step('fees', lambda: _stream(Fee, fees()))
+
+    def opening_payments():
+        # One ledger row per fee covering what the seed says was already paid
+        paid = select(Fee.id, Fee.student_id, Fee.amount_paid, literal('Opening balance'), literal(datetime.utcnow()))
+        result = db.session.execute(insert(Payment).from_select(
+            ['fee_id', 'student_id', 'amount', 'method', 'created_at'], paid.where(Fee.amount_paid != 0)))
+        db.session.commit()
+        return result.rowcount
+    step('payments', opening_payments)
+
+    def assignments():
+        for i in range(volume['assignments']):
+            yield {'title': f'{rng.choice(SUBJECTS)} exercise {i + 1}', 'description': 'Complete all questions.',
+                   'due_date': today + timedelta(days=rng.randint(-60, 30)), 'teacher_id': rng.choice(teacher_ids),
+                   'student_id': rng.choice(student_ids)}
+    step('assignments', lambda: _stream(Assignment, assignments()))
+
+    def remarks():
+        for _ in range(volume['remarks']):
+            yield {'student_id': rng.choice(student_ids), 'teacher_id': rng.choice(teacher_ids),
+                   'text': rng.choice(REMARKS), 'created_at': start_of_history + timedelta(days=rng.randint(0, 730))}
+    step('remarks', lambda: _stream(Remark, remarks()))
+
+    def reset_requests():
+        rows = [{'user_id': rng.choice(parent_users), 'reason': 'Forgot my password', 'created_at': datetime.utcnow()}
+                for _ in range(volume['reset_requests'])]
+        _insert(PasswordResetRequest, rows)
+        return len(rows)
+    step('password reset requests', reset_requests)
+
+    # Derived data the app normally maintains as it goes
+    step('fee statuses', lambda: sweep_fee_statuses(today).changed)
+    step('fee balances', rebuild_balances)
+    step('performance aggregates', rebuild_performance)
+    step('attendance rollups', rebuild_attendance_rollups)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier for every volume')
+    parser.add_argument('--seed', type=int, default=42, help='random seed, for repeatable data')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if db.session.scalar(select(User.id).limit(1)) is not None:
+            sys.exit('The database is not empty; point DATABASE_URL at a freshly migrated database.')
+        start = time.perf_counter()
+        seed(args.scale, args.seed)
+        print(f'Seeded in {time.perf_counter() - start:.0f}s.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db
+
+# Dialect-specific INSERT constructs that support ON CONFLICT
+_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def upsert(model, rows, index_elements, set_):
+    """Insert ``rows`` into ``model``'s table, updating on a unique conflict.
+
+    ``set_`` is a callable receiving the ``excluded`` pseudo-table and returning
+    the column -> expression mapping to apply when a row already exists. All rows
+    go to the database as a single executemany.
+    """
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    stmt = _INSERTS[dialect](model.__table__)
+    stmt = stmt.on_conflict_do_update(index_elements=index_elements, set_=set_(stmt.excluded))
+    db.session.execute(stmt, rows)
@@ -0,0 +1,239 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from flask import g, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, make_transient_to_detached
+from models import db, Counter, Student, Teacher, User
+
+try:
+    import redis
+except ImportError:  # Only needed for CACHE_BACKEND = 'redis'
+    redis = None
+
+_MISSING = object()
+GENERATION_PREFIX = 'cache:'  # Counter rows holding each namespace's generation
+
+
+class LRUBackend:
+    """In-process LRU store with a per-entry TTL."""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class RedisBackend:
+    """Store shared by every worker, via any client with Redis' get/set."""
+
+    def __init__(self, client, ttl=300):
+        self.client = client
+        self.ttl = ttl
+
+    def get(self, key):
+        raw = self.client.get(key)
+        return _MISSING if raw is None else pickle.loads(raw)
+
+    def set(self, key, value):
+        self.client.set(key, pickle.dumps(value), ex=self.ttl)
+
+
+class LocalRedis:
+    """Minimal in-memory stand-in for a Redis client (development and single-process use)."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (item[1] is not None and item[1] < time.monotonic()):
+                return None
+            return item[0]
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+
+
+class ReadThroughCache:
+    """Namespaced read-through cache.
+
+    Each namespace has a generation that is part of every key, so
+    invalidating a namespace is a single increment: stale entries are simply
+    never read again and age out. The generations live in Counter rows,
+    bumped in the same transaction as the write that made them stale, and are
+    read once per request, so a commit in any worker invalidates the entries
+    of every worker from its next request on, whatever the backend.
+    """
+
+    def __init__(self):
+        self.backend = LRUBackend()
+        self.hits = {}
+        self.misses = {}
+
+    def init_app(self, app):
+        ttl = app.config.get('CACHE_TTL', 300)
+        kind = app.config.get('CACHE_BACKEND', 'memory')
+        if kind == 'redis':
+            if redis is None:
+                raise RuntimeError("CACHE_BACKEND = 'redis' needs the redis package")
+            self.backend = RedisBackend(redis.Redis.from_url(app.config['CACHE_REDIS_URL']), ttl)
+        elif kind == 'local-redis':
+            self.backend = RedisBackend(LocalRedis(), ttl)
+        else:
+            self.backend = LRUBackend(app.config.get('CACHE_MAXSIZE', 1024), ttl)
+
+    def generation(self, namespace):
+        """The namespace's current generation; usable as a version of the data cached in it."""
+        return self._generations().get(namespace, 0)
+
+    def _generations(self):
+        # One query per request (per app context) for every namespace's generation
+        if has_app_context() and '_cache_generations' in g:
+            return g._cache_generations
+        rows = db.session.execute(
+            select(Counter.name, Counter.value)
+            .where(Counter.name > GENERATION_PREFIX, Counter.name < GENERATION_PREFIX[:-1] + ';')  # ';' follows ':'
+        )
+        generations = {name[len(GENERATION_PREFIX):]: value for name, value in rows}
+        if has_app_context():
+            g._cache_generations = generations
+        return generations
+
+    def get_or_load(self, namespace, key, loader):
+        full_key = f'{namespace}:{self.generation(namespace)}:{key}'
+        value = self.backend.get(full_key)
+        if value is _MISSING:
+            self.misses[namespace] = self.misses.get(namespace, 0) + 1
+            value = loader()
+            self.backend.set(full_key, value)
+        else:
+            self.hits[namespace] = self.hits.get(namespace, 0) + 1
+        return value
+
+    def invalidate(self, *namespaces, session=None):
+        """Bump the generations of ``namespaces`` in the current transaction; they apply once it commits."""
+        for namespace in sorted(namespaces):  # A fixed order, so concurrent writers lock the rows alike
+            Counter.allocate(GENERATION_PREFIX + namespace, session=session)
+
+    def forget_generations(self):
+        # The next read in this request fetches them again, e.g. after a commit bumped some
+        if has_app_context():
+            g.pop('_cache_generations', None)
+
+    def stats(self):
+        namespaces = sorted(set(self.hits) | set(self.misses))
+        return {
+            namespace: {'hits': self.hits.get(namespace, 0), 'misses': self.misses.get(namespace, 0)}
+            for namespace in namespaces
+        }
+
+
+cache = ReadThroughCache()
+
+# Namespaces whose cached data is derived from each model
+MODEL_NAMESPACES = {
+    Student: ('students',),
+    Teacher: ('teachers',),
+    User: ('users',),
+}
+
+
+def mark_stale(session, *namespaces):
+    """Invalidate ``namespaces`` when ``session`` commits (for writes that bypass the ORM)."""
+    session.info.setdefault('stale_namespaces', set()).update(namespaces)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_stale_namespaces(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        for model, namespaces in MODEL_NAMESPACES.items():
+            if isinstance(obj, model):
+                mark_stale(session, *namespaces)
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_stale_namespaces(session):
+    session.flush()  # The final flush may mark more namespaces stale
+    stale = session.info.pop('stale_namespaces', None)
+    if stale:
+        cache.invalidate(*stale, session=session)
+        session.info['bumped_namespaces'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _forget_bumped_generations(session):
+    if session.info.pop('bumped_namespaces', None):
+        cache.forget_generations()
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _discard_stale_namespaces(session, transaction):
+    # Only the outermost transaction; savepoints roll back without ending it
+    if transaction.parent is None:
+        session.info.pop('stale_namespaces', None)
+        session.info.pop('bumped_namespaces', None)
+
+
+# Cached reference data
+
+def students_version():
+    """Moves on with every commit that changes a student, in any worker (for keying cached fragments)."""
+    return cache.generation('students')
+
+
+def cached_class_names():
+    def load():
+        rows = db.session.query(Student.class_name).distinct().order_by(Student.class_name)
+        return [name for (name,) in rows]
+    return cache.get_or_load('students', 'class_names', load)
+
+
+def cached_subject_names():
+    """Every subject taught, from the teachers' records."""
+    def load():
+        rows = db.session.query(Teacher.subject).distinct().order_by(Teacher.subject)
+        return [name for (name,) in rows]
+    return cache.get_or_load('teachers', 'subject_names', load)
+
+
+# Everything but the password hash, which is loaded from the database on demand
+USER_CACHED_COLUMNS = ('id', 'username', 'role', 'child_id')
+
+
+def cached_user(user_id):
+    """The user as a session-attached instance, rebuilt from cache without a query."""
+    def load():
+        row = db.session.query(*(getattr(User, c) for c in USER_CACHED_COLUMNS)).filter(User.id == user_id).first()
+        return dict(row._mapping) if row else None
+
+    data = cache.get_or_load('users', user_id, load)
+    if data is None:
+        return None
+    user = User(**data)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
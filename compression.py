@@ -0,0 +1,69 @@
+import gzip
+import zlib
+from flask import request
+
+DEFAULT_MIMETYPES = ('text/html', 'application/json', 'text/csv', 'text/plain')
+STREAM_FLUSH_BYTES = 64 * 1024  # A streamed response is flushed to the client after this much input
+
+
+class Compressor:
+    """gzip for HTML, JSON and CSV responses the client accepts it for.
+
+    Responses that already carry a Content-Encoding (the API's own gzip,
+    precompressed static files) and files from send_file are left alone.
+    Streamed responses such as the CSV exports are compressed chunk by chunk,
+    so they stay streamed; others only from COMPRESS_MIN_BYTES up.
+    """
+
+    def init_app(self, app):
+        self.enabled = app.config.get('COMPRESS_RESPONSES', True)
+        self.min_bytes = app.config.get('COMPRESS_MIN_BYTES', 1024)
+        self.level = app.config.get('COMPRESS_LEVEL', 6)
+        self.mimetypes = set(app.config.get('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES))
+        app.after_request(self._compress)
+
+    def _compress(self, response):
+        if (not self.enabled or response.status_code < 200 or response.status_code in (204, 304)
+                or response.direct_passthrough or 'Content-Encoding' in response.headers
+                or response.mimetype not in self.mimetypes):
+            return response
+        response.vary.add('Accept-Encoding')
+        if 'gzip' not in request.accept_encodings:
+            return response
+
+        if response.is_streamed:
+            response.response = self._stream(response.response)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_bytes:
+                return response
+            response.set_data(gzip.compress(data, self.level))
+        response.headers['Content-Encoding'] = 'gzip'
+
+        # The compressed bytes differ, so a strong validator becomes a weak one
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _stream(self, chunks):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip framing
+        pending = 0
+        try:
+            for chunk in chunks:
+                chunk = chunk.encode() if isinstance(chunk, str) else chunk
+                pending += len(chunk)
+                data = compressor.compress(chunk)
+                if pending >= STREAM_FLUSH_BYTES:
+                    data += compressor.flush(zlib.Z_SYNC_FLUSH)
+                    pending = 0
+                if data:
+                    yield data
+            yield compressor.flush()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+
+compressor = Compressor()
@@ -0,0 +1,101 @@
+from functools import partial, wraps
+from flask import current_app, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+READ_BIND = 'readonly'
+
+
+class RoutingSession(Session):
+    """Session that sends everything to the read-only engine once marked ``read_only``."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get('read_only'):
+            engine = self._db.engines.get(READ_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _normalise_url(url):
+    # Some hosts still hand out the scheme SQLAlchemy dropped in 1.4
+    return 'postgresql://' + url[len('postgres://'):] if url.startswith('postgres://') else url
+
+
+def _postgresql_options(config, read_only=False, pools=1):
+    # This pool's share of the server's connections: one worker's share, split
+    # across the worker's pools on that server
+    share = max(2, config['DB_MAX_CONNECTIONS'] // max(1, config['WEB_CONCURRENCY']) // pools)
+    pool_size = int(config['DB_POOL_SIZE'] or max(1, share * 2 // 3))
+    max_overflow = int(config['DB_MAX_OVERFLOW'] if config['DB_MAX_OVERFLOW'] is not None else share - pool_size)
+    options = f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"
+    if read_only:
+        options += ' -c default_transaction_read_only=on'
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max(0, max_overflow),
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+        'connect_args': {'options': options, 'application_name': 'school-management'},
+    }
+
+
+def engine_options(url, config, read_only=False, pools=1):
+    """SQLAlchemy engine options for the profile matching ``url``."""
+    if url.startswith('postgresql'):
+        return _postgresql_options(config, read_only, pools)
+    return {}
+
+
+def _sqlite_pragmas(config, read_only, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')  # Readers and the writer no longer block each other
+    cursor.execute('PRAGMA synchronous=NORMAL')  # Safe with WAL; fsync at checkpoints only
+    cursor.execute(f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}")
+    cursor.execute(f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}")
+    cursor.execute(f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KIB'])}")
+    if read_only:
+        cursor.execute('PRAGMA query_only=ON')
+    cursor.close()
+
+
+def init_app(app, db):
+    """Configure the primary and read-only engines from ``app.config`` and initialise ``db``.
+
+    The read-only engine is a second pool on the same database (or on
+    DATABASE_READ_URL), so long dashboard reads never hold a connection the
+    writers need, and cannot write by mistake.
+    """
+    config = app.config
+    url = _normalise_url(config['SQLALCHEMY_DATABASE_URI'])
+    read_url = _normalise_url(config.get('DATABASE_READ_URL') or url)
+    pools = 2 if read_url == url else 1
+    config['SQLALCHEMY_DATABASE_URI'] = url
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = {**engine_options(url, config, pools=pools), **config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+    config.setdefault('SQLALCHEMY_BINDS', {})[READ_BIND] = {'url': read_url, **engine_options(read_url, config, True, pools)}
+    db.init_app(app)
+
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', partial(_sqlite_pragmas, config, key == READ_BIND))
+
+
+def use_read_only_engine():
+    """Send the rest of this request's queries to the read-only engine.
+
+    Lasts until the session is removed at the end of the request, so streamed
+    responses keep reading from the same engine.
+    """
+    current_app.extensions['sqlalchemy'].session.info['read_only'] = True
+
+
+def read_only(view):
+    """Serve GET requests of ``view`` from the read-only engine."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method == 'GET':
+            use_read_only_engine()
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,133 @@
+import csv
+import io
+import tempfile
+from datetime import date
+from sqlalchemy import select
+from models import db, Student, Fee, Mark, Attendance
+
+try:
+    import openpyxl
+except ImportError:  # XLSX exports are optional
+    openpyxl = None
+
+YIELD_PER = 1000  # Rows fetched per round trip (a server-side cursor on PostgreSQL)
+
+# School terms as (first month, last month)
+TERMS = {1: (1, 4), 2: (5, 8), 3: (9, 12)}
+
+
+class ExportError(Exception):
+    pass
+
+
+def term_range(term):
+    """``'2024-2'`` -> (first day, first day after) of term 2 of 2024, or ``None``."""
+    try:
+        year, number = (int(part) for part in term.split('-'))
+        first_month, last_month = TERMS[number]
+    except (AttributeError, ValueError, KeyError):
+        return None
+    end = date(year + 1, 1, 1) if last_month == 12 else date(year, last_month + 1, 1)
+    return date(year, first_month, 1), end
+
+
+def _in_term(column, term):
+    start, end = term_range(term)
+    return (column >= start) & (column < end)
+
+
+def fees_query(filters):
+    stmt = (
+        select(Student.admission_number, Student.name, Student.class_name,
+               Fee.amount_due, Fee.amount_paid, Fee.status, Fee.due_date)
+        .join(Student, Fee.student_id == Student.id)
+        .order_by(Fee.id)
+    )
+    if filters.get('status'):
+        stmt = stmt.where(Fee.status == filters['status'])
+    if filters.get('term'):
+        stmt = stmt.where(_in_term(Fee.due_date, filters['term']))
+    return stmt
+
+
+def marks_query(filters):
+    stmt = (
+        select(Student.admission_number, Student.name, Student.class_name,
+               Mark.subject, Mark.test_type, Mark.score, Mark.created_at)
+        .join(Student, Mark.student_id == Student.id)
+        .order_by(Mark.id)
+    )
+    if filters.get('test_type'):
+        stmt = stmt.where(Mark.test_type == filters['test_type'])
+    if filters.get('subject'):
+        stmt = stmt.where(Mark.subject == filters['subject'])
+    if filters.get('term'):
+        stmt = stmt.where(Mark.term == filters['term'])  # The term a mark was entered for, not when
+    return stmt
+
+
+def attendance_query(filters):
+    stmt = (
+        select(Student.admission_number, Student.name, Student.class_name, Attendance.date, Attendance.status)
+        .join(Student, Attendance.student_id == Student.id)
+        .order_by(Attendance.id)
+    )
+    if filters.get('status'):
+        stmt = stmt.where(Attendance.status == filters['status'])
+    if filters.get('term'):
+        stmt = stmt.where(_in_term(Attendance.date, filters['term']))
+    return stmt
+
+
+# kind -> (column headers, query builder, roles allowed to export it)
+EXPORTS = {
+    'fees': (['Admission Number', 'Name', 'Class', 'Amount Due', 'Amount Paid', 'Status', 'Due Date'],
+             fees_query, {'Finance', 'Admin'}),
+    'marks': (['Admission Number', 'Name', 'Class', 'Subject', 'Test Type', 'Score', 'Recorded At'],
+              marks_query, {'Teacher', 'Admin'}),
+    'attendance': (['Admission Number', 'Name', 'Class', 'Date', 'Status'],
+                   attendance_query, {'Teacher', 'Admin'}),
+}
+
+
+def export_rows(kind, filters):
+    """Stream result rows for ``kind`` without materialising the result set."""
+    _, build, _ = EXPORTS[kind]
+    stmt = build(filters)
+    if filters.get('class_name'):
+        stmt = stmt.where(Student.class_name == filters['class_name'])
+    return db.session.execute(stmt.execution_options(yield_per=YIELD_PER))
+
+
+def iter_csv(kind, filters, chunk_rows=500):
+    """Yield the export as CSV text, a chunk of rows at a time."""
+    headers = EXPORTS[kind][0]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for count, row in enumerate(export_rows(kind, filters), start=1):
+        writer.writerow(row)
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def write_xlsx(kind, filters):
+    """Write the export to a temporary XLSX file and return it, rewound.
+
+    The workbook is created in write_only mode so rows are flushed to disk as
+    they are appended rather than held in memory.
+    """
+    if openpyxl is None:
+        raise ExportError('XLSX exports need the openpyxl package; use CSV instead.')
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(kind.capitalize())
+    sheet.append(EXPORTS[kind][0])
+    for row in export_rows(kind, filters):
+        sheet.append(list(row))
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
@@ -0,0 +1,107 @@
+from datetime import datetime
+from functools import cached_property
+from jinja2.utils import htmlsafe_json_dumps
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.orm import Session, selectinload
+from models import db, Student, Parent, Assignment, Remark, Fee, Mark
+
+# Models shown on the parent dashboard, all linked to a student by student_id
+FAMILY_MODELS = (Assignment, Remark, Fee, Mark)
+
+
+def _bump(parent_ids, session=None):
+    session = session or db.session
+    stmt = (
+        update(Parent.__table__)
+        .where(Parent.id.in_(parent_ids))
+        .values(data_version=Parent.data_version + 1, data_updated_at=datetime.utcnow())
+    )
+    session.connection().execute(stmt)
+
+
+def bump_family_versions(student_ids, session=None):
+    """Bump the data version of every family with a child in ``student_ids``.
+
+    ``student_ids`` may be a list or a SELECT of student ids, so bulk writes can
+    pass the same condition they used for their own UPDATE.
+    """
+    _bump(select(Student.parent_id).where(Student.id.in_(student_ids)), session)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_family_changes(session, flush_context):
+    # ORM writes to a family's rows bump its version in the same transaction
+    student_ids, parent_ids = set(), set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, FAMILY_MODELS):
+            history = inspect(obj).attrs.student_id.history
+            student_ids.update(i for i in (*history.unchanged, *history.added, *history.deleted) if i)
+        elif isinstance(obj, Student):
+            history = inspect(obj).attrs.parent_id.history
+            parent_ids.update(i for i in (*history.unchanged, *history.added, *history.deleted) if i)
+
+    if student_ids:
+        bump_family_versions(list(student_ids), session)
+    if parent_ids:
+        _bump(list(parent_ids), session)
+
+
+def load_family(parent):
+    """The parent's students with everything the dashboard shows, in five queries."""
+    return (
+        Student.query.filter_by(parent_id=parent.id)
+        .options(
+            selectinload(Student.assignments),
+            selectinload(Student.remarks),
+            selectinload(Student.fees),
+            selectinload(Student.marks),
+        )
+        .order_by(Student.id)
+        .all()
+    )
+
+
+class FamilyRecords:
+    """What the parent dashboard shows, loaded on first use.
+
+    A dashboard served from the fragment cache never touches it, so nothing
+    is queried.
+    """
+
+    def __init__(self, parent):
+        self.parent = parent
+
+    @property
+    def version(self):
+        """Changes whenever anything shown changes; keys the page's ETag and cached fragment."""
+        return f'{self.parent.id}-v{self.parent.data_version}' if self.parent else 'none'
+
+    @cached_property
+    def students(self):
+        return load_family(self.parent) if self.parent else []
+
+    @cached_property
+    def assignments(self):
+        return [a for student in self.students for a in student.assignments]
+
+    @cached_property
+    def remarks(self):
+        return [r for student in self.students for r in student.remarks]
+
+    @cached_property
+    def fees(self):
+        return [f for student in self.students for f in student.fees]
+
+    @cached_property
+    def marks(self):
+        return [m for student in self.students for m in student.marks]
+
+    @cached_property
+    def chart_json(self):
+        """Chart.js labels and scores as one JSON blob, safe to emit inside <script>."""
+        return htmlsafe_json_dumps({
+            'labels': [mark.subject for mark in self.marks],
+            'scores': [mark.score for mark in self.marks],
+        })
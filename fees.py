@@ -0,0 +1,174 @@
+import logging
+import time
+from datetime import date, datetime
+from collections import defaultdict
+from sqlalchemy import event, func, insert, select, update
+from bulk import upsert
+from family import bump_family_versions
+from jobs import task
+from models import db, Fee, FeeSweep, Parent, Payment, Student, StudentBalance, User
+
+logger = logging.getLogger(__name__)
+reminder_log = logging.getLogger('fees.reminders')  # Where reminders are delivered; route it to mail/SMS
+
+PAYMENT_METHODS = ('Cash', 'M-Pesa', 'Bank', 'Cheque')
+
+
+def _set_status(status, *conditions):
+    # Only touch rows whose status actually changes; NULL counts as different
+    conditions = (*conditions, Fee.status.is_distinct_from(status))
+    bump_family_versions(select(Fee.student_id).where(*conditions))  # Parents see fee statuses
+    stmt = update(Fee.__table__).where(*conditions).values(status=status, version=Fee.version + 1)
+    return db.session.execute(stmt).rowcount
+
+
+@task('fees.sweep', every='FEE_SWEEP_INTERVAL')
+def sweep_fee_statuses(today=None):
+    """Recompute every fee's status with three set-based UPDATEs and record the run.
+
+    Paid: amount_paid covers amount_due. Otherwise Overdue once due_date has
+    passed, else Pending. The due_date conditions are range scans on its index.
+    """
+    today = today or date.today()
+    started = time.perf_counter()
+    paid = func.coalesce(Fee.amount_paid, 0)
+
+    sweep = FeeSweep(
+        ran_at=datetime.utcnow(),
+        marked_paid=_set_status('Paid', paid >= Fee.amount_due),
+        marked_overdue=_set_status('Overdue', Fee.due_date < today, paid < Fee.amount_due),
+        marked_pending=_set_status('Pending', Fee.due_date >= today, paid < Fee.amount_due),
+    )
+    sweep.duration_ms = (time.perf_counter() - started) * 1000
+    db.session.add(sweep)
+    db.session.commit()
+    logger.info('Fee sweep: %d paid, %d overdue, %d pending in %.1f ms',
+                sweep.marked_paid, sweep.marked_overdue, sweep.marked_pending, sweep.duration_ms)
+    return sweep
+
+
+# Payments and balances
+
+class FeeConflict(Exception):
+    """The fee changed after the form that edits it was loaded."""
+
+    def __init__(self, fee):
+        super().__init__(f'Fee {fee.id} has changed since it was loaded.')
+        self.fee = fee
+
+
+def fee_status(amount_due, amount_paid, due_date, today=None):
+    """The status the sweep gives a fee: Paid, else Overdue once due, else Pending."""
+    if (amount_paid or 0) >= amount_due:
+        return 'Paid'
+    return 'Overdue' if due_date < (today or date.today()) else 'Pending'
+
+
+def _add_to_balance(student_id, due=0.0, paid=0.0):
+    table = StudentBalance.__table__
+
+    def set_(excluded):
+        return {
+            'total_due': table.c.total_due + excluded.total_due,
+            'total_paid': table.c.total_paid + excluded.total_paid,
+            'balance': table.c.balance + excluded.balance,
+        }
+    upsert(StudentBalance, [{'student_id': student_id, 'total_due': due, 'total_paid': paid, 'balance': due - paid}],
+           index_elements=['student_id'], set_=set_)
+
+
+def _check_version(fee, version):
+    # ``version`` is the one the form was rendered with, when it sent one
+    if version is not None and version != fee.version:
+        raise FeeConflict(fee)
+
+
+def add_fee(student_id, amount_due, due_date, paid=0.0, method='Cash', reference=None, user_id=None):
+    """Create a fee, with an optional first payment, and add it to the student's balance. The caller commits."""
+    fee = Fee(student_id=student_id, amount_due=amount_due, amount_paid=0.0, due_date=due_date,
+              status=fee_status(amount_due, 0.0, due_date))
+    db.session.add(fee)
+    _add_to_balance(student_id, due=amount_due)
+    if paid:
+        db.session.flush()
+        record_payment(fee, paid, method, reference, user_id)
+    return fee
+
+
+def record_payment(fee, amount, method, reference=None, user_id=None, version=None):
+    """Append a payment to the ledger and apply it to the fee and the student's balance.
+
+    Nothing is overwritten: the fee's amount_paid grows by ``amount`` (negative
+    for corrections). Raises FeeConflict when ``version`` is stale; a change
+    committed by someone else after the fee was loaded raises StaleDataError
+    at flush instead. The caller commits, or rolls back on either.
+    """
+    _check_version(fee, version)
+    payment = Payment(fee_id=fee.id, student_id=fee.student_id, amount=amount, method=method,
+                      reference=reference or None, recorded_by=user_id)
+    db.session.add(payment)
+    fee.amount_paid = (fee.amount_paid or 0) + amount
+    fee.status = fee_status(fee.amount_due, fee.amount_paid, fee.due_date)
+    _add_to_balance(fee.student_id, paid=amount)
+    return payment
+
+
+def change_fee(fee, amount_due, due_date, version=None):
+    """Change what a fee asks for and when, under the same version check as record_payment."""
+    _check_version(fee, version)
+    _add_to_balance(fee.student_id, due=amount_due - fee.amount_due)
+    fee.amount_due, fee.due_date = amount_due, due_date
+    fee.status = fee_status(fee.amount_due, fee.amount_paid, fee.due_date)
+    return fee
+
+
+def balances(student_ids):
+    """``{student_id: balance}`` for the given students; those without fees are left out."""
+    rows = db.session.execute(
+        select(StudentBalance.student_id, StudentBalance.balance).where(StudentBalance.student_id.in_(student_ids))
+    )
+    return dict(rows.all())
+
+
+@task('fees.rebuild_balances', timeout=3600)
+def rebuild_balances():
+    """Recompute every student's balance from the Fee table (after bulk loads or repairs); returns the row count."""
+    db.session.execute(StudentBalance.__table__.delete())
+    due, paid = func.sum(Fee.amount_due), func.sum(func.coalesce(Fee.amount_paid, 0))
+    result = db.session.execute(insert(StudentBalance).from_select(
+        ['student_id', 'total_due', 'total_paid', 'balance'],
+        select(Fee.student_id, due, paid, due - paid).group_by(Fee.student_id),
+    ))
+    db.session.commit()
+    return result.rowcount
+
+
+@event.listens_for(Payment, 'before_update')
+@event.listens_for(Payment, 'before_delete')
+def _payments_are_immutable(mapper, connection, target):
+    raise ValueError('Payments are never changed or deleted; record a correcting payment instead.')
+
+
+@task('fees.remind', every='FEE_REMINDER_INTERVAL')
+def send_fee_reminders():
+    """Send each parent one reminder listing their children's overdue fees.
+
+    Relies on the statuses the sweep maintains. Returns the number of parents reminded.
+    """
+    outstanding = Fee.amount_due - func.coalesce(Fee.amount_paid, 0)
+    rows = db.session.execute(
+        select(Parent.id, User.username, Student.name, Fee.id, outstanding, Fee.due_date)
+        .join(Student, Fee.student_id == Student.id)
+        .join(Parent, Student.parent_id == Parent.id)
+        .join(User, Parent.user_id == User.id)
+        .where(Fee.status == 'Overdue')
+        .order_by(Parent.id, Fee.due_date)
+    )
+    families = defaultdict(list)
+    for parent_id, username, student_name, fee_id, amount, due_date in rows:
+        families[parent_id, username].append((student_name, fee_id, amount, due_date))
+    for (parent_id, username), fees in families.items():
+        lines = '; '.join(f'{name}: {amount:.2f} due {due:%Y-%m-%d}' for name, _, amount, due in fees)
+        reminder_log.info('Fee reminder for %s (parent %d): %s', username, parent_id, lines)
+    logger.info('Fee reminders sent to %d parents', len(families))
+    return len(families)
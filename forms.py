@@ -1,5 +1,6 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SelectField, SubmitField
+from wtforms import StringField, PasswordField, SubmitField, IntegerField
+from wtforms.widgets import HiddenInput
 from wtforms.validators import DataRequired, Length
 
 class LoginForm(FlaskForm):
@@ -21,7 +22,7 @@ class CreateTeacherForm(FlaskForm):
 class CreateParentForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=3, max=25)])
     password = PasswordField('Password', validators=[DataRequired(), Length(min=6, max=35)])
-    child_id = SelectField('Child', coerce=int)  # Dynamic field to select a student
+    child_id = IntegerField('Child', widget=HiddenInput(), validators=[DataRequired(message='Choose a child from the list.')])  # Filled in by the student search picker
     submit = SubmitField('Create Parent')
 
 class CreateFinanceForm(FlaskForm):
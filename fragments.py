@@ -0,0 +1,66 @@
+import os
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from cache import cache
+
+NAMESPACE = 'fragments'
+
+
+class FragmentCacheExtension(Extension):
+    """``{% cache 'name', key, ... %} ... {% endcache %}`` renders the block once per key.
+
+    The keys should be the versions of the data the block shows (a Counter, a
+    family's data_version, a cache generation): when any of them moves on the
+    block is rendered afresh under the new key and the old entry ages out. A
+    hit skips the block entirely, so values it reads should be loaded lazily.
+    """
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_caching=True)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        keys = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            keys.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        call = self.call_method('_render', [nodes.List(keys)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, keys, caller):
+        if not self.environment.fragment_caching:
+            return caller()
+        key = ':'.join(str(key) for key in keys)
+        return Markup(cache.get_or_load(NAMESPACE, key, lambda: str(caller())))
+
+
+class TemplateCaching:
+    """Fragment caching plus a compiled-template cache on disk.
+
+    Jinja compiles each template to Python bytecode on first use in every
+    worker; with TEMPLATE_CACHE_DIR the bytecode outlives the process, so
+    restarted workers (and ``flask compile-templates`` at deploy) skip the
+    compile step.
+    """
+
+    def init_app(self, app):
+        env = app.jinja_env
+        env.add_extension(FragmentCacheExtension)
+        env.fragment_caching = app.config.get('TEMPLATE_FRAGMENT_CACHE', True)
+        directory = app.config.get('TEMPLATE_CACHE_DIR') or os.path.join(app.instance_path, 'jinja')
+        os.makedirs(directory, exist_ok=True)
+        env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+    def compile_all(self, app):
+        """Load every template once, filling the bytecode cache. Returns the template names."""
+        names = app.jinja_env.list_templates()
+        for name in names:
+            app.jinja_env.get_template(name)
+        return names
+
+
+template_caching = TemplateCaching()
@@ -0,0 +1,139 @@
+import csv
+import io
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.datastructures import MultiDict
+from cache import mark_stale
+from forms import CreateStudentForm
+from models import db, Student
+
+try:
+    import openpyxl
+except ImportError:  # XLSX imports are optional
+    openpyxl = None
+
+BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+# Accepted spellings of each column header
+HEADER_ALIASES = {
+    'name': 'name',
+    'student name': 'name',
+    'student_name': 'name',
+    'class': 'class_name',
+    'class name': 'class_name',
+    'class_name': 'class_name',
+}
+
+
+class StudentImportError(Exception):
+    """The upload as a whole cannot be read (bad type, missing columns...)."""
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []  # (row number, message), capped at MAX_REPORTED_ERRORS
+
+    def add_error(self, row_number, message):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, message))
+
+
+def _normalise_header(header):
+    columns = [HEADER_ALIASES.get(str(h or '').strip().lower()) for h in header]
+    missing = {'name', 'class_name'} - set(columns)
+    if missing:
+        raise StudentImportError(f"Missing column(s): {', '.join(sorted(missing))}")
+    return columns
+
+
+def _iter_csv(stream):
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    try:
+        yield from reader
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise StudentImportError(f'Could not read the CSV file: {e}')
+
+
+def _iter_xlsx(stream):
+    if openpyxl is None:
+        raise StudentImportError('XLSX imports need the openpyxl package; upload a CSV instead.')
+    # read_only mode streams rows from the sheet instead of loading the workbook
+    try:
+        workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    except Exception as e:
+        raise StudentImportError(f'Could not read the XLSX file: {e}')
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def iter_student_rows(upload):
+    """Yield ``(row_number, {'name': ..., 'class_name': ...})`` from an uploaded CSV or XLSX file."""
+    filename = (upload.filename or '').lower()
+    if filename.endswith('.csv'):
+        rows = _iter_csv(upload.stream)
+    elif filename.endswith('.xlsx'):
+        rows = _iter_xlsx(upload.stream)
+    else:
+        raise StudentImportError('Please upload a .csv or .xlsx file.')
+
+    header = next(rows, None)
+    if header is None:
+        raise StudentImportError('The file is empty.')
+    columns = _normalise_header(header)
+
+    for row_number, values in enumerate(rows, start=2):
+        if not any(v not in (None, '') for v in values):
+            continue  # Skip blank lines
+        record = {}
+        for column, value in zip(columns, values):
+            if column:
+                record[column] = '' if value is None else str(value).strip()
+        yield row_number, record
+
+
+def _insert_batch(batch, result):
+    numbers = Student.reserve_admission_numbers(len(batch))
+    rows = [
+        {'name': record['name'], 'class_name': record['class_name'], 'admission_number': number}
+        for (_, record), number in zip(batch, numbers)
+    ]
+    try:
+        db.session.execute(insert(Student), rows)
+        mark_stale(db.session, 'students')  # Core inserts bypass the ORM change tracking
+        db.session.commit()
+        result.imported += len(rows)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        first, last = batch[0][0], batch[-1][0]
+        result.failed += len(batch)
+        result.add_error(first, f'Rows {first}-{last} were not saved: {e.__class__.__name__}')
+
+
+def import_students(upload, batch_size=BATCH_SIZE):
+    """Validate and insert students from ``upload`` in batched transactions.
+
+    Rows are read lazily and only one batch is held in memory at a time. Invalid
+    rows are reported individually and do not stop the rest of the file.
+    """
+    result = ImportResult()
+    batch = []
+    for row_number, record in iter_student_rows(upload):
+        form = CreateStudentForm(formdata=MultiDict(record), meta={'csrf': False})
+        if not form.validate():
+            result.failed += 1
+            for field, messages in form.errors.items():
+                for message in messages:
+                    result.add_error(row_number, f'{getattr(form, field).label.text}: {message}')
+            continue
+        batch.append((row_number, record))
+        if len(batch) >= batch_size:
+            _insert_batch(batch, result)
+            batch = []
+    if batch:
+        _insert_batch(batch, result)
+    return result
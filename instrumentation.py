@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+from flask import g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+
+slow_query_log = logging.getLogger('school.slow_queries')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+# Server-Timing entries besides db and total, shown when the request used them
+TIMINGS = (('tpl', 'Templates'), ('hash', 'Password hashing'))
+
+
+def record_timing(name, seconds):
+    """Add ``seconds`` to the current request's ``name`` timing (no-op outside a request)."""
+    if has_request_context():
+        timings = g.setdefault('timings', {})
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}  # labels -> [bucket counts..., count, sum]
+
+    def observe(self, labels, value):
+        series = self.series.setdefault(labels, [0] * (len(self.buckets) + 2))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self, label_names):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, series in sorted(self.series.items()):
+            base = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(label_names, labels))
+            for bound, bucket_count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series[-2]}')
+            lines.append(f'{self.name}_count{{{base}}} {series[-2]}')
+            lines.append(f'{self.name}_sum{{{base}}} {series[-1]:.6f}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Instrumentation:
+    """Per-request SQL, template and hashing timings.
+
+    Each response gets a Server-Timing header, statements slower than
+    SLOW_QUERY_MS are logged with their endpoint, and per-endpoint histograms
+    are kept for the Prometheus endpoint. Metrics are per process, so with
+    several gunicorn workers each one reports its own.
+    """
+
+    LABELS = ('endpoint', 'method')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.duration = Histogram('school_request_duration_seconds', 'Time to build the response.', DURATION_BUCKETS)
+        self.db_time = Histogram('school_request_db_seconds', 'Time spent in SQL statements per request.', DURATION_BUCKETS)
+        self.template_time = Histogram('school_request_template_seconds', 'Time spent rendering templates per request.', DURATION_BUCKETS)
+        self.queries = Histogram('school_request_queries', 'SQL statements per request.', QUERY_BUCKETS)
+        self.slow_queries = {}  # endpoint -> count
+
+    def init_app(self, app, db):
+        self.slow_query_seconds = app.config.get('SLOW_QUERY_MS', 200) / 1000
+        self.server_timing = app.config.get('SERVER_TIMING', True)
+        if app.config.get('SLOW_QUERY_LOG'):
+            handler = logging.FileHandler(app.config['SLOW_QUERY_LOG'])
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            slow_query_log.addHandler(handler)
+            slow_query_log.setLevel(logging.INFO)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # On the statement's own context: a statement that fails never reaches the
+        # after hook, and a per-connection stack would then time later ones wrongly
+        context._query_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_start
+        if not has_request_context():
+            return
+        g.query_count = g.get('query_count', 0) + 1
+        record_timing('db', elapsed)
+        if elapsed >= self.slow_query_seconds:
+            endpoint = request.endpoint or request.path
+            with self._lock:
+                self.slow_queries[endpoint] = self.slow_queries.get(endpoint, 0) + 1
+            slow_query_log.warning('%.1f ms %s %s: %s', elapsed * 1000, request.method, endpoint, ' '.join(statement.split()))
+
+    def _before_render(self, app, template, context, **extra):
+        g.setdefault('template_starts', []).append(time.perf_counter())
+
+    def _after_render(self, app, template, context, **extra):
+        starts = g.get('template_starts')
+        if starts:
+            record_timing('tpl', time.perf_counter() - starts.pop())
+
+    def _start_request(self):
+        g.request_start = time.perf_counter()
+
+    def _finish_request(self, response):
+        start = g.get('request_start')
+        if start is None:
+            return response
+        total = time.perf_counter() - start
+        timings = g.get('timings', {})
+        query_count = g.get('query_count', 0)
+
+        labels = (request.endpoint or 'unknown', request.method)
+        with self._lock:
+            self.duration.observe(labels, total)
+            self.db_time.observe(labels, timings.get('db', 0.0))
+            self.template_time.observe(labels, timings.get('tpl', 0.0))
+            self.queries.observe(labels, query_count)
+
+        if self.server_timing:
+            entries = [f'db;dur={timings.get("db", 0.0) * 1000:.1f};desc="{query_count} queries"']
+            for name, description in TIMINGS:
+                if name in timings:
+                    entries.append(f'{name};dur={timings[name] * 1000:.1f};desc="{description}"')
+            entries.append(f'total;dur={total * 1000:.1f}')
+            response.headers['Server-Timing'] = ', '.join(entries)
+        return response
+
+    def render_metrics(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            lines = []
+            for histogram in (self.duration, self.db_time, self.template_time, self.queries):
+                lines += histogram.render(self.LABELS)
+            lines += ['# HELP school_slow_queries_total Statements slower than SLOW_QUERY_MS.',
+                      '# TYPE school_slow_queries_total counter']
+            for endpoint, total in sorted(self.slow_queries.items()):
+                lines.append(f'school_slow_queries_total{{endpoint="{_escape(endpoint)}"}} {total}')
+        return '\n'.join(lines) + '\n'
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,324 @@
+import inspect
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+import traceback
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, Job
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('Queued', 'Running', 'Done', 'Failed')
+ERROR_CHARS = 4000  # Tail of the traceback kept on the job
+
+# ``every`` names the config key holding a recurring task's interval in seconds (0: not scheduled)
+Task = namedtuple('Task', 'name func max_attempts timeout every')
+TASKS = {}
+
+
+def task(name, max_attempts=None, timeout=None, every=None):
+    """Register ``func`` as the task ``name``; the function itself is returned unchanged.
+
+    The job's payload is passed as keyword arguments. A job may run more than
+    once (after a crash, or a retry after a partial failure), so tasks should
+    be safe to repeat. Writes left uncommitted are committed with the job.
+    """
+    def register(func):
+        TASKS[name] = Task(name, func, max_attempts, timeout, every)
+        return func
+    return register
+
+
+def manual_tasks():
+    """Tasks an admin can start from the jobs page: those that need no arguments."""
+    return sorted(
+        name for name, t in TASKS.items()
+        if all(p.default is not p.empty for p in inspect.signature(t.func).parameters.values())
+    )
+
+
+def enqueue(name, payload=None, run_at=None, unique_key=None):
+    """Add a job in the current transaction; it becomes visible when the caller commits.
+
+    With ``unique_key``, nothing is added while a queued or running job holds
+    the same key, and None is returned.
+    """
+    if name not in TASKS:
+        raise KeyError(f'No task named {name!r}')
+    job = Job(
+        name=name,
+        payload=json.dumps(payload or {}),
+        unique_key=unique_key,
+        run_at=run_at or datetime.utcnow(),
+        max_attempts=TASKS[name].max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+    )
+    if unique_key is None:
+        db.session.add(job)
+        return job
+    try:
+        with db.session.begin_nested():
+            db.session.add(job)
+    except IntegrityError:
+        return None
+    return job
+
+
+def schedule_recurring():
+    """Queue the first run of every recurring task that has no live job yet."""
+    for t in TASKS.values():
+        if t.every and current_app.config.get(t.every):
+            enqueue(t.name, unique_key=t.name)
+    db.session.commit()
+
+
+# Claiming and running
+
+def claim(worker_id, limit=1):
+    """Mark up to ``limit`` due jobs Running for ``worker_id`` and return them as rows.
+
+    One UPDATE whose subquery picks the jobs; on PostgreSQL the subquery takes
+    its row locks with SKIP LOCKED, so concurrent workers never wait on each
+    other or claim the same job, and on SQLite the write lock serializes claims.
+    Running jobs whose lease has expired (their worker died) are claimed again;
+    a live worker keeps renewing the lease, see ``_heartbeat``.
+    """
+    now = datetime.utcnow()
+    due = or_(and_(Job.status == 'Queued', Job.run_at <= now),
+              and_(Job.status == 'Running', Job.locked_until < now))
+    # A read first: an idle poll must not take SQLite's write lock (or PostgreSQL row locks)
+    if db.session.scalar(select(Job.id).where(due).limit(1)) is None:
+        db.session.rollback()
+        return []
+    candidates = (
+        select(Job.id).where(due).order_by(Job.run_at, Job.id).limit(limit)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(Job.__table__)
+        .where(Job.id.in_(candidates), due)
+        .values(status='Running', attempts=Job.attempts + 1, started_at=now, locked_by=worker_id,
+                locked_until=now + timedelta(seconds=current_app.config['JOB_LEASE_SECONDS']))
+        .returning(Job.id, Job.name, Job.payload, Job.attempts, Job.max_attempts, Job.unique_key)
+    )
+    rows = db.session.execute(stmt).all()
+    db.session.commit()
+    return rows
+
+
+def _owned(row, worker_id, **values):
+    # Only while this worker still holds the job; after its lease ran out another may have it
+    db.session.execute(
+        update(Job.__table__)
+        .where(Job.id == row.id, Job.status == 'Running', Job.locked_by == worker_id)
+        .values(**values)
+    )
+
+
+def _heartbeat(row, worker_id, deadline=None):
+    """Renew the lease on ``row`` every JOB_HEARTBEAT_SECONDS until the returned event is set.
+
+    Runs on its own thread and session, so the renewals commit while the task's
+    transaction is still open. With ``deadline`` (the task's timeout) the lease
+    is not renewed past it, and a task stuck beyond it is reclaimed.
+    """
+    app = current_app._get_current_object()
+    stop = threading.Event()
+
+    def beat():
+        lease = timedelta(seconds=app.config['JOB_LEASE_SECONDS'])
+        while not stop.wait(app.config['JOB_HEARTBEAT_SECONDS']):
+            locked_until = datetime.utcnow() + lease
+            if deadline:
+                locked_until = min(locked_until, deadline)
+            with app.app_context():
+                try:
+                    _owned(row, worker_id, locked_until=locked_until)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    logger.warning('Could not renew the lease on job %s', row.id, exc_info=True)
+
+    threading.Thread(target=beat, name=f'jobs-heartbeat-{row.id}', daemon=True).start()
+    return stop
+
+
+def _backoff(attempts):
+    config = current_app.config
+    delay = min(config['JOB_BACKOFF_MAX_SECONDS'], config['JOB_BACKOFF_SECONDS'] * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))  # Jitter spreads retries of a shared failure
+
+
+def _reschedule(t):
+    # The next run of a recurring task, once the current one has released the key
+    interval = current_app.config.get(t.every) if t and t.every else 0
+    if interval:
+        enqueue(t.name, run_at=datetime.utcnow() + timedelta(seconds=interval), unique_key=t.name)
+
+
+def run_job(row, worker_id):
+    """Run one claimed job and record the outcome: Done, Queued for a retry, or Failed."""
+    t = TASKS.get(row.name)
+    deadline = datetime.utcnow() + timedelta(seconds=t.timeout) if t and t.timeout else None
+    heartbeat = _heartbeat(row, worker_id, deadline)
+    try:
+        if t is None:
+            raise LookupError(f'No task named {row.name!r} in this worker')
+        if row.attempts > row.max_attempts:
+            raise RuntimeError(f'Gave up after {row.max_attempts} attempts (the worker running it stopped)')
+        t.func(**json.loads(row.payload))
+        db.session.commit()
+    except Exception:
+        heartbeat.set()
+        db.session.rollback()
+        error = traceback.format_exc()[-ERROR_CHARS:]
+        now = datetime.utcnow()
+        if t is not None and row.attempts < row.max_attempts:
+            logger.warning('Job %s (%s) failed, attempt %d of %d', row.id, row.name, row.attempts, row.max_attempts)
+            _owned(row, worker_id, status='Queued', run_at=now + _backoff(row.attempts), last_error=error,
+                   locked_by=None, locked_until=None)
+        else:
+            logger.error('Job %s (%s) failed for good:\n%s', row.id, row.name, error)
+            _owned(row, worker_id, status='Failed', finished_at=now, last_error=error, unique_key=None,
+                   locked_by=None, locked_until=None)
+            _reschedule(t)
+        db.session.commit()
+        return False
+
+    # Not joined: a renewal racing the update below only matches while the job is still Running
+    heartbeat.set()
+    _owned(row, worker_id, status='Done', finished_at=datetime.utcnow(), unique_key=None, locked_until=None)
+    _reschedule(t)
+    db.session.commit()
+    return True
+
+
+class Worker:
+    """A pool of threads that claim and run jobs until stopped.
+
+    Started by ``flask jobs-worker`` as its own process; SIGTERM or SIGINT lets
+    each thread finish its current job and exit. With ``once`` the threads exit
+    as soon as nothing is due instead of polling.
+    """
+
+    def __init__(self, app, threads=None, poll_interval=None):
+        self.app = app
+        self.threads = threads or app.config['JOB_WORKERS']
+        self.poll_interval = poll_interval or app.config['JOB_POLL_INTERVAL']
+        self.stopping = threading.Event()
+
+    def run(self, once=False):
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, lambda *args: self.stopping.set())
+        with self.app.app_context():
+            schedule_recurring()
+        threads = [threading.Thread(target=self._loop, args=(i, once), name=f'jobs-{i}', daemon=True)
+                   for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _loop(self, index, once):
+        worker_id = f'{socket.gethostname()}:{os.getpid()}:{index}'
+        while not self.stopping.is_set():
+            with self.app.app_context():
+                try:
+                    rows = claim(worker_id)
+                    for row in rows:
+                        run_job(row, worker_id)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Job worker %s could not claim or record a job', worker_id)
+                    rows = None
+            if rows:
+                continue
+            if once:
+                return
+            self.stopping.wait(self.poll_interval)
+
+
+def start_job_worker(app, threads):
+    """Run a Worker on daemon threads of this process, for setups without a separate worker."""
+    worker = Worker(app, threads)
+    threading.Thread(target=worker.run, name='jobs', daemon=True).start()
+    return worker
+
+
+def start_with_first_request(app):
+    """Start JOB_IN_PROCESS_WORKERS job threads when this process serves its first request.
+
+    Waiting for a request keeps them out of CLI commands and out of a
+    preforking server's master, whose threads would not survive the fork.
+    """
+    lock, started = threading.Lock(), []
+
+    @app.before_request
+    def start():
+        if started:
+            return
+        with lock:
+            if not started:
+                threads = app.config['JOB_IN_PROCESS_WORKERS']
+                started.append(start_job_worker(app, threads) if threads else None)
+
+
+# Admin view
+
+def queue_summary(recent_hours=24):
+    """Queue depth per task and status, plus wait (due to started) and run times of recent jobs."""
+    now = datetime.utcnow()
+    depth = {}
+    for name, status, count in db.session.execute(
+        select(Job.name, Job.status, func.count()).group_by(Job.name, Job.status)
+    ):
+        depth.setdefault(name, dict.fromkeys(JOB_STATUSES, 0))[status] = count
+
+    oldest_due = db.session.scalar(select(func.min(Job.run_at)).where(Job.status == 'Queued', Job.run_at <= now))
+    finished = db.session.execute(
+        select(Job.run_at, Job.started_at, Job.finished_at)
+        .where(Job.status == 'Done', Job.finished_at >= now - timedelta(hours=recent_hours))
+    ).all()
+    waits = sorted((started - due).total_seconds() for due, started, _ in finished)
+    runs = sorted((done - started).total_seconds() for _, started, done in finished)
+
+    def percentile(values, q):
+        return values[min(len(values) - 1, int(len(values) * q))] if values else None
+
+    return {
+        'depth': dict(sorted(depth.items())),
+        'due': db.session.scalar(select(func.count()).where(Job.status == 'Queued', Job.run_at <= now)),
+        'oldest_due_seconds': (now - oldest_due).total_seconds() if oldest_due else None,
+        'finished': len(finished),
+        'wait_p50': percentile(waits, 0.5),
+        'wait_p95': percentile(waits, 0.95),
+        'run_p50': percentile(runs, 0.5),
+        'run_p95': percentile(runs, 0.95),
+    }
+
+
+def retry_job(job_id):
+    """Queue a Failed job again with a fresh set of attempts. False if it is not Failed."""
+    result = db.session.execute(
+        update(Job.__table__)
+        .where(Job.id == job_id, Job.status == 'Failed')
+        .values(status='Queued', attempts=0, run_at=datetime.utcnow(), finished_at=None)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+@task('jobs.prune', every='JOB_PRUNE_INTERVAL')
+def prune_jobs():
+    """Delete finished jobs older than JOB_RETENTION_DAYS."""
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['JOB_RETENTION_DAYS'])
+    db.session.execute(Job.__table__.delete().where(Job.status.in_(('Done', 'Failed')), Job.finished_at < cutoff))
@@ -0,0 +1,93 @@
+from datetime import datetime
+from sqlalchemy import select
+from bulk import upsert
+from family import bump_family_versions
+from models import db, Mark, Student
+from performance import refresh_performance
+from reports import TEST_TYPES, current_term
+
+MAX_SCORE = 100.0
+
+
+class MarkEntryError(Exception):
+    """The marks as a whole cannot be saved (unknown test type, no students...)."""
+
+
+def parse_score(raw):
+    """A posted score as a float; ValueError with a message fit to show when it is not one."""
+    try:
+        score = float(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f'{raw!r} is not a number') from None
+    if not 0 <= score <= MAX_SCORE:
+        raise ValueError(f'{raw} is outside 0-{MAX_SCORE:g}')
+    return score
+
+
+def class_grid(class_name, subjects, test_type, term=None):
+    """The students of ``class_name`` and their existing scores, ``{(student_id, subject): score}``."""
+    students = Student.query.filter_by(class_name=class_name).order_by(Student.name, Student.id).all()
+    rows = db.session.execute(
+        select(Mark.student_id, Mark.subject, Mark.score)
+        .join(Student, Student.id == Mark.student_id)
+        .where(Student.class_name == class_name, Mark.subject.in_(subjects), Mark.test_type == test_type,
+               Mark.term == (term or current_term()))
+    )
+    return students, {(student_id, subject): score for student_id, subject, score in rows}
+
+
+def read_grid(form, students, subjects):
+    """The scores posted from the grid as ``score-<student id>-<subject index>`` fields.
+
+    Returns ``(scores, errors)``: scores by ``(student_id, subject)`` and
+    messages by field name. Blank cells are left out, so they change nothing.
+    """
+    scores, errors = {}, {}
+    for student in students:
+        for index, subject in enumerate(subjects):
+            field = f'score-{student.id}-{index}'
+            raw = form.get(field, '').strip()
+            if not raw:
+                continue
+            try:
+                scores[student.id, subject] = parse_score(raw)
+            except ValueError as e:
+                errors[field] = f'{student.name}, {subject}: {e}'
+    return scores, errors
+
+
+def save_marks(scores, test_type, teacher_id, term=None):
+    """Upsert ``{(student_id, subject): score}`` for one test in one statement; the caller commits.
+
+    A score entered again for the same student, subject, test and term
+    replaces the old one. Only new and changed scores are written, and the
+    performance aggregates, analytics and family versions are refreshed once
+    for the whole batch. Returns ``(added, corrected)``.
+    """
+    if test_type not in TEST_TYPES:
+        raise MarkEntryError(f'Unknown test type {test_type!r}.')
+    term = term or current_term()
+    student_ids = {student_id for student_id, _ in scores}
+    existing = {
+        (student_id, subject): score for student_id, subject, score in db.session.execute(
+            select(Mark.student_id, Mark.subject, Mark.score)
+            .where(Mark.student_id.in_(student_ids), Mark.test_type == test_type, Mark.term == term)
+        )
+    } if student_ids else {}
+
+    now = datetime.utcnow()
+    changed = [
+        {'student_id': student_id, 'teacher_id': teacher_id, 'subject': subject, 'score': score,
+         'test_type': test_type, 'term': term, 'created_at': now}
+        for (student_id, subject), score in scores.items() if existing.get((student_id, subject)) != score
+    ]
+    upsert(Mark, changed, index_elements=['student_id', 'subject', 'test_type', 'term'],
+           set_=lambda excluded: {'score': excluded.score, 'teacher_id': excluded.teacher_id,
+                                  'created_at': excluded.created_at})
+
+    touched = {row['student_id'] for row in changed}
+    if touched:
+        refresh_performance(touched)
+        bump_family_versions(touched)
+    corrected = sum(1 for row in changed if (row['student_id'], row['subject']) in existing)
+    return len(changed) - corrected, corrected
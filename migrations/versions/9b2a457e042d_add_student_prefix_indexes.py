@@ -0,0 +1,42 @@
+"""Add student prefix indexes for short search terms
+
+Revision ID: 9b2a457e042d
+Revises: 0489d2444e08
+Create Date: 2026-10-18 22:10:37.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b2a457e042d'
+down_revision = '0489d2444e08'
+branch_labels = None
+depends_on = None
+
+# Index name suffix -> columns, as in search.PREFIX_COLUMNS
+PREFIX_INDEXES = {
+    'name': ('name',),
+    'admission_number': ('admission_number',),
+    'class_name': ('class_name', 'name'),
+}
+
+
+def upgrade():
+    # Case-insensitive indexes that search._prefix_query seeks a prefix range in
+    # and reads in order; the expressions must match it for the planner to use them
+    dialect = op.get_bind().dialect.name
+    for suffix, columns in PREFIX_INDEXES.items():
+        if dialect == 'sqlite':
+            expressions = ', '.join(f'{column} COLLATE NOCASE' for column in columns)
+        elif dialect == 'postgresql':
+            expressions = ', '.join(f'lower({column}) text_pattern_ops' for column in columns)
+        else:
+            continue
+        op.execute(f"CREATE INDEX ix_student_prefix_{suffix} ON student ({expressions})")
+
+
+def downgrade():
+    for suffix in PREFIX_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS ix_student_prefix_{suffix}")
@@ -1,14 +1,17 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})  # Routes read-only requests to their own engine
 
 # User model with roles
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(150), unique=True, nullable=False)
-    password = db.Column(db.String(150), nullable=False)
+    password = db.Column(db.String(255), nullable=False)  # Room for scrypt hashes and their parameters
     role = db.Column(db.String(50), nullable=False)  # Admin, Teacher, Parent, Finance
     child_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=True)  # Only for Parent role
 
@@ -16,9 +19,9 @@ class User(db.Model, UserMixin):
 class Student(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     admission_number = db.Column(db.String(10), unique=True, nullable=False)
-    name = db.Column(db.String(150), nullable=False)
-    class_name = db.Column(db.String(50), nullable=False)  # Add this line for class input
-    parent_id = db.Column(db.Integer, db.ForeignKey('parent.id'))  # Link to Parent model
+    name = db.Column(db.String(150), nullable=False, index=True)
+    class_name = db.Column(db.String(50), nullable=False, index=True)  # Add this line for class input
+    parent_id = db.Column(db.Integer, db.ForeignKey('parent.id'), index=True)  # Link to Parent model
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     parent = db.relationship('Parent', back_populates='students')  # Update to allow for multiple students
@@ -28,14 +31,27 @@ class Student(db.Model):
     # Generate admission numbers incrementally
     @staticmethod
     def generate_admission_number():
-        last_student = Student.query.order_by(Student.id.desc()).first()
-        new_admission_number = f"{int(last_student.admission_number) + 1:03}" if last_student else "001"
-        return new_admission_number
+        return Student.reserve_admission_numbers(1)[0]
+
+    # Reserve a contiguous block of admission numbers from the shared counter
+    @staticmethod
+    def reserve_admission_numbers(count):
+        start = Counter.allocate('admission_number', count, seed=Student.highest_admission_number)
+        return [f"{number:03}" for number in range(start, start + count)]
+
+    # Highest numeric admission number in use; seeds the counter on first use
+    @staticmethod
+    def highest_admission_number():
+        return db.session.query(
+            func.coalesce(func.max(db.cast(Student.admission_number, db.Integer)), 0)
+        ).scalar()
 
 # Parent model
 class Parent(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped when any of the family's data changes
+    data_updated_at = db.Column(db.DateTime, nullable=True)
 
     # Relationship to view child's assignments, attendance, and fees
     students = db.relationship('Student', back_populates='parent', lazy=True)  # Allow multiple students
@@ -43,7 +59,7 @@ class Parent(db.Model):
 # Teacher model
 class Teacher(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     subject = db.Column(db.String(100), nullable=False)
 
     # Relationship with assignments, attendance, and remarks
@@ -53,7 +69,7 @@ class Teacher(db.Model):
 # Finance model to manage fees and payments
 class Finance(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
 
 # Fee structure for each student
 # Fee structure for each student
@@ -61,12 +77,41 @@ class Fee(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
     amount_due = db.Column(db.Float, nullable=False)
-    amount_paid = db.Column(db.Float, default=0.0)
-    due_date = db.Column(db.Date, nullable=False)
+    amount_paid = db.Column(db.Float, default=0.0)  # Sum of the fee's Payment rows, kept in step by fees.py
+    due_date = db.Column(db.Date, nullable=False, index=True)
     status = db.Column(db.String(20), default="Pending")  # Status options: Pending, Paid, Overdue
+    # Bumped by every UPDATE; an ORM update of a row changed since it was loaded raises StaleDataError
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     # Define the relationship to the Student model
     student = db.relationship('Student', back_populates='fees')
+    payments = db.relationship('Payment', back_populates='fee', order_by='Payment.id', lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_fee_student_id_status_due_date', 'student_id', 'status', 'due_date'),
+        db.Index('ix_fee_status_due_date', 'status', 'due_date'),
+    )
+    __mapper_args__ = {'version_id_col': version}
+
+# One payment towards a fee. Rows are never changed or deleted; corrections are negative payments
+class Payment(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    fee_id = db.Column(db.Integer, db.ForeignKey('fee.id'), nullable=False, index=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False, index=True)
+    amount = db.Column(db.Float, nullable=False)
+    method = db.Column(db.String(20), nullable=False)  # Cash, M-Pesa, Bank, Cheque, Opening balance
+    reference = db.Column(db.String(100), nullable=True)  # Receipt, transaction or cheque number
+    recorded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    fee = db.relationship('Fee', back_populates='payments')
+
+# Running fee totals per student, adjusted in the same transaction as every fee and payment
+class StudentBalance(db.Model):
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), primary_key=True)
+    total_due = db.Column(db.Float, nullable=False, default=0.0)
+    total_paid = db.Column(db.Float, nullable=False, default=0.0)
+    balance = db.Column(db.Float, nullable=False, default=0.0, index=True)  # total_due - total_paid; above 0 is owed
 
 
 # Attendance model
@@ -76,22 +121,42 @@ class Attendance(db.Model):
     date = db.Column(db.Date, default=datetime.utcnow)
     status = db.Column(db.String(10))  # Present, Absent
 
+    __table_args__ = (
+        db.Index('ix_attendance_student_id_date', 'student_id', 'date', unique=True),  # One status per student per day
+    )
+
+# Attendance counts per student per month, maintained alongside every Attendance write
+class AttendanceStudentMonth(db.Model):
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True, index=True)  # First day of the month
+    present = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+
+# Attendance counts per class per day (by the class the student was in when marked)
+class AttendanceClassDay(db.Model):
+    class_name = db.Column(db.String(50), primary_key=True)
+    date = db.Column(db.Date, primary_key=True, index=True)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+
 # Remark model for teachers to provide feedback for students
 class Remark(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
-    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False, index=True)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=False, index=True)
     text = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    student = db.relationship('Student', backref='remarks')
+
 # Assignment model for teachers to post assignments for students
 class Assignment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(150), nullable=False)
     description = db.Column(db.Text, nullable=False)
     due_date = db.Column(db.Date, nullable=False)
-    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=False)
-    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=True)  # For individual or all students
+    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=False, index=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=True, index=True)  # For individual or all students
 
     # Relationships
     student = db.relationship('Student', backref='assignments', lazy=True)
@@ -99,19 +164,27 @@ class Assignment(db.Model):
 # Mark model to store student marks
 class Mark(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
-    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False, index=True)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=False, index=True)
     subject = db.Column(db.String(100), nullable=False)  # Subject for the marks
     score = db.Column(db.Float, nullable=False)  # The marks scored by the student
     test_type = db.Column(db.String(20), nullable=False)  # Assignment, CAT, or End Term
+    term = db.Column(db.String(10), nullable=False)  # e.g. '2024-2'; set by marks.save_marks
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     student = db.relationship('Student', backref='marks')
     teacher = db.relationship('Teacher', backref='marks')
 
+    __table_args__ = (
+        # One score per student, subject and test each term; entering it again corrects it
+        db.Index('ix_mark_student_id_subject_test_type_term', 'student_id', 'subject', 'test_type', 'term', unique=True),
+        db.Index('ix_mark_term_student_id', 'term', 'student_id'),  # Analytics for one term; one student's term in the API
+        db.Index('ix_mark_subject', 'subject'),  # API listings filtered by subject
+    )
+
 class PasswordResetRequest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Assuming you have a User model
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)  # Assuming you have a User model
     reason = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -120,3 +193,105 @@ class PasswordResetRequest(db.Model):
     def __init__(self, user_id, reason):
         self.user_id = user_id
         self.reason = reason
+
+# Running score aggregates per student, maintained alongside every new Mark
+class StudentPerformance(db.Model):
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), primary_key=True)
+    mark_count = db.Column(db.Integer, nullable=False, default=0)
+    score_total = db.Column(db.Float, nullable=False, default=0.0)
+    average_score = db.Column(db.Float, nullable=False, default=0.0, index=True)  # Used to rank students
+
+    student = db.relationship('Student', backref=db.backref('performance', uselist=False))
+
+# Running score aggregates per student, subject and test type
+class SubjectPerformance(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
+    subject = db.Column(db.String(100), nullable=False)
+    test_type = db.Column(db.String(20), nullable=False)
+    mark_count = db.Column(db.Integer, nullable=False, default=0)
+    score_total = db.Column(db.Float, nullable=False, default=0.0)
+    average_score = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'subject', 'test_type', name='uq_subject_performance_student_subject_test'),
+    )
+
+# Named counters that hand out numbers atomically (admission numbers, ...)
+class Counter(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)  # Last number handed out
+
+    # Reserve ``count`` consecutive numbers and return the first. The single UPDATE
+    # holds the row/write lock until the caller commits, so concurrent workers never
+    # share a number, and a rollback hands the numbers back (no gaps).
+    @staticmethod
+    def allocate(name, count=1, seed=None, session=None):
+        session = session or db.session
+        table = Counter.__table__
+        result = session.execute(
+            update(table).where(table.c.name == name).values(value=table.c.value + count)
+        )
+        if result.rowcount == 0:
+            # First use of this counter: create it, tolerating a concurrent creator
+            try:
+                with session.begin_nested():
+                    session.execute(insert(table).values(name=name, value=seed() if seed else 0))
+            except IntegrityError:
+                pass
+            return Counter.allocate(name, count, session=session)
+        value = session.execute(select(table.c.value).where(table.c.name == name)).scalar_one()
+        return value - count + 1
+
+# One row per run of the fee status sweep, recording how many fees changed
+class FeeSweep(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    ran_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    marked_paid = db.Column(db.Integer, nullable=False, default=0)
+    marked_overdue = db.Column(db.Integer, nullable=False, default=0)
+    marked_pending = db.Column(db.Integer, nullable=False, default=0)
+    duration_ms = db.Column(db.Float, nullable=False, default=0.0)
+
+    @property
+    def changed(self):
+        return self.marked_paid + self.marked_overdue + self.marked_pending
+
+# One batch run of report-card generation, for a class or (class_name NULL) the whole school
+class ReportJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    class_name = db.Column(db.String(50), nullable=True)
+    term = db.Column(db.String(10), nullable=False)  # e.g. '2024-2'
+    status = db.Column(db.String(20), nullable=False, default='Queued')  # Queued, Running, Done, Failed
+    total_classes = db.Column(db.Integer, nullable=False, default=0)
+    classes_done = db.Column(db.Integer, nullable=False, default=0)
+    total_students = db.Column(db.Integer, nullable=False, default=0)
+    students_done = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def progress(self):
+        return self.students_done / self.total_students if self.total_students else 0.0
+
+# A unit of background work, claimed and run by `flask jobs-worker` (see jobs.py)
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), nullable=False)  # Registered task, e.g. 'fees.sweep'
+    payload = db.Column(db.Text, nullable=False, default='{}')  # The task's keyword arguments as JSON
+    unique_key = db.Column(db.String(80), nullable=True, unique=True)  # At most one queued or running job per key
+    status = db.Column(db.String(20), nullable=False, default='Queued')  # Queued, Running, Done, Failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Not before; pushed back on retries
+    locked_by = db.Column(db.String(100), nullable=True)  # host:pid:thread of the claiming worker
+    locked_until = db.Column(db.DateTime, nullable=True)  # Another worker may reclaim a Running job after this
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),  # The claim query's range scan
+    )
@@ -0,0 +1,95 @@
+import base64
+import json
+from datetime import date, datetime
+from flask import request, url_for
+from sqlalchemy import tuple_
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+
+class KeysetPage:
+    """One page of rows plus the cursor that continues after its last row."""
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _decode_value(column, value):
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Turn a cursor back into column values, or ``None`` if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if len(values) != len(columns):
+            return None
+        return [_decode_value(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError):
+        return None
+
+
+def per_page_arg(name='per_page'):
+    return max(1, min(request.args.get(name, DEFAULT_PER_PAGE, type=int), MAX_PER_PAGE))
+
+
+def keyset_paginate(query, sort_columns, cursor=None, per_page=DEFAULT_PER_PAGE, descending=False):
+    """Return the page of ``query`` that follows ``cursor``.
+
+    ``sort_columns`` must end with a unique column (normally the primary key) so
+    the ordering is total; all columns are sorted in the same direction, which
+    lets the continuation be a single row-value comparison that an index on the
+    sort columns can seek to directly, however deep the page is.
+    """
+    after = decode_cursor(cursor, sort_columns)
+    if after is not None:
+        key = tuple_(*sort_columns)
+        query = query.filter(key < tuple_(*after) if descending else key > tuple_(*after))
+    query = query.order_by(*[c.desc() if descending else c.asc() for c in sort_columns])
+
+    rows = query.limit(per_page + 1).all()
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column in sort_columns])
+    return KeysetPage(items, next_cursor)
+
+
+def url_with(**overrides):
+    """URL of the current page with some query arguments replaced (``None`` drops them)."""
+    args = request.args.to_dict()
+    args.update(overrides)
+    args = {key: value for key, value in args.items() if value not in (None, '')}
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
@@ -0,0 +1,118 @@
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import check_password_hash, generate_password_hash
+from instrumentation import record_timing
+from models import db, User
+
+DEFAULT_METHOD = 'scrypt'  # Any werkzeug method string, e.g. 'scrypt:16384:8:1' or 'pbkdf2:sha256:600000'
+
+
+class PasswordPoolBusy(Exception):
+    """Every verification slot is taken; the client should retry shortly."""
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a bounded thread pool.
+
+    hashlib's scrypt and pbkdf2 release the GIL, so hashes run in parallel on
+    the pool while request threads only wait. At most ``pool_size + queue_size``
+    hashes are admitted at once; later callers wait up to ``timeout`` seconds
+    for a slot and then get PasswordPoolBusy rather than piling up behind a
+    login burst.
+    """
+
+    def __init__(self, method=DEFAULT_METHOD, pool_size=None, queue_size=None, timeout=5.0):
+        self._executor = None
+        self.configure(method, pool_size, queue_size, timeout)
+
+    def init_app(self, app):
+        self.configure(
+            app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+            app.config.get('PASSWORD_POOL_SIZE'),
+            app.config.get('PASSWORD_POOL_QUEUE'),
+            app.config.get('PASSWORD_POOL_TIMEOUT', 5.0),
+        )
+
+    def configure(self, method, pool_size=None, queue_size=None, timeout=5.0):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self.method = method
+        self.pool_size = pool_size or os.cpu_count() or 1
+        self.queue_size = self.pool_size * 4 if queue_size is None else queue_size
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.pool_size + self.queue_size)
+        self._lock = threading.Lock()
+        self._executor = None  # Started on first use, i.e. after gunicorn has forked
+        self._prefix = None
+        self._dummy_hash = None
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.pool_size, thread_name_prefix='password')
+            return self._executor
+
+    def _run(self, fn, *args):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordPoolBusy()
+        try:
+            return self._pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+            record_timing('hash', time.perf_counter() - start)  # Includes time queued for the pool
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        """Check ``password`` against ``stored_hash``.
+
+        With no stored hash (unknown user) a dummy hash is checked instead, so
+        the response takes as long as for a real account.
+        """
+        if stored_hash is None:
+            self._run(check_password_hash, self._dummy(), password)
+            return False
+        return self._run(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        """True if ``stored_hash`` was made with a different method or cost than configured."""
+        return stored_hash.split('$', 1)[0] != self._method_prefix()
+
+    def _method_prefix(self):
+        # werkzeug fills in default parameters ('scrypt' -> 'scrypt:32768:8:1'),
+        # so the canonical prefix is taken from a real hash
+        if self._prefix is None:
+            self._prefix = self._dummy().split('$', 1)[0]
+        return self._prefix
+
+    def _dummy(self):
+        if self._dummy_hash is None:
+            self._dummy_hash = generate_password_hash(secrets.token_hex(16), self.method)
+        return self._dummy_hash
+
+
+hasher = PasswordHasher()
+
+
+def authenticate(username, password):
+    """The user if ``password`` is theirs, else None.
+
+    A hash made with an outdated method or cost is upgraded on the way.
+    Raises PasswordPoolBusy when the pool has no room for the check.
+    """
+    user = User.query.filter_by(username=username).first()
+    valid = hasher.verify(user.password if user else None, password)
+    if not (user and valid):
+        return None
+    if hasher.needs_rehash(user.password):
+        try:
+            user.password = hasher.hash(password)
+            db.session.commit()
+        except PasswordPoolBusy:
+            pass  # Upgrade on a later login
+    return user
@@ -0,0 +1,54 @@
+from sqlalchemy import func, insert, select
+from analytics import bump_marks_version
+from jobs import task
+from models import db, Student, Mark, StudentPerformance, SubjectPerformance
+
+
+def _aggregate(student_ids=None):
+    # Replace the aggregate rows of ``student_ids`` (everyone when None) with fresh ones from Mark
+    subject_rows = SubjectPerformance.__table__.delete()
+    student_rows = StudentPerformance.__table__.delete()
+    by_student = (select(Mark.student_id, func.count(Mark.id), func.sum(Mark.score), func.avg(Mark.score))
+                  .group_by(Mark.student_id))
+    by_subject = (select(Mark.student_id, Mark.subject, Mark.test_type,
+                         func.count(Mark.id), func.sum(Mark.score), func.avg(Mark.score))
+                  .group_by(Mark.student_id, Mark.subject, Mark.test_type))
+    if student_ids is not None:
+        subject_rows = subject_rows.where(SubjectPerformance.student_id.in_(student_ids))
+        student_rows = student_rows.where(StudentPerformance.student_id.in_(student_ids))
+        by_student = by_student.where(Mark.student_id.in_(student_ids))
+        by_subject = by_subject.where(Mark.student_id.in_(student_ids))
+
+    db.session.execute(subject_rows)
+    db.session.execute(student_rows)
+    db.session.execute(insert(StudentPerformance).from_select(
+        ['student_id', 'mark_count', 'score_total', 'average_score'], by_student))
+    db.session.execute(insert(SubjectPerformance).from_select(
+        ['student_id', 'subject', 'test_type', 'mark_count', 'score_total', 'average_score'], by_subject))
+
+
+def refresh_performance(student_ids):
+    """Recompute the aggregates of ``student_ids`` in the current transaction, once per batch of marks."""
+    student_ids = sorted(set(student_ids))
+    if student_ids:
+        _aggregate(student_ids)
+        bump_marks_version()
+
+
+@task('performance.rebuild', timeout=3600)
+def rebuild_performance():
+    """Recompute every aggregate row from the Mark table."""
+    _aggregate()
+    bump_marks_version()  # Marks may have been loaded or repaired in bulk
+    db.session.commit()
+
+
+def student_ranking():
+    """All students ordered by average score, highest first, in a single query."""
+    rows = (
+        db.session.query(Student, StudentPerformance.average_score)
+        .outerjoin(StudentPerformance, StudentPerformance.student_id == Student.id)
+        .order_by(StudentPerformance.average_score.desc().nullslast(), Student.id)
+        .all()
+    )
+    return [{'student': student, 'average_score': average_score or 0} for student, average_score in rows]
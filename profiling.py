@@ -0,0 +1,223 @@
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from flask import g, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+PROFILE_HEADER = 'X-Profile'
+TOKEN_SALT = 'profile-trigger'
+SETTINGS_CHECK_SECONDS = 5  # How often a worker re-reads the shared on/off switch
+MAX_DEPTH = 128
+
+
+def _frame_name(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def _collapse(frame):
+    """The stack under ``frame`` as a collapsed-stack line, outermost call first."""
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler(threading.Thread):
+    """Samples the stacks of the threads currently being profiled.
+
+    Runs only while at least one request is profiled and otherwise blocks,
+    so an idle profiler costs nothing. Each sample counts one collapsed
+    stack for that thread's request.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name='profiler', daemon=True)
+        self.interval = interval
+        self.active = {}  # thread id -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def add(self, thread_id):
+        samples = Counter()
+        with self._lock:
+            self.active[thread_id] = samples
+            self._wake.set()
+        return samples
+
+    def remove(self, thread_id):
+        with self._lock:
+            samples = self.active.pop(thread_id, Counter())
+            if not self.active:
+                self._wake.clear()
+        return samples
+
+    def run(self):
+        own_id = threading.get_ident()
+        while True:
+            self._wake.wait()
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, samples in self.active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None and thread_id != own_id:
+                        samples[_collapse(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+class Profiler:
+    """Opt-in sampling profiler, aggregated per endpoint.
+
+    When switched on, PROFILE_SAMPLE_RATE of requests are profiled; a request
+    carrying a signed X-Profile token (see ``trigger_token``) is profiled
+    whether or not the switch is on. Samples are appended to one
+    collapsed-stack file per endpoint and worker process under PROFILE_DIR,
+    which flamegraph.pl and speedscope both read. The switch lives in
+    PROFILE_DIR too, so it reaches every gunicorn worker.
+    """
+
+    def __init__(self):
+        self.directory = None
+        self.enabled = False
+        self.sample_rate = 0.0
+        self._checked_at = 0.0
+        self._sampler = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.directory = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+        self.default_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.01)
+        self.interval = app.config.get('PROFILE_INTERVAL_MS', 5) / 1000
+        self.token_max_age = app.config.get('PROFILE_TOKEN_MAX_AGE', 3600)
+        self._serializer = URLSafeTimedSerializer(app.secret_key, salt=TOKEN_SALT)
+        self._settings_path = os.path.join(self.directory, 'settings.json')
+        app.before_request(self._start_request)
+        app.teardown_request(self._finish_request)
+
+    # Shared switch
+
+    def settings(self):
+        """Current on/off state and sample rate, re-read from disk every few seconds."""
+        now = time.monotonic()
+        if now - self._checked_at >= SETTINGS_CHECK_SECONDS:
+            self._checked_at = now
+            try:
+                with open(self._settings_path) as f:
+                    settings = json.load(f)
+            except (OSError, ValueError):
+                settings = {}
+            self.enabled = bool(settings.get('enabled', False))
+            self.sample_rate = float(settings.get('sample_rate', self.default_rate))
+        return self.enabled, self.sample_rate
+
+    def configure(self, enabled, sample_rate):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._settings_path, 'w') as f:
+            json.dump({'enabled': enabled, 'sample_rate': sample_rate}, f)
+        self._checked_at = 0.0
+
+    # Trigger header
+
+    def trigger_token(self):
+        """A token for the X-Profile header, valid for PROFILE_TOKEN_MAX_AGE seconds."""
+        return self._serializer.dumps('profile')
+
+    def _triggered(self):
+        token = request.headers.get(PROFILE_HEADER)
+        if not token:
+            return False
+        try:
+            self._serializer.loads(token, max_age=self.token_max_age)
+        except BadSignature:
+            return False
+        return True
+
+    # Request hooks
+
+    def _start_request(self):
+        enabled, rate = self.settings()
+        if not (enabled and random.random() < rate) and not self._triggered():
+            return
+        g.profile_samples = self._get_sampler().add(threading.get_ident())
+
+    def _finish_request(self, exc):
+        if 'profile_samples' not in g:
+            return
+        samples = self._sampler.remove(threading.get_ident())
+        endpoint = request.endpoint or 'unknown'
+        if samples:
+            self._append(endpoint, samples)
+
+    def _get_sampler(self):
+        with self._lock:
+            # Started on first use, i.e. in the worker process after gunicorn has forked
+            if self._sampler is None:
+                self._sampler = Sampler(self.interval)
+                self._sampler.start()
+            return self._sampler
+
+    # Stored profiles
+
+    def _append(self, endpoint, samples):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{_safe_name(endpoint)}.{os.getpid()}.folded')
+        with self._lock, open(path, 'a') as f:
+            f.writelines(f'{stack} {count}\n' for stack, count in samples.items())
+
+    def _files(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [name for name in names if name.endswith('.folded')]
+
+    def endpoints(self):
+        """Endpoint name -> (samples, last updated) for every stored profile."""
+        result = {}
+        for name in self._files():
+            endpoint = name.rsplit('.', 2)[0]
+            path = os.path.join(self.directory, name)
+            samples = sum(count for count in self._read(path).values())
+            updated = datetime.fromtimestamp(os.path.getmtime(path))
+            total, latest = result.get(endpoint, (0, updated))
+            result[endpoint] = (total + samples, max(latest, updated))
+        return dict(sorted(result.items()))
+
+    def collapsed(self, endpoint):
+        """Every worker's samples for ``endpoint`` merged into one collapsed-stack text, or None."""
+        merged = Counter()
+        prefix = f'{_safe_name(endpoint)}.'
+        for name in self._files():
+            if name.startswith(prefix) and name.count('.') == 2:
+                merged.update(self._read(os.path.join(self.directory, name)))
+        if not merged:
+            return None
+        return ''.join(f'{stack} {count}\n' for stack, count in merged.most_common())
+
+    def clear(self):
+        for name in self._files():
+            os.remove(os.path.join(self.directory, name))
+
+    @staticmethod
+    def _read(path):
+        counts = Counter()
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    counts[stack] += int(count)
+        return counts
+
+
+def _safe_name(endpoint):
+    return re.sub(r'[^\w-]', '_', endpoint)
+
+
+profiler = Profiler()
@@ -0,0 +1,232 @@
+import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date
+from flask import current_app
+from sqlalchemy import event, select
+from database import RoutingSession
+from models import db, User, Student, Fee, ReportJob
+from reports import current_term
+
+# One request per endpoint, run through the test client as a user with ``role``.
+# ``path`` and ``data`` are formatted with sample_values(). Every endpoint of the
+# URL map needs at least one entry here (or a place in UNCHECKED_ENDPOINTS).
+PlanRequest = namedtuple('PlanRequest', 'endpoint role method path data')
+
+REQUESTS = [
+    PlanRequest('home', None, 'GET', '/', None),
+    PlanRequest('login', None, 'GET', '/login', None),
+    PlanRequest('login', None, 'POST', '/login', {'username': 'Admin', 'password': 'not-the-password'}),
+    PlanRequest('logout', 'Admin', 'GET', '/logout', None),
+    PlanRequest('dashboard', 'Admin', 'GET', '/dashboard', None),
+    PlanRequest('profile', 'Parent', 'GET', '/profile', None),
+    PlanRequest('request_password_reset', 'Parent', 'POST', '/request_password_reset', {'reason': 'Plan check'}),
+    # Admin
+    PlanRequest('admin_dashboard', 'Admin', 'GET', '/admin/dashboard', None),
+    PlanRequest('create_student', 'Admin', 'GET', '/create_student', None),
+    PlanRequest('create_student', 'Admin', 'POST', '/create_student',
+                {'name': 'Plan Check', 'class_name': '{class_name}'}),
+    PlanRequest('create_teacher', 'Admin', 'GET', '/create_teacher', None),
+    PlanRequest('create_parent', 'Admin', 'GET', '/create_parent', None),
+    PlanRequest('create_finance', 'Admin', 'GET', '/create_finance', None),
+    PlanRequest('edit_user', 'Admin', 'GET', '/edit_user/{user_id}', None),
+    PlanRequest('delete_user', 'Admin', 'POST', '/delete_user/{user_id}', {}),
+    PlanRequest('import_students_view', 'Admin', 'GET', '/import_students', None),
+    PlanRequest('cache_stats', 'Admin', 'GET', '/admin/cache_stats', None),
+    PlanRequest('metrics', 'Admin', 'GET', '/admin/metrics', None),
+    PlanRequest('profiling', 'Admin', 'GET', '/admin/profiling', None),
+    PlanRequest('download_profile', 'Admin', 'GET', '/admin/profiles/none.folded', None),
+    PlanRequest('admin_jobs', 'Admin', 'GET', '/admin/jobs', None),
+    PlanRequest('report_cards', 'Admin', 'GET', '/admin/report_cards', None),
+    PlanRequest('download_report_cards', 'Admin', 'GET', '/admin/report_cards/{report_job_id}/none.zip', None),
+    # Teachers
+    PlanRequest('teacher_dashboard', 'Teacher', 'GET', '/teacher/dashboard', None),
+    PlanRequest('create_assignment', 'Teacher', 'GET', '/create_assignment', None),
+    PlanRequest('add_remark', 'Teacher', 'POST', '/add_remark', {'student_id': '{student_id}', 'text': 'Plan check'}),
+    PlanRequest('mark_attendance', 'Teacher', 'POST', '/mark_attendance',
+                {'student_id': '{student_id}', 'status': 'Present'}),
+    PlanRequest('attendance_register', 'Teacher', 'GET', '/attendance/register?class_name={class_name}&date={today}', None),
+    PlanRequest('attendance_register', 'Teacher', 'POST', '/attendance/register',
+                {'class_name': '{class_name}', 'date': '{today}', 'status-{student_id}': 'Absent'}),
+    PlanRequest('attendance_reports', 'Teacher', 'GET', '/attendance/reports?class_name={class_name}', None),
+    PlanRequest('add_mark', 'Teacher', 'POST', '/add_mark',
+                {'student_id': '{student_id}', 'subject': 'Science', 'score': '60', 'test_type': 'CAT'}),
+    PlanRequest('marks_grid', 'Teacher', 'GET', '/marks/grid?class_name={class_name}&test_type=CAT', None),
+    PlanRequest('marks_grid', 'Teacher', 'POST', '/marks/grid',
+                {'class_name': '{class_name}', 'test_type': 'CAT', 'score-{student_id}-0': '61'}),
+    PlanRequest('marks_analytics_view', 'Teacher', 'GET', '/teacher/analytics?term={term}', None),
+    PlanRequest('marks_analytics_api', 'Teacher', 'GET',
+                '/api/analytics?term={term}&subject=Science&test_type=CAT&class_name={class_name}', None),
+    PlanRequest('search_students_api', 'Teacher', 'GET', '/api/students/search?q=an', None),
+    PlanRequest('export_data', 'Teacher', 'GET', '/export/marks?format=csv&term={term}&class_name={class_name}', None),
+    # Parents
+    PlanRequest('parent_dashboard', 'Parent', 'GET', '/parent_dashboard', None),
+    PlanRequest('view_assignments', 'Parent', 'GET', '/view_assignments', None),
+    PlanRequest('view_attendance', 'Parent', 'GET', '/view_attendance', None),
+    # Finance
+    PlanRequest('finance_dashboard', 'Finance', 'GET', '/finance_dashboard?status=Overdue', None),
+    PlanRequest('view_fees', 'Finance', 'GET', '/view_fees?class_name={class_name}', None),
+    PlanRequest('fee_detail', 'Finance', 'GET', '/fees/{fee_id}', None),
+    PlanRequest('create_fee', 'Finance', 'POST', '/create_fee',
+                {'student_id': '{student_id}', 'amount_due': '100', 'amount_paid': '0', 'due_date': '{today}'}),
+    PlanRequest('update_fee', 'Finance', 'POST', '/update_fee/{fee_id}', {'amount_due': '100', 'due_date': '{today}'}),
+    PlanRequest('record_fee_payment', 'Finance', 'POST', '/fees/{fee_id}/payments',
+                {'amount': '10', 'method': 'Cash'}),
+    PlanRequest('export_data', 'Finance', 'GET', '/export/fees?format=csv&status=Overdue', None),
+    # JSON API
+    PlanRequest('api_v1.login', None, 'POST', '/api/v1/login', {'username': 'Admin', 'password': 'not-the-password'}),
+    PlanRequest('api_v1.logout', 'Admin', 'POST', '/api/v1/logout', None),
+    PlanRequest('api_v1.list_view', 'Admin', 'GET', '/api/v1/students?class_name={class_name}', None),
+    PlanRequest('api_v1.list_view', 'Admin', 'GET', '/api/v1/marks?subject=Science', None),
+    PlanRequest('api_v1.list_view', 'Admin', 'GET', '/api/v1/marks?student_id={student_id}&term={term}', None),
+    PlanRequest('api_v1.list_view', 'Admin', 'GET', '/api/v1/fees?status=Overdue', None),
+    PlanRequest('api_v1.list_view', 'Admin', 'GET', '/api/v1/payments?fee_id={fee_id}', None),
+    PlanRequest('api_v1.list_view', 'Admin', 'GET', '/api/v1/attendance?student_id={student_id}', None),
+    PlanRequest('api_v1.list_view', 'Parent', 'GET', '/api/v1/assignments', None),
+    PlanRequest('api_v1.get_view', 'Admin', 'GET', '/api/v1/students/{student_id}', None),
+    PlanRequest('api_v1.batch', 'Admin', 'POST', '/api/v1/batch',
+                {'requests': [{'path': '/remarks?student_id={student_id}'}, {'path': '/fees/{fee_id}'}]}),
+]
+
+# Endpoints that never touch the database
+UNCHECKED_ENDPOINTS = {'static'}
+
+# Full table scans that are intended, not a missing index: (endpoint, table) -> why.
+# SQLite reports a walk of the rowid or of an index in order, stopped by a LIMIT, as a scan too.
+ALLOWED_SCANS = {
+    ('admin_dashboard', 'password_reset_request'): 'newest requests first, limited',
+    ('admin_dashboard', 'user'): 'one page in username order, walking the unique index',
+    ('report_cards', 'student'): 'distinct class names, cached',
+    ('teacher_dashboard', 'student'): 'the whole-school ranking, cached as a fragment',
+    ('marks_analytics_view', 'student'): "every student's class for the school-wide figures, cached",
+    ('admin_jobs', 'job'): 'recent jobs, limited; queue counts over the pruned table',
+    ('report_cards', 'report_job'): 'newest runs first, limited',
+    ('finance_dashboard', 'fee_sweep'): 'the latest sweep',
+    ('marks_grid', 'teacher'): 'subjects taught, cached; a few hundred teachers',
+}
+
+# A walk of a whole table, directly or through one of its indexes (every row is read
+# either way); not a SEARCH, nor a scan of a constant row or virtual table
+SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX \w+)?$')
+PLANNED = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+
+Failure = namedtuple('Failure', 'endpoint path sql plan')
+
+
+def sample_values():
+    """Ids and names the requests are formatted with, taken from the database."""
+    student = db.session.execute(select(Student.id, Student.class_name).order_by(Student.id).limit(1)).first()
+    if student is None:
+        raise LookupError('The query plan check needs a database with some students, fees and users.')
+    return {
+        'student_id': student.id,
+        'class_name': student.class_name,
+        'fee_id': db.session.scalar(select(Fee.id).order_by(Fee.id).limit(1)) or 0,
+        'user_id': db.session.scalar(select(User.id).where(User.role == 'Parent').order_by(User.id.desc()).limit(1)),
+        'report_job_id': db.session.scalar(select(ReportJob.id).order_by(ReportJob.id).limit(1)) or 0,
+        'today': date.today().isoformat(),
+        'term': current_term(),
+    }
+
+
+def _format(value, values):
+    if isinstance(value, str):
+        return value.format(**values)
+    if isinstance(value, dict):
+        return {_format(k, values): _format(v, values) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_format(v, values) for v in value]
+    return value
+
+
+@contextmanager
+def _rolled_back(app):
+    # Commits become flushes, so every write a request makes is rolled back when
+    # its session is removed at the end of the request; the forms skip CSRF, and
+    # no job threads start to commit (or be captured) alongside the requests
+    commit, config = RoutingSession.commit, dict(app.config)
+    RoutingSession.commit = RoutingSession.flush
+    app.config.update(WTF_CSRF_ENABLED=False, JOB_IN_PROCESS_WORKERS=0)
+    try:
+        yield
+    finally:
+        RoutingSession.commit = commit
+        app.config.update(WTF_CSRF_ENABLED=config.get('WTF_CSRF_ENABLED', True),
+                          JOB_IN_PROCESS_WORKERS=config['JOB_IN_PROCESS_WORKERS'])
+
+
+@contextmanager
+def _captured(statements):
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(PLANNED):
+            statements.append((statement, parameters[0] if executemany else parameters))
+    engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        yield
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', capture)
+
+
+def explain(statement, parameters=()):
+    """The SQLite query plan details of a statement as the driver received it."""
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+    return [row[-1] for row in rows]
+
+
+def _client(app, role):
+    client = app.test_client()
+    if role:
+        user_id = db.session.scalar(select(User.id).where(User.role == role).order_by(User.id).limit(1))
+        if user_id is None:
+            raise LookupError(f'The query plan check needs a {role} user.')
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+    return client
+
+
+def _send(client, request, path, data):
+    if isinstance(data, dict) and request.endpoint.startswith('api_v1.'):
+        response = client.open(path, method=request.method, json=data)
+    else:
+        response = client.open(path, method=request.method, data=data)
+    response.close()
+    return response.status_code
+
+
+def check_query_plans(app=None):
+    """Run every request in REQUESTS and EXPLAIN each statement it sent.
+
+    Returns ``(failures, uncovered)``: statements planned as a full table scan
+    (less those in ALLOWED_SCANS) or requests that failed with a server error,
+    and endpoints no request exercises. The requests' writes are rolled back.
+    """
+    app = app or current_app._get_current_object()
+    values = sample_values()
+    failures = []
+    # Requests are sent from another thread: in this one they would share the current
+    # app context, and with it one session and the cache generations read by the first
+    with _rolled_back(app), ThreadPoolExecutor(1) as sender:
+        for request in REQUESTS:
+            statements = []
+            path, data = _format(request.path, values), _format(request.data, values)
+            client = _client(app, request.role)
+            with _captured(statements):
+                status = sender.submit(_send, client, request, path, data).result()
+            if status >= 500:
+                failures.append(Failure(request.endpoint, path, None, [f'HTTP {status}']))
+            for statement, parameters in statements:
+                plan = explain(statement, parameters)
+                # Subqueries and CTEs are scanned under their alias; only tables count
+                tables = {m.group(1) for m in map(SCAN.match, plan) if m and m.group(1) in db.metadata.tables}
+                if any((request.endpoint, table) not in ALLOWED_SCANS for table in tables):
+                    failures.append(Failure(request.endpoint, path, statement, plan))
+
+    covered = {request.endpoint for request in REQUESTS}
+    uncovered = sorted({rule.endpoint for rule in app.url_map.iter_rules()} - covered - UNCHECKED_ENDPOINTS)
+    return failures, uncovered
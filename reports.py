@@ -0,0 +1,259 @@
+import multiprocessing
+import os
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, datetime
+from flask import current_app
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from sqlalchemy import case, func, select
+from exports import TERMS, term_range
+from jobs import task
+from models import db, Student, Mark, Attendance, Remark, Teacher, User, ReportJob
+
+try:
+    import weasyprint
+except ImportError:  # Only needed for REPORT_FORMAT = 'pdf'
+    weasyprint = None
+
+
+TEST_TYPES = ('Assignment', 'CAT', 'End Term')
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+
+class ReportError(Exception):
+    pass
+
+
+def current_term(today=None):
+    """The term containing ``today``, as ``'2024-2'``."""
+    today = today or date.today()
+    number = next(n for n, (first, last) in TERMS.items() if first <= today.month <= last)
+    return f'{today.year}-{number}'
+
+
+def _safe_name(name):
+    return re.sub(r'[^\w-]+', '_', name)
+
+
+def archive_name(class_name):
+    return _safe_name(class_name) + '.zip'
+
+
+def report_dir(app):
+    return app.config.get('REPORT_DIR') or os.path.join(app.instance_path, 'reports')
+
+
+def job_directory(root, job):
+    return os.path.join(root, str(job.id))
+
+
+def job_archives(root, job):
+    """File names of the archives written so far for ``job``, sorted."""
+    try:
+        return sorted(name for name in os.listdir(job_directory(root, job)) if name.endswith('.zip'))
+    except OSError:
+        return []
+
+
+# Loading (in the web or CLI process): a handful of grouped queries per class
+
+def load_class(class_name, term):
+    """Everything the report cards of one class need, as plain picklable data."""
+    start, end = term_range(term)
+    start_at, end_at = datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time())
+    in_class = Student.class_name == class_name
+
+    students = [
+        {'id': id_, 'admission_number': number, 'name': name, 'scores': {}, 'remarks': [],
+         'present': 0, 'days': 0}
+        for id_, number, name in db.session.execute(
+            select(Student.id, Student.admission_number, Student.name).where(in_class).order_by(Student.name, Student.id)
+        )
+    ]
+    by_id = {student['id']: student for student in students}
+
+    # The class's students first, then each one's marks through the (term, student_id) index
+    marks = db.session.execute(
+        select(Mark.student_id, Mark.subject, Mark.test_type, func.avg(Mark.score), func.count(Mark.id))
+        .where(Mark.term == term, Mark.student_id.in_(select(Student.id).where(in_class)))
+        .group_by(Mark.student_id, Mark.subject, Mark.test_type)
+    )
+    for student_id, subject, test_type, average, count in marks:
+        by_id[student_id]['scores'][(subject, test_type)] = (average, count)
+
+    attendance = db.session.execute(
+        select(Attendance.student_id, func.count(Attendance.id),
+               func.sum(case((Attendance.status == 'Present', 1), else_=0)))
+        .join(Student, Attendance.student_id == Student.id)
+        .where(in_class, Attendance.date >= start, Attendance.date < end)
+        .group_by(Attendance.student_id)
+    )
+    for student_id, days, present in attendance:
+        by_id[student_id].update(days=days, present=present or 0)
+
+    remarks = db.session.execute(
+        select(Remark.student_id, Remark.text, Remark.created_at, User.username)
+        .join(Student, Remark.student_id == Student.id)
+        .join(Teacher, Remark.teacher_id == Teacher.id)
+        .join(User, Teacher.user_id == User.id)
+        .where(in_class, Remark.created_at >= start_at, Remark.created_at < end_at)
+        .order_by(Remark.created_at)
+    )
+    for student_id, text, created_at, teacher in remarks:
+        by_id[student_id]['remarks'].append({'text': text, 'date': created_at.date(), 'teacher': teacher})
+
+    return {'class_name': class_name, 'students': students}
+
+
+# Rendering (in the pool's worker processes): no database access
+
+_environment = None
+
+
+def _template():
+    global _environment
+    if _environment is None:
+        _environment = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape())
+    return _environment.get_template('report_card.html')
+
+
+def _rank(students):
+    """Competition ranking (1, 2, 2, 4) by overall average; students without marks are unranked."""
+    ordered = sorted((s for s in students if s['average'] is not None), key=lambda s: -s['average'])
+    for i, student in enumerate(ordered):
+        if i and student['average'] == ordered[i - 1]['average']:
+            student['position'] = ordered[i - 1]['position']
+        else:
+            student['position'] = i + 1
+    return len(ordered)
+
+
+def _prepare(student):
+    scores = student.pop('scores')
+    subjects = sorted({subject for subject, _ in scores})
+    student['subjects'] = []
+    total = count = 0
+    for subject in subjects:
+        row = {'subject': subject, 'scores': [], 'average': None}
+        subject_total = subject_count = 0
+        for test_type in TEST_TYPES:
+            average, n = scores.get((subject, test_type), (None, 0))
+            row['scores'].append(average)
+            if n:
+                subject_total += average * n
+                subject_count += n
+        if subject_count:
+            row['average'] = subject_total / subject_count
+        student['subjects'].append(row)
+        total += subject_total
+        count += subject_count
+    student['average'] = total / count if count else None
+    student['attendance_rate'] = student['present'] / student['days'] if student['days'] else None
+    student['position'] = None
+
+
+def render_class(data, term, path, fmt='html'):
+    """Write one report card per student of ``data`` into the zip archive at ``path``.
+
+    Runs in a pool worker; returns the number of cards written.
+    """
+    students = data['students']
+    for student in students:
+        _prepare(student)
+    ranked = _rank(students)
+
+    template = _template()
+    generated = date.today()
+    partial = path + '.part'
+    with zipfile.ZipFile(partial, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for student in students:
+            html = template.render(student=student, class_name=data['class_name'], class_size=ranked,
+                                   term=term, test_types=TEST_TYPES, generated=generated)
+            name = f"{student['admission_number']}-{_safe_name(student['name'])}"
+            if fmt == 'pdf':
+                archive.writestr(f'{name}.pdf', weasyprint.HTML(string=html).write_pdf(), zipfile.ZIP_STORED)
+            else:
+                archive.writestr(f'{name}.html', html)
+    os.replace(partial, path)  # Only complete archives are ever listed for download
+    return len(students)
+
+
+# Jobs
+
+def create_report_job(term, class_name=None):
+    if term_range(term) is None:
+        raise ReportError(f'Unknown term "{term}"; use year-term, e.g. 2024-2.')
+    if class_name and db.session.scalar(select(Student.id).where(Student.class_name == class_name).limit(1)) is None:
+        raise ReportError(f'No students in class "{class_name}".')
+    job = ReportJob(term=term, class_name=class_name or None)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def run_report_job(job, root, workers=None, fmt='html', log=None):
+    """Generate every report card of ``job``, one archive per class, across a process pool.
+
+    Classes are loaded here with a few grouped queries each and rendered in
+    parallel by the pool; the job row is updated as each class finishes.
+    A class is loaded only when a worker is free for it, so at most one
+    class per worker is held in memory instead of the whole school.
+    """
+    if fmt == 'pdf' and weasyprint is None:
+        raise ReportError('PDF report cards need WeasyPrint: pip install weasyprint')
+    directory = job_directory(root, job)
+    os.makedirs(directory, exist_ok=True)
+    try:
+        job.status, job.started_at = 'Running', datetime.utcnow()
+        if job.class_name:
+            classes = [job.class_name]
+        else:
+            classes = db.session.scalars(select(Student.class_name).distinct().order_by(Student.class_name)).all()
+        job.total_classes = len(classes)
+        job.total_students = db.session.scalar(
+            select(func.count(Student.id)).where(Student.class_name.in_(classes))
+        )
+        db.session.commit()
+
+        workers = workers or os.cpu_count()
+        pending = iter(classes)
+        futures = {}
+
+        def submit_next():
+            class_name = next(pending, None)
+            if class_name is not None:
+                path = os.path.join(directory, archive_name(class_name))
+                futures[pool.submit(render_class, load_class(class_name, job.term), job.term, path, fmt)] = class_name
+
+        # spawn, not fork: the caller may be a threaded web worker holding database connections
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            for _ in range(workers):
+                submit_next()
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    class_name = futures.pop(future)
+                    job.students_done += future.result()
+                    job.classes_done += 1
+                    db.session.commit()
+                    if log:
+                        log(f'{class_name}: {job.students_done}/{job.total_students} students ({job.progress:.0%})')
+                    submit_next()
+
+        job.status, job.finished_at = 'Done', datetime.utcnow()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        job.status, job.error, job.finished_at = 'Failed', str(e), datetime.utcnow()
+        db.session.commit()
+        raise
+    return job
+
+
+@task('reports.generate', max_attempts=1, timeout=4 * 3600)
+def generate_report_cards(report_job_id):
+    """Run a report job queued from the admin page, in the jobs worker."""
+    job = db.session.get(ReportJob, report_job_id)
+    run_report_job(job, report_dir(current_app), current_app.config['REPORT_WORKERS'], current_app.config['REPORT_FORMAT'])
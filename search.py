@@ -0,0 +1,105 @@
+from sqlalchemy import and_, column, func, literal_column, or_, select, table, union
+from models import db, Student
+
+SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 50
+MIN_TRIGRAM = 3  # Shorter terms cannot use a trigram index and fall back to a prefix match
+# Each prefix-matched column and the order its index lists matches in
+PREFIX_COLUMNS = ((Student.name,), (Student.admission_number,), (Student.class_name, Student.name))
+
+# Text index objects created by migration rather than by the models; they are
+# hidden from autogenerate so it does not try to drop them
+SEARCH_OBJECTS = ('student_search', 'ix_student_search_trgm', 'ix_student_prefix_')
+
+# SQLite: FTS5 table (trigram tokenizer) kept in sync with student by triggers
+student_search = table('student_search', column('rowid'), column('rank'))
+
+# PostgreSQL: pg_trgm GIN index over this expression
+search_document = Student.name + ' ' + Student.admission_number + ' ' + Student.class_name
+
+
+def include_name(name, type_, parent_names):
+    """Alembic ``include_name`` hook that skips the text index objects."""
+    return not (name and name.startswith(SEARCH_OBJECTS))
+
+
+def _fts_phrase(word):
+    return '"' + word.replace('"', '""') + '"'
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _folded(column, dialect):
+    # The case-insensitive form the ix_student_prefix_* indexes hold
+    return column.collate('NOCASE') if dialect == 'sqlite' else func.lower(column)
+
+
+def _prefix_match(column, term, dialect):
+    if dialect == 'sqlite':
+        # A range on the NOCASE index; ilike would compile to lower(column) LIKE, which no index can serve
+        column = _folded(column, dialect)
+        return and_(column >= term, column < term + '\U0010FFFF')
+    if dialect == 'postgresql':
+        return func.lower(column).like(_escape_like(term.lower()) + '%', escape='\\')  # text_pattern_ops index
+    return column.ilike(_escape_like(term) + '%', escape='\\')
+
+
+def _prefix_query(term, dialect, limit):
+    """Students with a name, admission number or class starting with ``term``.
+
+    One branch per column, each read in its index's order and cut to
+    ``limit``, combined with UNION: an OR across the columns could use none of
+    the indexes. A class prefix lists that class's students by name.
+    """
+    branches = [
+        select(Student.id, Student.name, Student.admission_number, Student.class_name)
+        .where(_prefix_match(columns[0], term, dialect))
+        .order_by(*(_folded(column, dialect) for column in columns), Student.id)
+        .limit(limit)
+        .subquery()
+        for columns in PREFIX_COLUMNS
+    ]
+    matches = union(*(select(*branch.c) for branch in branches)).subquery()
+    return select(*matches.c).order_by(_folded(matches.c.name, dialect), matches.c.id)
+
+
+def _sqlite_query(words):
+    match = ' AND '.join(_fts_phrase(word) for word in words)
+    return (
+        select(Student.id, Student.name, Student.admission_number, Student.class_name)
+        .join(student_search, student_search.c.rowid == Student.id)
+        .where(literal_column('student_search').op('MATCH')(match))
+        .order_by(student_search.c.rank, Student.name)
+    )
+
+
+def _postgresql_query(words, term):
+    return (
+        select(Student.id, Student.name, Student.admission_number, Student.class_name)
+        .where(and_(*(search_document.ilike(f'%{_escape_like(word)}%', escape='\\') for word in words)))
+        .order_by(func.similarity(search_document, term).desc(), Student.name)
+    )
+
+
+def search_students(term, limit=SEARCH_LIMIT):
+    """Top ``limit`` students whose name, admission number or class contains every word of ``term``."""
+    term = (term or '').strip()
+    words = term.split()
+    if not words:
+        return []
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+
+    dialect = db.engine.dialect.name
+    if any(len(word) < MIN_TRIGRAM for word in words) or dialect not in ('sqlite', 'postgresql'):
+        stmt = _prefix_query(term, dialect, limit)
+    elif dialect == 'sqlite':
+        stmt = _sqlite_query(words)
+    else:
+        stmt = _postgresql_query(words, term)
+
+    return [
+        {'id': row.id, 'name': row.name, 'admission_number': row.admission_number, 'class_name': row.class_name}
+        for row in db.session.execute(stmt.limit(limit))
+    ]
@@ -0,0 +1,85 @@
+// Incremental student lookup for forms.
+// Markup (see templates/_student_picker.html):
+//   <div class="student-picker" data-search-url="...">
+//     <input type="search" class="student-picker-input">
+//     <input type="hidden" name="student_id">
+//     <div class="list-group student-picker-results"></div>
+//   </div>
+document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('.student-picker').forEach(function (picker) {
+        const input = picker.querySelector('.student-picker-input');
+        const hidden = picker.querySelector('input[type="hidden"]');
+        const results = picker.querySelector('.student-picker-results');
+        const url = picker.getAttribute('data-search-url');
+        let timer = null;
+        let controller = null;
+
+        function clearResults() {
+            results.innerHTML = '';
+        }
+
+        function choose(student) {
+            hidden.value = student.id;
+            input.value = `${student.name} (${student.admission_number}, ${student.class_name})`;
+            input.setCustomValidity('');
+            clearResults();
+        }
+
+        function render(students) {
+            clearResults();
+            students.forEach(function (student) {
+                const item = document.createElement('button');
+                item.type = 'button';
+                item.className = 'list-group-item list-group-item-action';
+                item.textContent = `${student.name} (${student.admission_number}, ${student.class_name})`;
+                item.addEventListener('click', function () { choose(student); });
+                results.appendChild(item);
+            });
+            if (!students.length) {
+                const empty = document.createElement('div');
+                empty.className = 'list-group-item text-muted';
+                empty.textContent = 'No matching students';
+                results.appendChild(empty);
+            }
+        }
+
+        function search() {
+            const term = input.value.trim();
+            if (!term) {
+                clearResults();
+                return;
+            }
+            if (controller) {
+                controller.abort(); // Only the latest keystroke's results matter
+            }
+            controller = new AbortController();
+            fetch(`${url}?q=${encodeURIComponent(term)}`, { signal: controller.signal, credentials: 'same-origin' })
+                .then(response => response.json())
+                .then(render)
+                .catch(function (error) {
+                    if (error.name !== 'AbortError') {
+                        clearResults();
+                    }
+                });
+        }
+
+        input.addEventListener('input', function () {
+            hidden.value = ''; // Typing invalidates the previous choice
+            input.setCustomValidity('');
+            clearTimeout(timer);
+            timer = setTimeout(search, 150);
+        });
+
+        // A name must be picked from the list, not just typed
+        const form = input.form;
+        if (form) {
+            form.addEventListener('submit', function (e) {
+                if (input.required && !hidden.value) {
+                    e.preventDefault();
+                    input.setCustomValidity('Choose a student from the list.');
+                    input.reportValidity();
+                }
+            });
+        }
+    });
+});